@@ -9,6 +9,9 @@ import time
 import datetime
 from typing import List, Dict, Tuple, Union, Any, TextIO
 import logging
+import csv
+import queue
+import threading
 
 # local packages
 from config import cfg
@@ -35,6 +38,134 @@ def riffle(*args, separator:str='_') -> str:
         s = s[0:-len(separator)]
     return s
 
+def fileTime(timeFormat:str) -> str:
+    '''Get the current time for a file name. If the format ends in microseconds, cut it to tenths of a second'''
+    dt = datetime.datetime.now().strftime(timeFormat)
+    if timeFormat[-1]=='f':
+        dt = dt[:-5]
+    return dt
+
+def dupNumber(dupFormat:str, num:int) -> str:
+    '''Get the number to add to a duplicate file name'''
+    if len(dupFormat)==0:
+        # if the duplicate format is empty, use this default
+        dupFormat = "{0:0=3d}"
+    return dupFormat.format(num)
+
+def subFolder(folder:str, sep:str, sample:str, date:str, dateMode:int, sbBase:str, sbMode:int, create:bool=True) -> str:
+    '''Get the subfolder inside folder for a new file. The sample name goes in the subfolder name. dateMode and sbMode are 0 to put the date or shopbot file name in the subfolder name, 1 to make a subsubfolder for it, or anything else to leave it out. create=False to not make the folders'''
+    subfolder = sample
+    subsubfolder = ''
+    if dateMode==0:
+        subfolder = riffle(subfolder, date, separator=sep)
+    elif dateMode==1:
+        subsubfolder = riffle(subsubfolder, date, separator=sep)
+    if sbMode==0:
+        subfolder = riffle(subfolder, sbBase, separator=sep)
+    elif sbMode==1:
+        subsubfolder = riffle(subsubfolder, sbBase, separator=sep)
+    for f in [subfolder, subsubfolder]:
+        if len(f)>0:
+            # make the folder if it doesn't already exist. if subfolder is empty, subsubfolder becomes the subfolder
+            folder = os.path.join(folder, f)
+            if create:
+                os.makedirs(folder, exist_ok=True)
+    return folder
+
+def uniqueFile(folder:str, baseBare:str, ext:str, sep:str, dupFormat:str) -> str:
+    '''Get a full file name in folder. If there is already a file with this name, add a number (e.g. _002) to the end'''
+    if not ext[0]=='.':
+        ext = '.'+ext
+    fullfn = os.path.join(folder, baseBare + ext)
+    filenum = 1
+    while os.path.exists(fullfn):
+        num = dupNumber(dupFormat, filenum)
+        fullfn = os.path.join(folder, riffle(baseBare, num, separator=sep) + ext)
+        filenum+=1
+    return fullfn
+
+def saveMetaTable(fn:str, boxes:list) -> None:
+    '''Save a csv of metadata, with a row for the app id and then the rows from every box that has a writeToTable function'''
+    with open(fn, mode='w', newline='', encoding='utf-8') as c:
+        writer = csv.writer(c, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(['appid', '', cfg.appid])
+        for box in boxes:
+            if hasattr(box, 'writeToTable'):
+                box.writeToTable(writer)
+
+
+class timeTableWriter(threading.Thread):
+    '''writes the rows of the time table to a csv file in the background while the print runs. The file is opened and the header is written when the writer is created, so errors opening the file go to the caller. Rows wait in a queue of at most maxRows rows, so memory stays flat no matter how long the print is. If the queue is full, the row is dropped and counted instead of blocking the GUI. The file is flushed and synced to disk every flushPeriod s, so a crash loses at most flushPeriod s of rows'''
+
+    def __init__(self, fn:str, header:List[str], maxRows:int=10000, flushPeriod:float=1):
+        super(timeTableWriter, self).__init__(daemon=True)
+        self.fn = fn
+        self.header = header
+        self.rows = queue.Queue(maxsize=maxRows)
+        self.flushPeriod = flushPeriod
+        self.written = 0    # number of rows written
+        self.dropped = 0    # number of rows dropped because the queue was full
+        # open the file here, so the caller hears about it if the file can't be written
+        self.f = open(self.fn, mode='w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.f, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        self.writer.writerow(self.header)
+        self.sync(self.f)
+
+    def put(self, row:List) -> bool:
+        '''add a row to the queue. return False if the row was dropped'''
+        try:
+            self.rows.put_nowait(row)
+        except queue.Full:
+            self.dropped+=1
+            return False
+        return True
+
+    def sync(self, f:TextIO) -> None:
+        '''push the rows written so far to the disk'''
+        f.flush()
+        os.fsync(f.fileno())
+
+    def run(self) -> None:
+        '''write rows as they arrive until we get None'''
+        with self.f as f:
+            writer = self.writer
+            lastSync = time.monotonic()
+            while True:
+                try:
+                    row = self.rows.get(timeout=self.flushPeriod)
+                except queue.Empty:
+                    row = []
+                if row is None:
+                    break
+                if len(row)>0:
+                    writer.writerow(row)
+                    self.written+=1
+                if time.monotonic()-lastSync>=self.flushPeriod:
+                    self.sync(f)
+                    lastSync = time.monotonic()
+            self.sync(f)
+
+    def close(self) -> None:
+        '''write the remaining rows and close the file'''
+        if self.is_alive():
+            self.rows.put(None)
+            self.join()
+        elif not self.f.closed:
+            # the thread never started
+            self.f.close()
+        if self.dropped>0:
+            logging.warning(f'Time table: {self.dropped} rows dropped because the disk could not keep up')
+
+
+def recoverTimeTable(fn:str) -> int:
+    '''clean up a time table that was being written when the program stopped, by cutting off a partly written last row. return the number of rows in the table'''
+    with open(fn, mode='rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n')+1
+        if end<len(data):
+            f.truncate(end)
+    return max(0, data[:end].count(b'\n')-1)
+
 
 #----------------------------------------------------
 
@@ -217,11 +348,7 @@ class fileSettingsBox(QWidget):
         '''Get the current time. This should only be used for files.'''
         if self.iTimeCheck.isChecked():
 #             return time.strftime(self.timeFormat())
-            tf = self.timeFormat()
-            dt = datetime.datetime.now().strftime(tf)
-            if tf[-1]=='f':
-                dt = dt[:-5]
-            return dt
+            return fileTime(self.timeFormat())
         else:
             return ''
     
@@ -230,11 +357,7 @@ class fileSettingsBox(QWidget):
         return self.duplicateFormatBox.text()
     
     def dupNum(self, num:float) -> str:
-        dup = self.dupFormat()
-        if len(dup)==0:
-            # if the duplicate format is empty, use this default
-            dup = "{0:0=3d}"
-        return dup.format(num)
+        return dupNumber(self.dupFormat(), num)
     
     def sep(self) -> str:
         return self.separatorBox.text()
@@ -444,47 +567,12 @@ class fileBox(connectBox):
             self.updateStatus('Invalid folder name. File not saved.', True)
             raise NameError('Invalid folder name. File not saved.')
 
-        sep = self.settingsBox.sep()
-        
         if self.settingsBox.newFolderCheck.isChecked():
             # use subfolder
-            subfolder = self.sample(False)
-            subsubfolder = ''
-            
-            # add date?
-            bid = self.settingsBox.iDateGroup.checkedId()
-            if bid==0 or bid==1:
-                # use date
-                date = self.settingsBox.date()
-                if bid==0:
-                    # include date in folder name
-                    subfolder = riffle(subfolder, date, separator=sep)
-                elif bid==1:
-                    # make date subfolder
-                    subsubfolder = riffle(subsubfolder, date, separator=sep)
-                    
-            # add SB?
-            sb = self.settingsBox.iSBGroup.checkedId()
-            if (sb==0 or sb==1) and (self.sbWin.sbBox.runningSBP or demoMode):
-                # add SB is selected in settings, and we're running a SB file
-                if sb==0:
-                    subfolder = riffle(subfolder, self.sbBase(False, demoMode=demoMode), separator=sep)
-                elif sb==1:
-                    subsubfolder = riffle(subsubfolder, self.sbBase(False, demoMode=demoMode), separator=sep)
-
-            if len(subfolder)>0:
-                # make the subfolder if it doesn't already exist
-                subfolder = os.path.join(folder, subfolder)
-                if not os.path.exists(subfolder) and not demoMode:
-                    os.makedirs(subfolder, exist_ok=True)
-                folder = subfolder
-            if len(subsubfolder)>0:
-                # make the subsubfolder if it doesn't already exist
-                # if subfolder is empty, subsubfolder becomes the subfolder
-                subsubfolder = os.path.join(folder, subsubfolder)
-                if not os.path.exists(subsubfolder) and not demoMode:
-                    os.makedirs(subsubfolder, exist_ok=True)
-                folder = subsubfolder # return the subsubfolder 
+            folder = subFolder(folder, self.settingsBox.sep(), self.sample(False)
+                               , self.settingsBox.date(), self.settingsBox.iDateGroup.checkedId()
+                               , self.sbBase(False, demoMode=demoMode), self.settingsBox.iSBGroup.checkedId()
+                               , create=not demoMode)
         
         return folder
             
@@ -501,17 +589,5 @@ class fileBox(connectBox):
         time = self.settingsBox.time()
         sep = self.settingsBox.sep()
         baseBare = riffle(sbBase, deviceName, sample, time, separator=sep) # file name, no path, no extension
-        
-        if not ext[0]=='.':
-            ext = '.'+ext
-        fullfn = os.path.join(folder, baseBare + ext)
-        
-        filenum = 1
-        # if there is already a file with this name, add a number (e.g. _002) to the end
-        while os.path.exists(fullfn):
-            num = self.settingsBox.dupNum(filenum)
-            fullfn = os.path.join(folder, riffle(baseBare, num, separator=sep) + ext)
-            filenum+=1   
-        
-        return fullfn
+        return uniqueFile(folder, baseBare, ext, sep, self.settingsBox.dupFormat())
 
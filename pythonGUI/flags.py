@@ -2,25 +2,28 @@
 '''Shopbot GUI Shopbot functions for shopbot flag and registry key handling'''
 
 # external packages
-from PyQt5.QtCore import QMutex, Qt
+from PyQt5.QtCore import QMutex, Qt, QTimer
 from PyQt5.QtWidgets import QGridLayout, QLabel, QMainWindow
 import os, sys
-import winreg
 import subprocess
 from typing import List, Dict, Tuple, Union, Any, TextIO
 import logging
 import csv
 import re
 import time
-import win32gui, win32api, win32con
-import pyfirmata
-from pyfirmata import util, Arduino
+try:
+    import pyfirmata
+    from pyfirmata import util, Arduino
+except ModuleNotFoundError:
+    pyfirmata = None   # no arduino support
 
 
 # local packages
 from config import cfg
 from general import *
 from sbprint import *
+from sbKeyBackend import *
+from sbprintTiming import *
 
 ##################################################  
 
@@ -43,6 +46,42 @@ class flagGrid(QGridLayout):
             
         self.successLayout(tall=tall)
         self.labelFlags()
+        self.startRefresh()
+        
+    def startRefresh(self) -> None:
+        '''start the timer that puts new values into the display. values that arrive faster than the display rate are coalesced, so only the latest one is drawn'''
+        self.pending = {}    # latest values that have not been drawn yet
+        self.drawn = 0       # number of values drawn
+        self.coalesced = 0   # number of values replaced by newer values before they were drawn
+        rate = cfg.shopbot.displayRate.value
+        if rate<=0:
+            # draw every value when it arrives
+            self.refreshTimer = None
+            return
+        self.refreshTimer = QTimer()
+        self.refreshTimer.timeout.connect(self.refresh)
+        self.refreshTimer.start(max(1, int(1000/rate)))
+        
+    def queueValue(self, name:str, value:Any) -> None:
+        '''store a value to draw at the next refresh'''
+        if name in self.pending:
+            self.coalesced+=1
+        self.pending[name] = value
+        if self.refreshTimer is None:
+            self.refresh()
+        
+    def refresh(self) -> None:
+        '''draw the values that came in since the last refresh'''
+        if len(self.pending)==0:
+            return
+        pending = self.pending
+        self.pending = {}
+        for name,value in pending.items():
+            if name=='flag':
+                self.drawFlags(value)
+            else:
+                self.drawXYZ(name, *value)
+            self.drawn+=1
         
     def resetFlagLabels(self) -> None:
         '''create a new dictionary to hold flags and labels'''
@@ -110,32 +149,26 @@ class flagGrid(QGridLayout):
             
         
         
-    def updateXYZ(self, x, y, z) -> None:
-        '''update the xyz display'''
-        if not hasattr(self, 'x') or not hasattr(self, 'y') or not hasattr(self, 'z'):
+    def drawXYZ(self, s:str, x:float, y:float, z:float) -> None:
+        '''draw the xyz labels. s is '' for the read position, 'e' for the estimate, and 't' for the target'''
+        if not hasattr(self, f'x{s}') or not hasattr(self, f'y{s}') or not hasattr(self, f'z{s}'):
             # missing attribute, can't set xyz labels
             return
-        self.x.setText(f'{x:0.3f}')
-        self.y.setText(f'{y:0.3f}')
-        self.z.setText(f'{z:0.3f}')
+        getattr(self, f'x{s}').setText(f'{x:0.3f}')
+        getattr(self, f'y{s}').setText(f'{y:0.3f}')
+        getattr(self, f'z{s}').setText(f'{z:0.3f}')
+    
+    def updateXYZ(self, x, y, z) -> None:
+        '''update the xyz display'''
+        self.queueValue('', (x,y,z))
         
     def updateXYZest(self, x,y,z) -> None:
         '''update the estimated xyz display'''
-        if not hasattr(self, 'xe') or not hasattr(self, 'ye') or not hasattr(self, 'ze'):
-            # missing attribute, can't set xyz labels
-            return
-        self.xe.setText(f'{x:0.3f}')
-        self.ye.setText(f'{y:0.3f}')
-        self.ze.setText(f'{z:0.3f}')
+        self.queueValue('e', (x,y,z))
         
     def updateXYZt(self, x,y,z) -> None:
         '''update the target xyz display'''
-        if not hasattr(self, 'xt') or not hasattr(self, 'yt') or not hasattr(self, 'zt'):
-            # missing attribute, can't set xyz labels
-            return
-        self.xt.setText(f'{x:0.3f}')
-        self.yt.setText(f'{y:0.3f}')
-        self.zt.setText(f'{z:0.3f}')
+        self.queueValue('t', (x,y,z))
  
     def flagTaken(self, flag0:int) -> bool:
         '''check the dictionary to see if the flag is taken'''
@@ -184,6 +217,10 @@ class flagGrid(QGridLayout):
         
     def update(self, sbFlag:int) -> None:
         '''update the highlight status based on sbFlag'''
+        self.queueValue('flag', sbFlag)
+        
+    def drawFlags(self, sbFlag:int) -> None:
+        '''highlight the flags that are on in sbFlag'''
         for flag0 in range(self.numFlags):
             if flagOn(sbFlag, flag0):
                 self.highlightFlag(flag0)
@@ -247,6 +284,40 @@ class arduinoSignals(QObject):
     status = pyqtSignal(str, bool) # send status message back to GUI
 
 
+class edgeBuffer:
+    '''ring buffer of arduino pin edges, as (time, 1-indexed flag, on). The board's reader thread is the only writer and the print loop is the only reader. The writer fills the slot before it moves the head, so the reader never needs a lock. If the reader falls more than size edges behind, the oldest edges are dropped and counted'''
+    
+    def __init__(self, size:int=1024):
+        self.size = size
+        self.times = [0.0]*size
+        self.flags = [0]*size
+        self.states = [False]*size
+        self.head = 0      # number of edges written
+        self.tail = 0      # number of edges read
+        self.dropped = 0   # number of edges overwritten before they were read
+        
+    def write(self, t:float, flag1:int, on:bool) -> None:
+        '''add an edge'''
+        i = self.head % self.size
+        self.times[i] = t
+        self.flags[i] = flag1
+        self.states[i] = on
+        self.head+=1
+        
+    def read(self) -> List[Tuple[float, int, bool]]:
+        '''get all of the edges since the last read, oldest first'''
+        head = self.head
+        if head-self.tail>self.size:
+            self.dropped+=head-self.tail-self.size
+            self.tail = head-self.size
+        out = []
+        for j in range(self.tail, head):
+            i = j % self.size
+            out.append((self.times[i], self.flags[i], self.states[i]))
+        self.tail = head
+        return out
+    
+
 class arduino(QMutex):
     '''class that connects to the arduino'''
     
@@ -257,6 +328,9 @@ class arduino(QMutex):
         self.uvAsked = False  # this indicates whether we have asked for the UV to turn on. if we asked for it and door is open, uvAsked is True but ovOn is false
         self.uvpins = {}
         self.pins = {}
+        self.pinStates = 0   # states of the flag pins in the last read, as a flag word
+        self.edges = edgeBuffer()   # flag pin edges, timestamped when the board reports them
+        self.edgePinStates = {}     # last reported state of each flag pin
         self.connected = False
         self.SBConnected = False
         self.uvConnected = False
@@ -270,6 +344,9 @@ class arduino(QMutex):
         
     def connect(self) -> None:
         '''connect to the arduino'''
+        if pyfirmata is None:
+            print('Failed to connect to Arduino: pyfirmata is not installed')
+            return
         try:
             self.board = Arduino(cfg.arduino.port)
             it = util.Iterator(self.board)
@@ -280,6 +357,7 @@ class arduino(QMutex):
         self.connected = True
         self.connectSB()
         self.connectUV()   
+        self.captureEdges()
         
     def connectSB(self) -> None:
         '''connect the SB output flags'''
@@ -291,6 +369,39 @@ class arduino(QMutex):
         time.sleep(0.1)
         self.finishConnectingSB()  # wait 0.1 seconds before checking values
         
+    def release(self) -> None:
+        '''close the connection to the board, so another process can open it'''
+        if not self.connected:
+            return
+        try:
+            self.board.exit()
+        except Exception as e:
+            logging.warning(f'Error closing arduino: {e}')
+        self.connected = False
+        
+    def captureEdges(self) -> None:
+        '''have the board's reader thread timestamp every change of the flag pins as soon as the board reports it'''
+        self.board.add_cmd_handler(pyfirmata.DIGITAL_MESSAGE, self.digitalMessage)
+        
+    def digitalMessage(self, portNr:int, lsb:int, msb:int) -> None:
+        '''handle a digital message from the board. this runs in the board's reader thread'''
+        t = time.perf_counter()
+        self.board._handle_digital_message(portNr, lsb, msb)   # update the pin values, like pyfirmata normally does
+        mask = (msb << 7) + lsb
+        for f1,p in list(self.pins.items()):
+            if not p//8==portNr:
+                continue
+            on = bool((mask >> (p%8)) & 1)
+            if f1 in self.edgePinStates and not self.edgePinStates[f1]==on:
+                self.edges.write(t, f1, on)
+            self.edgePinStates[f1] = on
+            
+    def readEdges(self) -> List[Tuple[float, int, bool]]:
+        '''get the flag pin edges since the last call, as (time, 1-indexed flag, on)'''
+        if not self.connected:
+            return []
+        return self.edges.read()
+        
     def startCheck(self) -> None:
         '''set all the pins except the UV pins to input mode to check what flags they are connected to.'''
         for p in range(2, 14):
@@ -360,9 +471,12 @@ class arduino(QMutex):
     def readSB(self, sbFlag:int) -> int:
         '''read the flags from the arduino and update the sbFlag'''
         if not self.connected:
-            return
+            return sbFlag
+        pinStates = 0
         for f1,p in self.pins.items():
             status = self.board.digital[p].read()   # read the pin, returns a bool
+            if status:
+                pinStates = pinStates + 2**(f1-1)
             on = flagOn(sbFlag, f1-1)
             if status and not on:
                 # sb3 thinks the flag is off, but hardware says it's on
@@ -372,6 +486,7 @@ class arduino(QMutex):
                 # sb3 thinks the flag is on, but hardware says it's off
                 sbFlag = sbFlag - 2**(f1-1)
                 # logging.info(f'SB3 {p} {on} and Arduino {f1} {status}: disagree')
+        self.pinStates = pinStates
         return sbFlag
     
     def doorsClosed(self) -> bool:
@@ -445,9 +560,10 @@ class SBKeySignals(QObject):
     
 
 class SBKeys(QMutex):
-    '''class that holds information and functions about connecting to the shopbot'''
+    '''class that holds information and functions about connecting to the shopbot. backend reads the keys. by default, it reads the windows registry'''
     
-    def __init__(self, diag:int, ard:arduino):
+    def __init__(self, diag:int, ard:arduino, backend:keyBackend=None):
+        '''backend can be a registryBackend, memoryBackend, or sb3Simulator. the clock and sleep functions come from the backend, so a simulated machine can run faster than real time'''
         super(SBKeys,self).__init__()
         self.connected = False
         self.ready = False
@@ -455,14 +571,22 @@ class SBKeys(QMutex):
         self.sb3File = ''
         self.prevFlag = 0
         self.currentFlag = 0
+        self.rawFlag = 0
         self.lastRead = 0
         self.msg = ''
         self.runningSBP = False
         self.diag = diag
         self.signals = SBKeySignals()
-        self.connectKeys()   # connect to the keys and open SB3.exe
+        self.backend = backend
+        self.folderHandles = {}   # handle for each folder of keys
+        self.valueHandles = {}    # handle of the folder that holds each value, so we don't have to search for it on every read
         self.ctr = 0
         self.arduino = ard
+        self.gate = changeGate()   # only send values to the GUI when they change
+        self.timer = stageTimer()  # times reading the keys and the arduino. the print loop turns it on
+        self.clock = time.perf_counter
+        self.sleep = time.sleep
+        self.connectKeys()   # connect to the keys and open SB3.exe
   
     def updateStatus(self, message:str, log:bool) -> None:
         '''send the status back to the SBbox'''
@@ -471,69 +595,58 @@ class SBKeys(QMutex):
     #------------------------------
         
         
-    def connectKey(self, aReg, path:str, name:str):
-        '''connect a single key'''
-        key = os.path.join(r'Software\VB and VBA Program Settings\Shopbot', path)
+    def connectKey(self, folder:str) -> None:
+        '''connect a single folder of keys'''
         try:
-            k = winreg.OpenKey(aReg, key)
-            setattr(self, f'{name}Key', k)
+            self.folderHandles[folder] = self.backend.open(folder)
         except FileNotFoundError:
-            self.updateStatus(f'Failed to connect to shopbot: Key not found: {key}', True)
+            self.updateStatus(f'Failed to connect to shopbot: Key not found: {keyPaths[folder]}', True)
             return
         except Exception as e:
             print(e)
+            return
+        for value in keyFolders[folder]:
+            self.valueHandles[value] = self.folderHandles[folder]
         
         
     def connectKeys(self) -> None:
         '''connects to the windows registry keys for the Shopbot flags'''
 
         # find registry
-        try:
-            aReg = winreg.ConnectRegistry(None, winreg.HKEY_CURRENT_USER)
-        except AttributeError:
-            self.updateStatus('Failed to connect to shopbot: Key not found: HKEY_CURRENT_USER', True)
-            return
+        if self.backend is None:
+            try:
+                self.backend = registryBackend()
+            except (ModuleNotFoundError, AttributeError, OSError):
+                self.updateStatus('Failed to connect to shopbot: Key not found: HKEY_CURRENT_USER', True)
+                return
+            
+        self.clock = self.backend.clock
+        self.sleep = self.backend.sleep
             
         # find key
-        self.connectKey(aReg, 'UserData', 'UserData')
-        self.connectKey(aReg, r'Sb3\Settings', 'Settings')
-        self.connectKey(aReg, r'Sb3\DebugStatus', 'DebugStatus')
+        for folder in keyFolders:
+            self.connectKey(folder)
             
         # found key
         self.connected = True
 
         self.findSb3()                     # find the SB3 file
-        subprocess.Popen([self.sb3File])   # open the SB3 program
+        self.backend.launch(self.sb3File)  # open the SB3 program
+        
+    def sendFile(self, file:str) -> None:
+        '''tell the SB3 program to run the sbp file'''
+        if self.backend is None:
+            return
+        self.backend.runFile(self.sb3File, file)
         
     def keyFolderDict(self) -> dict:
-        return {'UserData':
-                    ['AnInp1', 'AnInp2', 'InputSwitches'
-                     , 'Loc_1', 'Loc_2', 'Loc_3'
-                     , 'OutPutSwitches', 'SpindleStatus','Status'
-                     , 'uAppPath'
-                     , 'uCommand', 'uCommandQ1', 'uMsgBoxCaption'
-                     , 'uMsgBoxMessage', 'uPartFileName', 'uResponse'
-                     , 'uSpindleStatus', 'uUsrPath', 'uValueClrd']
-            , 'Settings':
-                    ['Cheight', 'Cheight_prev', 'Cleft', 'Cleft_prev'
-                     , 'Ctop', 'Ctop_prev', 'Cwidth', 'Cwidth_prev'
-                     , 'DoneEASY', 'DoneWelcome', 'LAstConnected'
-                     , 'LAstRead', 'LastSoftwareLoaded', 'RegInteractionActive']
-            , 'Debug':
-                    ['Status01', 'Status02', 'Status03']}
+        return keyFolders
         
     def getKeyFolder(self, value:str):
         '''get the key folder, as a QueryValueEx, that holds the requested key'''
-        d0 = self.keyFolderDict()
-        for key,val in d0.items():
-            if value in val:
-                ks = f'{key}Key'
-                if not hasattr(self, ks):
-                    raise ValueError(f'Unexpected key requested: {ks}')
-                else:
-                    k = getattr(self, ks)
-                    return k
-        raise ValueError(f'Unexpected key requested: {value}')
+        if not value in self.valueHandles:
+            raise ValueError(f'Unexpected key requested: {value}')
+        return self.valueHandles[value]
         
     def queryValue(self, value) -> Any:
         '''try to get a value from a key located at self.UserDataKey'''
@@ -541,7 +654,7 @@ class SBKeys(QMutex):
             raise ValueError
         k = self.getKeyFolder(value)
         try:
-            val = winreg.QueryValueEx(k, value)
+            val = self.backend.query(k, value)
         except FileNotFoundError:  
             # if we fail to get the registry key, we have no way of knowing 
             # if the print is over, so just stop it now
@@ -613,12 +726,20 @@ class SBKeys(QMutex):
             sbFlag, _ = self.queryValue('OutPutSwitches')
         except ValueError:
             return -1
+        sbFlag = self.updateFlag(sbFlag)
+        self.emitFlag(sbFlag)    # send flag back to gui
+        return sbFlag
+    
+    def updateFlag(self, sbFlag:str) -> int:
+        '''cross reference the flag read from the keys with the arduino and store it'''
+        self.rawFlag = int(sbFlag)
+        t0 = self.timer.start()
         sbFlag = self.arduino.readSB(int(sbFlag))  # cross reference this result with arduino
+        self.timer.stop('arduino', t0)
         
         self.prevFlag = self.currentFlag
         sbFlag = int(sbFlag)
         self.currentFlag = sbFlag
-        self.signals.flag.emit(sbFlag)    # send flag back to gui
         return sbFlag
 
     
@@ -635,22 +756,20 @@ class SBKeys(QMutex):
         return clist
 
     
-    def getLoc(self) -> Tuple[int,int,int]:
-        '''get the x,y,z location of the shopbot'''
+    def getLoc(self) -> xyzPoint:
+        '''get the x,y,z location of the shopbot. the coordinates are NaN if the location could not be read'''
         
         xlist = []
         for command in ['Loc_1', 'Loc_2', 'Loc_3']:
             try:
                 c, _ = self.queryValue(command)
             except ValueError:
-                return []
+                return xyzPoint()
             xlist.append(c)
             
-        xlist = [float(i) for i in xlist]
-    
-        self.signals.pos.emit(xlist[0], xlist[1], xlist[2])   # send position back to GUI
-            
-        return xlist
+        p = xyzPoint(*xlist)
+        self.emitPos(p)   # send position back to GUI
+        return p
     
     def getLastRead(self) -> int:
         '''get the line number of the last line read into the file'''
@@ -659,9 +778,65 @@ class SBKeys(QMutex):
         except ValueError:
             return -1
         self.lastRead = int(c)
-        self.signals.lastRead.emit(self.lastRead)
+        self.emitLastRead(self.lastRead)
         return self.lastRead
     
+    def snapshot(self) -> keySnapshot:
+        '''read all of the keys that change during a print in one locked pass, and send them back to the GUI. Do not lock the keys before calling this'''
+        self.lock()
+        try:
+            t0 = self.timer.start()
+            t = self.clock()
+            self.backend.begin(t)     # every key in this pass describes the same moment
+            try:
+                d = self.getListOfKeys(changingKeys)
+            finally:
+                self.backend.end()
+            self.timer.stop('keys', t0)
+            if 'OutPutSwitches' in d:
+                sbFlag = self.updateFlag(d['OutPutSwitches'])
+                rawFlag = self.rawFlag
+            else:
+                sbFlag = -1
+                rawFlag = -1
+            if 'Loc_1' in d and 'Loc_2' in d and 'Loc_3' in d:
+                loc = xyzPoint(d['Loc_1'], d['Loc_2'], d['Loc_3'])
+            else:
+                loc = xyzPoint()
+            if 'LAstRead' in d:
+                self.lastRead = int(d['LAstRead'])
+                lastRead = self.lastRead
+            else:
+                lastRead = -1
+            status = int(d.get('Status', 6))
+            snap = keySnapshot(t, loc, sbFlag, status, lastRead, self.runningSBP, self.diag, rawFlag, getattr(self.arduino, 'pinStates', 0))
+        finally:
+            self.unlock()
+        
+        # send values back to the GUI
+        if sbFlag>=0:
+            self.emitFlag(sbFlag)
+        if loc.defined:
+            self.emitPos(loc)
+        if lastRead>=0:
+            self.emitLastRead(lastRead)
+        return snap
+    
+    def emitFlag(self, sbFlag:int) -> None:
+        '''send the flag to the GUI if it changed'''
+        if self.gate.changed('flag', sbFlag):
+            self.signals.flag.emit(sbFlag)
+            
+    def emitPos(self, p:xyzPoint) -> None:
+        '''send the position to the GUI if it changed'''
+        if self.gate.changed('pos', (p.x, p.y, p.z)):
+            self.signals.pos.emit(p.x, p.y, p.z)
+            
+    def emitLastRead(self, line:int) -> None:
+        '''send the last line read to the GUI if it changed'''
+        if self.gate.changed('lastRead', line):
+            self.signals.lastRead.emit(line)
+    
     def getListOfKeys(self, l:List[str]) -> dict:
         '''probe the given list of keys and return a dictionary'''
         d = {}
@@ -685,8 +860,7 @@ class SBKeys(QMutex):
     def printChangingKeys(self) -> None:
         '''print the registry keys that change during a print'''
         self.ctr+=1
-        l = ['Loc_1', 'Loc_2', 'Loc_3', 'Status', 'OutPutSwitches', 'LAstRead'] 
-        d = self.getListOfKeys(l)
+        d = self.getListOfKeys(changingKeys)
         if self.ctr%100==0:
             print('\t'.join(list(d.keys())))
         print('\t'.join(list(d.values())))
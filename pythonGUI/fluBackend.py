@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+'''Shopbot GUI backends for talking to the fluigent pressure controller, either through the Fluigent SDK or a simulated controller'''
+
+# external packages
+import os, sys
+import time
+import threading
+from typing import List, Dict, Tuple, Union, Any, TextIO
+import logging
+import numpy as np
+
+# local packages
+try:
+    import Fluigent.SDK as fgt
+except (ModuleNotFoundError, OSError):
+    fgt = None   # the SDK library is not available on this computer. no fluigent support
+from config import cfg
+
+#----------------------------------------------------------------------
+
+class fluBackend:
+    '''interface for the fluigent calls. pressures are in mbar, channels are 0-indexed, and timestamps are the controller's 16 bit timer in ms, like the Fluigent SDK'''
+
+    def init(self) -> None:
+        '''connect to the controller'''
+        raise NotImplementedError
+
+    def pressureChannelCount(self) -> int:
+        '''get the number of pressure channels'''
+        raise NotImplementedError
+
+    def getPressure(self, channel:int, include_timestamp:bool=False) -> Union[float, Tuple[float, int]]:
+        '''read the pressure. if include_timestamp, also return the controller timer in ms'''
+        raise NotImplementedError
+
+    def setPressure(self, channel:int, p_mbar:float) -> None:
+        '''set the pressure'''
+        raise NotImplementedError
+
+    def close(self) -> None:
+        '''disconnect from the controller'''
+        return
+
+
+class sdkBackend(fluBackend):
+    '''sends the calls to a real controller through the Fluigent SDK'''
+
+    def init(self) -> None:
+        if fgt is None:
+            raise ModuleNotFoundError('Fluigent SDK is not available')
+        fgt.fgt_init()
+
+    def pressureChannelCount(self) -> int:
+        return fgt.fgt_get_pressureChannelCount()
+
+    def getPressure(self, channel:int, include_timestamp:bool=False) -> Union[float, Tuple[float, int]]:
+        return fgt.fgt_get_pressure(channel, include_timestamp=include_timestamp)
+
+    def setPressure(self, channel:int, p_mbar:float) -> None:
+        fgt.fgt_set_pressure(channel, p_mbar)
+
+    def close(self) -> None:
+        fgt.fgt_close()
+
+
+class fluSimulator(fluBackend):
+    '''simulates a pressure controller. Each channel moves toward its setpoint with a first-order response. The controller measures every sampleDt ms, and reads between measurements give back the last measurement. Each call waits latency ms, like a call through the SDK
+    channels is the number of pressure channels, responseTime is the time constant of the response in s, noise is the standard deviation of the measurement noise in mbar'''
+
+    def __init__(self, channels:int=2, responseTime:float=0.1, noise:float=1, latency:float=1, sampleDt:float=10, seed:int=0):
+        self.channels = channels
+        self.responseTime = responseTime
+        self.noise = noise
+        self.latency = latency
+        self.sampleDt = sampleDt
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.t0 = time.perf_counter()
+        self.setpoints = [0]*channels       # setpoint in mbar
+        self.starts = [(0, 0)]*channels     # time in s and pressure in mbar when the setpoint last changed
+        self.samples = [(-1, 0)]*channels   # index and value of the last measurement
+        self.connected = False
+
+    def wait(self) -> None:
+        '''wait for the simulated SDK call'''
+        if self.latency>0:
+            time.sleep(self.latency/1000)
+
+    def clock(self) -> float:
+        '''get the time in s since the controller started'''
+        return time.perf_counter()-self.t0
+
+    def pressure(self, channel:int, t:float) -> float:
+        '''get the true pressure at time t'''
+        t1, p1 = self.starts[channel]
+        target = self.setpoints[channel]
+        if self.responseTime<=0:
+            return target
+        return target+(p1-target)*np.exp(-(t-t1)/self.responseTime)
+
+    def init(self) -> None:
+        self.wait()
+        self.connected = True
+        logging.info(f'Simulating a fluigent with {self.channels} channels')
+
+    def pressureChannelCount(self) -> int:
+        return self.channels
+
+    def getPressure(self, channel:int, include_timestamp:bool=False) -> Union[float, Tuple[float, int]]:
+        self.wait()
+        with self.lock:
+            i = int(self.clock()*1000/self.sampleDt)   # index of the newest measurement
+            if not i==self.samples[channel][0]:
+                # new measurement
+                p = self.pressure(channel, i*self.sampleDt/1000)+self.rng.normal(0, self.noise)
+                self.samples[channel] = (i, max(0, p))
+            p = self.samples[channel][1]
+        if include_timestamp:
+            return p, int(i*self.sampleDt)%65536
+        return p
+
+    def setPressure(self, channel:int, p_mbar:float) -> None:
+        self.wait()
+        with self.lock:
+            t = self.clock()
+            self.starts[channel] = (t, self.pressure(channel, t))
+            self.setpoints[channel] = p_mbar
+
+    def close(self) -> None:
+        self.wait()
+        self.connected = False
+
+
+simDefaults = {'on':False, 'channels':2, 'responseTime':0.1, 'noise':1, 'latency':1, 'sampleDt':10}   # settings for the simulated controller, if they are not in the config file
+
+def simulatorSettings() -> dict:
+    '''get the settings for the simulated controller from the config file'''
+    if 'simulate' in cfg.fluigent:
+        return {**simDefaults, **dict(cfg.fluigent.simulate)}
+    return dict(simDefaults)
+
+def fluigentBackend() -> Union[fluBackend, None]:
+    '''get the simulated controller if simulate is on in the config file, the SDK if it is available, or None'''
+    s = simulatorSettings()
+    if s['on']:
+        return fluSimulator(channels=s['channels'], responseTime=s['responseTime'], noise=s['noise'], latency=s['latency'], sampleDt=s['sampleDt'])
+    if fgt is None:
+        return None
+    return sdkBackend()
@@ -16,7 +16,6 @@ import os, sys
 import traceback
 
 # local packages
-import Fluigent.SDK as fgt
 from config import cfg
 from general import *
 from fluThreads import *
@@ -232,7 +231,7 @@ class fluChannel(channel):
             
     def goToPressure(self, runPressure:int, status:bool) -> None:
         '''to to the given pressure'''
-        setPressure(self.chanNum0, runPressure, self.units)
+        self.fluBox.commander.request(self.chanNum0, runPressure, self.units)
         if status:
             self.fluBox.updateStatus(f'Setting channel {self.chanNum0} to {runPressure} {self.units}', True)
          
@@ -255,7 +254,7 @@ class fluChannel(channel):
             return
         runPressure = int(self.setBox.text())
         self.fluBox.updateStatus(f'Setting channel {self.chanNum0} to {runPressure} {self.units} for {runTime} s', True)
-        setPressure(self.chanNum0, runPressure, self.units)
+        self.fluBox.commander.request(self.chanNum0, runPressure, self.units)
         QTimer.singleShot(runTime*1000, self.zeroChannel) 
             # QTimer wants time in milliseconds
         self.fluBox.addRowToCalib(runPressure, runTime, self.chanNum0)
@@ -266,7 +265,7 @@ class fluChannel(channel):
         '''zero the channel pressure'''
         if status:
             self.fluBox.updateStatus(f'Setting channel {self.chanNum0} to 0 {self.units}', True)
-        setPressure(self.chanNum0, 0, self.units)
+        self.fluBox.commander.request(self.chanNum0, 0, self.units)
 
         
     def writeToTable(self, writer) -> None:
@@ -16,7 +16,6 @@ import os, sys
 import traceback
 
 # local packages
-import Fluigent.SDK as fgt
 from config import cfg
 from general import *
 from fluThreads import *
@@ -51,16 +50,19 @@ class fluPlot(QObject):
 
         self.datalines = []
         self.updateColors()
+        self.pw.lock()
+        times, pressures = self.pw.history()
+        self.pw.unlock()
         for i in range(self.numChans):
-            press = self.pw.pressures[i]
             cname = f'Channel {i}'
-            dl = self.graphWidget.plot(self.pw.time, press, pen=self.pens[i], name=cname)
+            dl = self.graphWidget.plot(times, pressures[i], pen=self.pens[i], name=cname)
             self.datalines.append(dl)
         
         self.graphWidget.setLabel('left', f'Pressure ({self.fluBox.units})')
         self.graphWidget.setLabel('bottom', 'Time (s)')
         
         self.timerRunning = False
+        self.drawn = -1     # number of samples in the plot watch at the last redraw
         self.startTimer()
         # create a thread to update the pressure list
         
@@ -97,18 +99,28 @@ class fluPlot(QObject):
             # https://realpython.com/python-pyqt-qthread/
             self.readThread = QThread()
             # Step 3: Create a worker object
-            self.readWorker = plotUpdate(self.fluBox.pw, self.fluBox.arduino, self.connected)       # creates a new thread to read pressures     
+            self.readWorker = plotUpdate(self.fluBox.pw, self.fluBox.arduino, self.connected, self.fluBox.backend)       # creates a new thread to read pressures     
             # Step 4: Move worker to the thread
             self.readWorker.moveToThread(self.readThread)
             # Step 5: Connect signals and slots
             self.readThread.started.connect(self.readWorker.run)       
             self.readThread.finished.connect(self.readThread.deleteLater)
-            self.readWorker.signals.progress.connect(self.update)   # update plot when this runnable stops
             self.readWorker.signals.error.connect(self.fluBox.updateStatus)
             # Step 6: Start the thread
             self.readThread.start()
             logging.debug('Fluigent thread started')
+            
+            # redraw the plot at the display rate, separately from the readings
+            self.displayTimer = QTimer()
+            self.displayTimer.timeout.connect(self.update)
+            self.setDisplayRate(self.fluBox.displayRate)
+            self.displayTimer.start()
             self.timerRunning = True
+            
+    def setDisplayRate(self, rate:float) -> None:
+        '''set the max number of redraws per second'''
+        if rate>0:
+            self.displayTimer.setInterval(int(round(1000/rate)))
 
         
     def updateColors(self) -> None:
@@ -120,50 +132,33 @@ class fluPlot(QObject):
         '''read the pressure and update the plot display'''
         # update display
         if self.connected:
-            for i in range(self.numChans):
-                # get updated values
-                self.pw.lock()
-                pressures = self.pw.pressures
-                time = self.pw.time
+            # copy the history in display units, oldest first, decimated to the width of the plot
+            self.pw.lock()
+            samples = self.pw.samples
+            if samples==self.drawn:
+                # no new readings
                 self.pw.unlock()
-                
+                return
+            times, pressures = self.pw.history(self.graphWidget.width())
+            readings = [self.pw.reading(i) for i in range(self.numChans)]
+            self.pw.unlock()
+            self.drawn = samples
+            
+            for i in range(self.numChans):
                 # update the plot
-                if len(time) == len(pressures[i]):
-                    self.datalines[i].setData(time, pressures[i], pen=self.pens[i])
+                self.datalines[i].setData(times, pressures[i], pen=self.pens[i])
                 # update the pressure reading
-                self.fluBox.updateReading(i, str(pressures[i][-1])) 
+                self.fluBox.updateReading(i, str(readings[i])) 
 
         
     def updateRange(self) -> None:
         '''update the plot time and pressure range'''
         
-        # get updated range
-        self.pw.lock()
-        pressures = self.pw.pressures
-        time = self.pw.time
-        self.pw.unlock()
-        
-        tmin = min(time)
-        tgap = self.fluBox.trange - (max(time)-tmin)
-        dt = self.fluBox.dt/1000
-        tsteps = int(round(tgap/dt))
-        
-        # change size of lists
-        if tsteps>0:
-            # add tsteps points to the beginning
-            time = [tmin+(i-tsteps)*dt for i in range(tsteps)] + time
-            for j in range(len(pressures)):
-                pressures[j] = [0 for i in range(tsteps)] + pressures[j]
-        elif tsteps<0:
-            time = time[(-tsteps):]
-            for j in range(len(pressures)):
-                pressures[j] = pressures[j][(-tsteps):]
-                
-        # update values
+        # change the size of the history, keeping the newest points
         self.pw.lock()
-        self.pw.pressures = pressures
-        self.pw.time = time
+        self.pw.resize(self.fluBox.trange, self.fluBox.dt)
         self.pw.unlock()
+        self.drawn = -1
           
         # update pressure range
         self.updateYRange()
@@ -178,6 +173,8 @@ class fluPlot(QObject):
     
     def close(self) -> None:
         '''gets triggered when the window is closed. It stops the pressure readings.'''
+        if hasattr(self, 'displayTimer'):
+            self.displayTimer.stop()
         for s in ['readThread']:
             if hasattr(self, s):
                 o = getattr(self, s)
@@ -5,9 +5,12 @@
 from PyQt5.QtCore import pyqtSignal, QMutex, QObject, QRunnable, Qt, QThread, QTimer, QThreadPool
 from PyQt5.QtGui import QIntValidator
 from PyQt5.QtWidgets import QLabel, QColorDialog, QCheckBox, QFormLayout, QGridLayout, QLineEdit, QMainWindow, QVBoxLayout, QWidget
-import pyqtgraph as pg
 import csv
 import time
+import json
+import struct
+import threading
+import collections
 import datetime
 import numpy as np
 from typing import List, Dict, Tuple, Union, Any, TextIO
@@ -16,9 +19,10 @@ import os, sys
 import traceback
 
 # local packages
-import Fluigent.SDK as fgt
 from config import cfg
 from general import *
+from fluBackend import *
+from sbprintTiming import tickScheduler
 
    
 #----------------------------------------------------------------------
@@ -48,8 +52,28 @@ def convertPressure(val:float, oldUnits:str, newUnits:str) -> float:
     return out
 
 
+def minMaxDecimate(times:np.ndarray, values:np.ndarray, width:int) -> Tuple[np.ndarray, np.ndarray]:
+    '''reduce a history to the min and max of each bin, with about width bins, so a line plot that is width pixels wide looks the same. times is 1D and values has one row per channel'''
+    n = len(times)
+    if width<1:
+        return times, values
+    k = n//width     # points per bin
+    if k<2:
+        return times, values
+    m = (n//k)*k     # drop the oldest points that don't fill a bin
+    t = times[n-m:].reshape(-1, k)
+    v = values[:, n-m:].reshape(values.shape[0], -1, k)
+    tout = np.empty(2*t.shape[0])
+    tout[0::2] = t[:,0]
+    tout[1::2] = t[:,-1]
+    vout = np.empty((values.shape[0], 2*t.shape[0]))
+    vout[:,0::2] = v.min(axis=2)
+    vout[:,1::2] = v.max(axis=2)
+    return tout, vout
+
+
 class plotWatch(QMutex):
-    '''Holds the pressure/time list for all channels'''
+    '''Holds the pressure/time history for all channels in a preallocated ring buffer. Pressures are stored in mbar and UV channels are stored as 1 for on and 0 for off, and they are converted to the display units when they are read out. Adding a sample writes one column and moves the write index. Lock the plotWatch before calling its functions'''
 
     def __init__(self, pChans:int, uvChans:int, trange:float, dt:float, units:str, pmax:float):
         super().__init__()
@@ -57,61 +81,175 @@ class plotWatch(QMutex):
         self.pChans = pChans   # number of channels
         self.uvChans = uvChans
         self.numChans = pChans+uvChans
-        self.trange = cfg.fluigent.trange       # time range
-        self.dt = dt
+        self.trange = trange       # time range in s
+        self.dt = dt               # time step in ms
         self.d0 = datetime.datetime.now()
-        self.units = units
-        self.pmax = pmax
+        self.units = units         # display units
+        self.pmax = pmax           # value to display for a UV channel that is on, in display units
         self.initializePList()
 
         
     def initializePList(self) -> None:
-        '''initialize the pressure list and time list'''
-        # initialize the time range
-        self.time = list(np.arange(-self.trange*1, 0, self.dt/1000)) 
-               
-        # initialize pressures. assume 0 before we initialized the gui    
-        self.pressures = []
+        '''initialize the pressure and time buffers. assume 0 before we initialized the gui'''
+        n = max(1, int(round(self.trange*1000/self.dt)))
+        self.time = np.arange(-n, 0)*self.dt/1000
+        self.pressures = np.zeros((self.numChans, n))
+        self.index = 0     # column that the next sample goes into. the oldest sample is here
+        self.samples = 0   # number of samples added, so the plot can tell if there is anything new to draw
         
-        for i in range(self.numChans):
-            press = [0 for _ in range(len(self.time))]
-            self.pressures.append(press)
+    def resize(self, trange:float, dt:float) -> None:
+        '''change the time range and time step, keeping the newest samples'''
+        times, pressures = self.ordered()
+        self.trange = trange
+        self.dt = dt
+        self.initializePList()
+        n = min(len(times), len(self.time))
+        if n>0:
+            self.time[-n:] = times[-n:]
+            self.pressures[:,-n:] = pressures[:,-n:]
+            self.time[:-n] = times[-n]+np.arange(-(len(self.time)-n), 0)*self.dt/1000    # space out the empty times before the oldest sample
+            
+    def append(self, t:float, values:List[float]) -> None:
+        '''add a time in s and a value for each channel'''
+        i = self.index
+        self.time[i] = t
+        self.pressures[:,i] = values
+        self.index = (i+1)%len(self.time)
+        self.samples+=1
+        
+    def ordered(self) -> Tuple[np.ndarray, np.ndarray]:
+        '''get copies of the times and stored values, oldest first'''
+        i = self.index
+        times = np.concatenate((self.time[i:], self.time[:i]))
+        pressures = np.concatenate((self.pressures[:,i:], self.pressures[:,:i]), axis=1)
+        return times, pressures
+    
+    def toDisplay(self, pressures:np.ndarray) -> np.ndarray:
+        '''convert stored values to the display units, in place'''
+        if not self.units.lower()=='mbar':
+            pressures[:self.pChans] *= pressureConversion()[self.units.lower()]
+        pressures[self.pChans:] *= self.pmax
+        return pressures
+        
+    def history(self, width:int=0) -> Tuple[np.ndarray, np.ndarray]:
+        '''get copies of the times and the values in the display units, oldest first. if width is given, decimate to that many pixels'''
+        times, pressures = minMaxDecimate(*self.ordered(), width)
+        return times, self.toDisplay(pressures)
+    
+    def reading(self, chanNum0:int) -> Union[int, float]:
+        '''get the newest value of a channel in the display units, rounded for display'''
+        v = float(self.pressures[chanNum0, self.index-1])
+        if chanNum0>=self.pChans:
+            # uv channel
+            if v>0:
+                return self.pmax
+            else:
+                return 0
+        if self.units.lower()=='mbar':
+            return int(v)
+        return convertPressure(v, 'mbar', self.units)
             
     def updateUnits(self, newUnits:str) -> None:
-        '''convert to units'''
-        oldUnits = self.units
+        '''change the display units. the stored values stay in mbar'''
         self.units = newUnits
-        convert = pressureConversion()
-        factor = convert[newUnits.lower()]/convert[oldUnits.lower()]
-        for i,p in enumerate(self.pressures):
-            if i<self.pChans:
-                self.pressures[i] = [x*factor for x in p]
-                # don't convert uv values
 
 
 class fluSignals(QObject):
     '''Signals connector that lets us send status updates back to the GUI from the fluPlot object'''
     
     error = pyqtSignal(str, bool)
-    progress = pyqtSignal()
     
     
-def checkPressure(channel:int) -> int:
+def checkPressure(fb:fluBackend, channel:int) -> int:
     '''reads the pressure in mbar of a given channel, 0-indexed'''
-    pressure = int(fgt.fgt_get_pressure(channel))
+    pressure = int(fb.getPressure(channel))
     return pressure
 
-def setPressure(channel:int, runPressure:float, units:str) -> None:
+def readPressure(fb:fluBackend, channel:int) -> Tuple[float, int]:
+    '''reads the pressure in mbar of a given channel, 0-indexed, without rounding, and the time in ms on the controller's timer when it was measured'''
+    pressure, timestamp = fb.getPressure(channel, include_timestamp=True)
+    return float(pressure), int(timestamp)
+
+def setPressure(fb:fluBackend, channel:int, runPressure:float, units:str) -> None:
     '''convert to mbar and set the pressure'''
     p_mbar = int(convertPressure(runPressure, units, 'mbar')) # convert to mbar
-    fgt.fgt_set_pressure(channel, p_mbar)
+    fb.setPressure(channel, p_mbar)
             
+
+class fluCommander(threading.Thread):
+    '''sends pressure setpoints to the controller from its own thread, so the threads that ask for a pressure never wait on the SDK. If a channel gets a new setpoint before the last one was sent, only the newest is sent. Each setpoint is timestamped when it is requested and when the SDK returns, to measure the command latency'''
+
+    def __init__(self, fb:fluBackend, historySize:int=10000):
+        super(fluCommander, self).__init__(daemon=True)
+        self.fb = fb
+        self.cond = threading.Condition()
+        self.pending = {}      # 0-indexed channel: (pressure in mbar, time requested)
+        self.last = {}         # 0-indexed channel: dictionary of the last setpoint sent, with its request and acknowledge times
+        self.latencies = collections.deque(maxlen=historySize)   # time in s from request to acknowledge
+        self.requested = 0     # number of setpoints requested
+        self.sent = 0          # number of setpoints sent
+        self.coalesced = 0     # number of setpoints replaced by a newer one before they were sent
+        self.errors = 0
+        self.stopping = False
+
+    def request(self, channel:int, runPressure:float, units:str) -> None:
+        '''ask for a pressure on a 0-indexed channel, in the given units. this does not wait for the controller'''
+        p_mbar = int(convertPressure(runPressure, units, 'mbar')) # convert to mbar
+        with self.cond:
+            if channel in self.pending:
+                self.coalesced+=1
+            self.pending[channel] = (p_mbar, time.perf_counter())
+            self.requested+=1
+            self.cond.notify()
+
+    def run(self) -> None:
+        while True:
+            with self.cond:
+                while len(self.pending)==0 and not self.stopping:
+                    self.cond.wait()
+                if len(self.pending)==0:
+                    # stopping and nothing left to send
+                    return
+                pending = self.pending
+                self.pending = {}
+            for channel,(p_mbar, tRequested) in pending.items():
+                try:
+                    self.fb.setPressure(channel, p_mbar)
+                except Exception as e:
+                    self.errors+=1
+                    logging.warning(f'Failed to set channel {channel} to {p_mbar} mbar: {e}')
+                    continue
+                tAcknowledged = time.perf_counter()
+                self.latencies.append(tAcknowledged-tRequested)
+                self.last[channel] = {'pressure':p_mbar, 'requested':tRequested, 'acknowledged':tAcknowledged}
+                self.sent+=1
+
+    def stats(self) -> dict:
+        '''get the number of setpoints and the latency from request to acknowledge in ms'''
+        out = {'requested':self.requested, 'sent':self.sent, 'coalesced':self.coalesced, 'errors':self.errors}
+        lat = np.array(self.latencies)*1000
+        if len(lat)>0:
+            out = {**out, 'mean':float(lat.mean()), 'median':float(np.median(lat)), 'p95':float(np.percentile(lat, 95)), 'max':float(lat.max())}
+        return out
+
+    def close(self) -> None:
+        '''send the setpoints that are still waiting, then stop'''
+        with self.cond:
+            self.stopping = True
+            self.cond.notify()
+        if self.is_alive():
+            self.join(timeout=5)
+        d = self.stats()
+        if 'mean' in d:
+            logging.info(f'Fluigent commands: {d["requested"]} requested, {d["sent"]} sent, {d["coalesced"]} coalesced, {d["errors"]} failed. Latency mean {d["mean"]:.2f} ms, median {d["median"]:.2f} ms, 95% {d["p95"]:.2f} ms, max {d["max"]:.2f} ms')
+        
         
 class plotUpdate(QObject):
     '''plotUpdate updates the list of times and pressures and allows us to read pressures continuously in a background thread.'''
     
-    def __init__(self, pw:plotWatch, arduino, connected:bool):
+    def __init__(self, pw:plotWatch, arduino, connected:bool, fb:fluBackend):
         super().__init__()   
+        self.fb = fb                  # backend that reads the controller
         self.pw = pw                  # plotWatch object (stores pressure list)
         self.numChans = pw.numChans   # number of channels
         self.pChans = pw.pChans 
@@ -122,57 +260,153 @@ class plotUpdate(QObject):
         self.pw.unlock()
         self.arduino = arduino
         
-    def checkPressure(self, channel:int, units:str) -> int:
+    def checkPressure(self, channel:int) -> float:
+        '''read the pressure of a channel in mbar, or 1 if the uv lamp is on'''
         if not self.connected:
             return 0
         if channel<self.pChans:
             # pressure channel
-            pnew_mbar = checkPressure(channel)
-            pnew = convertPressure(pnew_mbar, 'mbar', units)
-            return pnew
+            return readPressure(self.fb, channel)[0]
         else:
             # uv lamp
             if self.arduino.uvOn:
-                return self.pw.pmax
+                return 1
             else:
                 return 0
             
 
     @pyqtSlot()
     def run(self) -> None:
-        '''update the plot and displayed pressure'''
+        '''read the pressures and add them to the history'''
+        scheduler = tickScheduler(self.dt)   # read on fixed deadlines, so the time spent reading does not add to the period
         while True:
+            self.pw.lock()
+            d0 = self.pw.d0   # initial time
+            stop = self.pw.stop
+            self.dt = self.pw.dt   # dt in milliseconds
+            self.pw.unlock()
+            
+            if stop:
+                return
+            scheduler.setPeriod(self.dt)
+            
             try:
-                # get initial list from plotwatch
-                self.pw.lock()
-                newtime = self.pw.time
-                newpressures = self.pw.pressures  
-                d0 = self.pw.d0   # initial time
-                stop = self.pw.stop
-                units = self.pw.units
-                self.dt = self.pw.dt   # dt in milliseconds
-                self.pw.unlock()
-                
-                if stop:
-                    return
-                
-                newtime = newtime[1:]                   # Remove the first y element.
-                dnow = datetime.datetime.now()          # Finds current time relative to when the plot was created
-                tnow = (dnow-d0).total_seconds()
-                newtime.append(tnow)         # Add the current time to the list
-                for i in range(self.numChans):
-                    newpressures[i] = newpressures[i][1:]
-                    pnew = self.checkPressure(i, units)
-                    newpressures[i].append(pnew)         # Add the current pressure to the list, for each channel
+                tnow = (datetime.datetime.now()-d0).total_seconds()   # current time relative to when the plot was created
+                pnew = [self.checkPressure(i) for i in range(self.numChans)]
             except Exception as e:
                 self.signals.error.emit(f'Error reading pressure: {e}', True)
             else:
-                # update plotwatch
                 self.pw.lock()
-                self.pw.time = newtime                   # Save lists to plotWatch object
-                self.pw.pressures = newpressures   
+                self.pw.append(tnow, pnew)
                 self.pw.unlock()
-                self.signals.progress.emit()             # Tell the GUI to update plot
             
-            time.sleep(self.dt/1000)
-            
\ No newline at end of file
+            scheduler.wait()
+    
+#----------------------------------------------------------------------
+
+pressureMagic = b'FLUPR1\n'   # start of every pressure log, with the format version
+pressureDtype = np.dtype([('t', '<f8'), ('chan', 'u1'), ('p', '<f4'), ('ts', '<u2')])   # one record per reading. t is the computer time in s since the start of the recording, p is in mbar, ts is the controller timer in ms
+
+class pressureRecorder(threading.Thread):
+    '''reads the pressure channels at a fixed rate during a print, and writes every new reading with its controller timestamp to a binary file. The file starts with the magic string, the length of the header as a 4 byte integer, and a json header. After that, each reading is a fixed-size record with the fields of pressureDtype. A reading is only written if the controller timestamp changed since the last reading on that channel, so the file holds the readings at the controller's own rate'''
+
+    def __init__(self, fb:fluBackend, fn:str, meta:dict, channels:List[int], dt:float=10, bufferSize:int=1024, flushPeriod:float=1):
+        super(pressureRecorder, self).__init__(daemon=True)
+        self.fb = fb
+        self.fn = fn
+        self.channels = channels      # 0-indexed pressure channels to read
+        self.dt = dt                  # time between readings in ms
+        self.flushPeriod = flushPeriod   # time between writes to disk in s
+        self.buffer = np.zeros(bufferSize, dtype=pressureDtype)
+        self.n = 0          # number of records in the buffer
+        self.written = 0    # number of records written to file
+        self.errors = 0     # number of failed readings
+        self.lastTs = dict([[c, -1] for c in channels])
+        self.stopEvent = threading.Event()
+        os.makedirs(os.path.dirname(os.path.abspath(fn)), exist_ok=True)
+        self.f = open(fn, mode='wb')
+        meta = {**meta, 'channels':channels, 'dt':dt, 'units':'mbar', 'start':datetime.datetime.now().isoformat()}
+        header = json.dumps(meta, default=str).encode()
+        self.f.write(pressureMagic)
+        self.f.write(struct.pack('<I', len(header)))
+        self.f.write(header)
+        self.f.flush()
+        self.t0 = time.perf_counter()
+
+    def write(self, t:float, chan:int, p:float, ts:int) -> None:
+        '''add a reading to the buffer if it is new'''
+        if ts==self.lastTs[chan]:
+            # the controller has not measured again since the last reading
+            return
+        self.lastTs[chan] = ts
+        r = self.buffer[self.n]
+        r['t'] = t
+        r['chan'] = chan
+        r['p'] = p
+        r['ts'] = ts
+        self.n+=1
+        if self.n==len(self.buffer):
+            self.flush()
+
+    def flush(self) -> None:
+        '''write the buffer to file'''
+        if self.n==0:
+            return
+        self.buffer[:self.n].tofile(self.f)
+        self.f.flush()
+        self.written+=self.n
+        self.n = 0
+
+    def run(self) -> None:
+        nextFlush = time.perf_counter()+self.flushPeriod
+        while not self.stopEvent.is_set():
+            tstart = time.perf_counter()
+            for chan in self.channels:
+                try:
+                    p, ts = readPressure(self.fb, chan)
+                except Exception as e:
+                    self.errors+=1
+                    continue
+                self.write(time.perf_counter()-self.t0, chan, p, ts)
+            now = time.perf_counter()
+            if now>=nextFlush:
+                self.flush()
+                nextFlush = now+self.flushPeriod
+            self.stopEvent.wait(max(0, self.dt/1000-(now-tstart)))
+        self.flush()
+        self.f.close()
+
+    def close(self) -> None:
+        '''stop reading and finish the file'''
+        self.stopEvent.set()
+        if self.is_alive():
+            self.join()
+        else:
+            self.flush()
+            self.f.close()
+        if self.errors>0:
+            logging.warning(f'Pressure log: {self.errors} readings failed')
+        logging.info(f'Recorded {self.written} pressure readings to {self.fn}')
+
+
+def readPressureLog(fn:str) -> Tuple[dict, np.ndarray]:
+    '''read the header and records from a pressure log. A partial record at the end of the file is ignored'''
+    with open(fn, mode='rb') as f:
+        magic = f.read(len(pressureMagic))
+        if not magic==pressureMagic:
+            raise ValueError(f'{fn} is not a pressure log')
+        hlen = struct.unpack('<I', f.read(4))[0]
+        meta = json.loads(f.read(hlen).decode())
+        data = f.read()
+    n = len(data)//pressureDtype.itemsize
+    records = np.frombuffer(data[:n*pressureDtype.itemsize], dtype=pressureDtype)
+    return meta, records
+
+def deviceTimes(records:np.ndarray, chan:int) -> Tuple[np.ndarray, np.ndarray]:
+    '''get the controller times in s since the first reading and the pressures in mbar for one channel. The controller timer is 16 bits and wraps every 65.536 s, so this assumes readings are less than 65 s apart'''
+    r = records[records['chan']==chan]
+    if len(r)==0:
+        return np.zeros(0), np.zeros(0)
+    steps = np.diff(r['ts'].astype(np.int64))%65536
+    t = np.concatenate(([0], np.cumsum(steps)))/1000
+    return t, r['p'].astype(float)
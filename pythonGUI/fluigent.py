@@ -16,7 +16,6 @@ import os, sys
 import traceback
 
 # local packages
-import Fluigent.SDK as fgt
 from config import cfg
 from general import *
 from fluThreads import *
@@ -67,6 +66,11 @@ class fluSettingsBox(QWidget):
                                    , tooltip='Time in s to display in plot'
                                    , func=self.updateTrange, width=editw
                                   , validator=objValidator)
+        self.displayRateBox = fLineEdit(form, title='Plot refresh rate (fps)'
+                                   , text=str(fluBox.displayRate)
+                                   , tooltip='Max number of times per second to redraw the plot'
+                                   , func=self.updateDisplayRate, width=editw
+                                  , validator=objValidator)
         self.pmaxBox = fLineEdit(form, title=f'Plot pressure range'
                                  , text=str(fluBox.pmax)
                                  , tooltip=f'Max pressure in chosen units to display in plot'
@@ -119,10 +123,21 @@ class fluSettingsBox(QWidget):
         '''update the value of dt in the parent'''
         self.fluBox.dt = int(self.dtBox.text())
         self.fluBox.pw.lock()
-        self.fluBox.pw.dt = self.fluBox.dt   # update plotwatch object
+        self.fluBox.pw.resize(self.fluBox.trange, self.fluBox.dt)   # update plotwatch object
         self.fluBox.pw.unlock()
         self.fluBox.updateStatus(f'Changed Fluigent plot dt to {self.fluBox.dt} ms', True)
         
+    def updateDisplayRate(self) -> None:
+        '''update the plot refresh rate in the parent'''
+        rate = int(self.displayRateBox.text())
+        if rate<1:
+            self.displayRateBox.setText(str(self.fluBox.displayRate))
+            return
+        self.fluBox.displayRate = rate
+        if hasattr(self.fluBox, 'fluPlot'):
+            self.fluBox.fluPlot.setDisplayRate(rate)
+        self.fluBox.updateStatus(f'Changed Fluigent plot refresh rate to {rate} fps', True)
+        
     def changeUnits(self) -> None:
         '''update the display units'''
         units = self.fluBox.units
@@ -255,6 +270,8 @@ class fluBox(connectBox):
     def saveConfig(self, cfg1):
         '''save the current settings to a config Box object'''
         cfg1.fluigent.dt = self.dt 
+        cfg1.fluigent.displayRate = self.displayRate
+        cfg1.fluigent.recordDt = self.recordDt
         cfg1.fluigent.trange = self.trange
         cfg1.fluigent.pmax = self.pmax
         cfg1.fluigent.savePressure = self.savePressure
@@ -266,11 +283,11 @@ class fluBox(connectBox):
     def loadConfig(self, cfg1):
         '''load settings from a config Box object'''
         
-        for s in ['dt', 'trange', 'pmax', 'savePressure', 'units']:
+        for s in ['dt', 'displayRate', 'recordDt', 'trange', 'pmax', 'savePressure', 'units']:
             if s in cfg1.fluigent:
                 setattr(self, s, cfg1.fluigent[s])
             else:
-                setattr(self, s, {'dt':100, 'trange':60, 'pmax':7000, 'savePressure':True, 'units':'mbar'}[s])
+                setattr(self, s, {'dt':100, 'displayRate':20, 'recordDt':10, 'trange':60, 'pmax':7000, 'savePressure':True, 'units':'mbar'}[s])
         for channel in self.pchannels:
             channel.loadConfig(cfg1)
         self.pcolors = self.cfgColors()  # preset channel colors
@@ -293,8 +310,13 @@ class fluBox(connectBox):
         self.connectAttempts+=1
         self.connectingLayout()  # temporarily put up a layout saying we're connected
         
-        fgt.fgt_init()           # initialize fluigent
-        self.pChans = fgt.fgt_get_pressureChannelCount()  # how many Fluigent channels do we have
+        self.backend = fluigentBackend()   # real or simulated controller
+        if self.backend is None:
+            logging.info('Fluigent SDK is not available')
+            self.pChans = 0
+        else:
+            self.backend.init()           # initialize fluigent
+            self.pChans = self.backend.pressureChannelCount()  # how many Fluigent channels do we have
         
         if self.arduino.uvConnected:
             # add a UV channel
@@ -356,6 +378,10 @@ class fluBox(connectBox):
         runPressureLabel = fLabel(title='Pressure during print (mBar)')
         self.printButts.addWidget(runPressureLabel, 1,0)
         
+        # send pressures from a separate thread
+        self.commander = fluCommander(self.backend)
+        self.commander.start()
+        
         # create channels
         self.pchannels = []                 # pchannels is a list of fluChannel and uvChannel objects
         for i in range(self.pChans):
@@ -429,6 +455,10 @@ class fluBox(connectBox):
             for channel in self.pchannels:
                 channel.updateUnits(self.units)
         self.pmax = convertPressure(self.pmax, self.oldUnits, self.units)
+        if hasattr(self, 'pw'):
+            self.pw.lock()
+            self.pw.pmax = self.pmax
+            self.pw.unlock()
         self.updateRange()
         self.sbWin.calibDialog.updateUnits(self.units)
         
@@ -462,9 +492,11 @@ class fluBox(connectBox):
         '''get a list of values to collect for the time table'''
         out = []
         if self.savePressure and self.connected:
+            self.pw.lock()
             for i in range(self.pChans):
                 if self.pchannels[i].flag1-1 in channels0Triggered:
-                    out.append(self.fluPlot.pw.pressures[i][-1])
+                    out.append(self.pw.reading(i))
+            self.pw.unlock()
             for i in range(self.uvChans):
                 if self.pchannels[i+self.pChans].flag1-1 in channels0Triggered:
                     if self.arduino.uvOn:
@@ -486,6 +518,37 @@ class fluBox(connectBox):
         return out
     
     
+    def startRecording(self) -> None:
+        '''start logging every pressure reading with its controller timestamp for this print'''
+        if not (self.savePressure and self.connected and self.recordDt>0 and self.pChans>0):
+            return
+        try:
+            fn = self.sbWin.newFile('pressure', '.fpr')
+        except NameError:
+            return
+        meta = {'flag1':[self.pchannels[i].flag1 for i in range(self.pChans)]}
+        try:
+            self.recorder = pressureRecorder(self.backend, fn, meta, list(range(self.pChans)), self.recordDt)
+        except OSError as e:
+            self.updateStatus(f'Could not record pressures to {fn}: {e}', True)
+            return
+        self.recorder.start()
+        
+    def stopRecording(self, discard:bool=False) -> None:
+        '''finish the pressure log for this print. if discard, delete it'''
+        if getattr(self, 'recorder', None) is None:
+            return
+        self.recorder.close()
+        if discard:
+            try:
+                if os.path.exists(self.recorder.fn):
+                    os.remove(self.recorder.fn)
+            except OSError as e:
+                logging.warning(f'Could not delete {self.recorder.fn}: {e}')
+        else:
+            self.updateStatus(f'Saved {self.recorder.fn}', True)
+        self.recorder = None
+    
     def writeToTable(self, writer) -> None:
         '''write metadata to the csv writer'''
         for i in range(len(self.pchannels)):
@@ -500,6 +563,7 @@ class fluBox(connectBox):
     def close(self) -> None:
         '''this runs when the window is closed'''
         # close the fluigent
+        self.stopRecording()
         if self.connected:   
             if hasattr(self, 'pw'):
                 self.pw.lock()
@@ -509,7 +573,9 @@ class fluBox(connectBox):
                 self.fluPlot.close()
             try:
                 self.resetAllChannels(-1)
-                fgt.fgt_close() 
+                if hasattr(self, 'commander'):
+                    self.commander.close()    # send the zeros before disconnecting
+                self.backend.close() 
             except Exception as e:
                 print(e)
                 pass
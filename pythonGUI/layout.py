@@ -294,14 +294,8 @@ class SBwindow(QMainWindow):
         
        
 
-        with open(fullfn, mode='w', newline='', encoding='utf-8') as c:
-            writer = csv.writer(c, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(['appid', '', cfg.appid])
-            for box in self.boxes():
-                if hasattr(box, 'writeToTable'):
-                    box.writeToTable(writer)
-            
-            self.sbBox.updateStatus(f'Saved {fullfn}', True)
+        files.saveMetaTable(fullfn, self.boxes())
+        self.sbBox.updateStatus(f'Saved {fullfn}', True)
         
     def flagTaken(self, flag0:int) -> bool:
         '''check if the flag is already occupied'''
@@ -321,16 +315,27 @@ class SBwindow(QMainWindow):
         self.fileName = fullfn
     
     def initSaveTable(self, channelsTriggered:dict, runSimple:dict) -> None:
-        '''initialize a table that saves data during a print'''
+        '''initialize a table that saves data during a print. The rows are streamed to the file while the print runs'''
         if (hasattr(self, 'fluBox') and self.fluBox.savePressure) or (hasattr(self, 'sbBox') and self.sbBox.savePos):
-            self.saveTable = []
-            self.save = True
             self.ending = False
             self.getFileName() # determine the current file name
-            self.tStart = datetime.datetime.now()
-            self.timer = QTimer()
+            if len(self.fileName)==0:
+                return
             self.channelsTriggered = channelsTriggered
             self.runSimple = runSimple
+            phead = self.fluBox.timeHeader(self.channelsTriggered)
+            xyzhead = self.sbBox.timeHeader(self.runSimple)
+            try:
+                self.tableWriter = files.timeTableWriter(self.fileName, ['time(s)']+phead+xyzhead)
+            except OSError as e:
+                self.sbBox.updateStatus(f'Could not save time table to {self.fileName}: {e}', True)
+                return
+            self.tableWriter.start()
+            self.save = True
+            self.tStart = datetime.datetime.now()
+            if hasattr(self, 'fluBox'):
+                self.fluBox.startRecording()   # log every pressure reading
+            self.timer = QTimer()
             self.timer.timeout.connect(self.readValues)
             self.timer.start(self.sbBox.saveFreq)
             
@@ -348,31 +353,36 @@ class SBwindow(QMainWindow):
                 xyzlist = self.sbBox.timeRow(self.runSimple)
             else:
                 xyzlist = []
-            self.saveTable.append([tnow]+plist+xyzlist)
+            self.tableWriter.put([tnow]+plist+xyzlist)
             
     def discardSaveTable(self) -> None:
-        '''throw out the table and stop recording'''
+        '''stop recording and delete the table'''
         if hasattr(self, 'timer') and self.timer.isActive():
             self.timer.stop()
         self.ending = False
-        self.save = False
+        if self.save:
+            self.save = False
+            self.tableWriter.close()
+            if hasattr(self, 'fluBox'):
+                self.fluBox.stopRecording(discard=True)
+            try:
+                if os.path.exists(self.fileName):
+                    os.remove(self.fileName)
+            except OSError as e:
+                logging.warning(f'Could not delete {self.fileName}: {e}')
 
     def writeSaveTable(self) -> None:
-        '''save the table to csv'''
+        '''stop recording and finish writing the table'''
         
         if self.save:
             if hasattr(self, 'timer') and self.timer.isActive():
                 self.timer.stop()
             self.ending = False
             self.save = False
-            with open(self.fileName, mode='w', newline='', encoding='utf-8') as c:
-                writer = csv.writer(c, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-                phead = self.fluBox.timeHeader(self.channelsTriggered)
-                xyzhead = self.sbBox.timeHeader(self.runSimple)
-                writer.writerow(['time(s)']+phead+xyzhead) # header
-                for row in self.saveTable:
-                    writer.writerow(row)
+            self.tableWriter.close()
             self.sbBox.updateStatus(f'Saved {self.fileName}', True)
+            if hasattr(self, 'fluBox'):
+                self.fluBox.stopRecording()
             
     
     
@@ -384,6 +394,8 @@ class SBwindow(QMainWindow):
         logging.info('Closing boxes.')
         if hasattr(self, 'timer') and self.timer.isActive():
             self.timer.stop()
+        if hasattr(self, 'tableWriter'):
+            self.tableWriter.close()
         for o in self.boxes():
             if hasattr(o, 'close'):
                 o.close()
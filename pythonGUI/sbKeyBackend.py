@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+'''Shopbot GUI backends for reading the keys that the SB3 software writes to the windows registry'''
+
+# external packages
+import os, sys
+import subprocess
+import time
+from typing import List, Dict, Tuple, Union, Any, TextIO, NamedTuple
+import logging
+
+try:
+    import winreg
+except ModuleNotFoundError:
+    winreg = None   # not on windows. only the memory backend is available
+
+# local packages
+from sbpRead import *
+
+#----------------------------------------------------------------------
+
+# folders of keys and the values they hold
+keyFolders = {'UserData':
+                    ['AnInp1', 'AnInp2', 'InputSwitches'
+                     , 'Loc_1', 'Loc_2', 'Loc_3'
+                     , 'OutPutSwitches', 'SpindleStatus','Status'
+                     , 'uAppPath'
+                     , 'uCommand', 'uCommandQ1', 'uMsgBoxCaption'
+                     , 'uMsgBoxMessage', 'uPartFileName', 'uResponse'
+                     , 'uSpindleStatus', 'uUsrPath', 'uValueClrd']
+            , 'Settings':
+                    ['Cheight', 'Cheight_prev', 'Cleft', 'Cleft_prev'
+                     , 'Ctop', 'Ctop_prev', 'Cwidth', 'Cwidth_prev'
+                     , 'DoneEASY', 'DoneWelcome', 'LAstConnected'
+                     , 'LAstRead', 'LastSoftwareLoaded', 'RegInteractionActive']
+            , 'Debug':
+                    ['Status01', 'Status02', 'Status03']}
+keyPaths = {'UserData':'UserData', 'Settings':r'Sb3\Settings', 'Debug':r'Sb3\DebugStatus'}   # path of each folder under the Shopbot key
+keyFolderOf = dict([[value, folder] for folder,l in keyFolders.items() for value in l])   # folder that holds each value
+changingKeys = ['Loc_1', 'Loc_2', 'Loc_3', 'OutPutSwitches', 'Status', 'LAstRead']   # values that change during a print
+
+
+class keySnapshot(NamedTuple):
+    '''the changing keys, all read in the same locked pass'''
+    time: float      # time on the backend clock when the keys were read
+    loc: xyzPoint    # position of the stage, NaN if it could not be read
+    flag: int        # output flags, cross-referenced with the arduino. -1 if it could not be read
+    status: int      # status of the SB3 software. 6 if it could not be read
+    lastRead: int    # last line read into the SB3 software. -1 if it could not be read
+    running: bool    # we are running an sbp file
+    diag: int        # logging mode
+    rawFlag: int = -1   # output flags as read from the keys, before cross-referencing with the arduino
+    pins: int = 0       # states of the arduino flag pins, as a flag word
+
+    @property
+    def stopHit(self) -> bool:
+        '''the file is not running, or stop was hit on the shopbot'''
+        if self.status>0:
+            if not self.status&1:
+                # file is not running, stop
+                return True
+            if self.status&(2**4):
+                # stop was hit, stop
+                return True
+        return False
+
+#----------------------------------------------------------------------
+
+class keyBackend:
+    '''interface for reading keys. open returns a handle for a folder of keys, and query returns the value and type of a value in the folder, like winreg.QueryValueEx. Both raise FileNotFoundError if the key does not exist'''
+
+    def open(self, folder:str) -> Any:
+        '''get a handle for the folder'''
+        raise NotImplementedError
+
+    def query(self, handle:Any, value:str) -> Tuple[Any, int]:
+        '''get the value and its type'''
+        raise NotImplementedError
+
+    def begin(self, t:float) -> None:
+        '''start a pass of queries that should all describe the machine at time t'''
+        return
+
+    def end(self) -> None:
+        '''finish the pass of queries'''
+        return
+
+    def launch(self, sb3File:str) -> None:
+        '''open the SB3 program'''
+        return
+
+    def runFile(self, sb3File:str, file:str) -> None:
+        '''tell the SB3 program to run the sbp file'''
+        return
+
+    def clock(self) -> float:
+        '''get the time in s, on the clock that the machine runs on'''
+        return time.perf_counter()
+
+    def sleep(self, dt:float) -> None:
+        '''wait dt s on the clock that the machine runs on'''
+        time.sleep(dt)
+
+
+class registryBackend(keyBackend):
+    '''reads keys from the windows registry'''
+
+    def __init__(self, launch:bool=True):
+        '''if launch is False, do not open the SB3 program, because another process already opened it'''
+        if winreg is None:
+            raise ModuleNotFoundError('The windows registry is not available on this system')
+        self.reg = winreg.ConnectRegistry(None, winreg.HKEY_CURRENT_USER)
+        self.launchSB3 = launch
+
+    def open(self, folder:str) -> Any:
+        return winreg.OpenKey(self.reg, os.path.join(r'Software\VB and VBA Program Settings\Shopbot', keyPaths[folder]))
+
+    def query(self, handle:Any, value:str) -> Tuple[Any, int]:
+        return winreg.QueryValueEx(handle, value)
+
+    def launch(self, sb3File:str) -> None:
+        if not self.launchSB3:
+            return
+        subprocess.Popen([sb3File])
+
+    def runFile(self, sb3File:str, file:str) -> None:
+        arg =  f'{file}, ,4, ,0,0,0"'
+        subprocess.Popen([sb3File, arg])
+
+
+class memoryBackend(keyBackend):
+    '''holds keys in dictionaries, for testing and benchmarking without the SB3 software'''
+
+    def __init__(self, **values):
+        self.folders = dict([[folder, {}] for folder in keyFolders])
+        self.set(Loc_1='0', Loc_2='0', Loc_3='0', OutPutSwitches='0', Status='0', LAstRead='0', uAppPath='', uMsgBoxMessage='')
+        self.set(**values)
+
+    def set(self, **values) -> None:
+        '''set the values, given as strings like the SB3 software writes them'''
+        for value,val in values.items():
+            self.folders[keyFolderOf[value]][value] = val
+
+    def open(self, folder:str) -> dict:
+        if not folder in self.folders:
+            raise FileNotFoundError(folder)
+        return self.folders[folder]
+
+    def query(self, handle:dict, value:str) -> Tuple[Any, int]:
+        if not value in handle:
+            raise FileNotFoundError(value)
+        return handle[value], 1
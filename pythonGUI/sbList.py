@@ -2,18 +2,16 @@
 '''Shopbot GUI functions for list of shopbot files'''
 
 # external packages
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import pyqtSignal, pyqtSlot, QObject, QRunnable, Qt, QThreadPool, QTimer
+from PyQt5.QtGui import QBrush, QColor, QIcon
 from PyQt5.QtWidgets import QAbstractItemView, QHBoxLayout, QListWidget, QListWidgetItem, QPushButton
 import os, sys
-import winreg
 import subprocess
 from typing import List, Dict, Tuple, Union, Any, TextIO
 import logging
 import csv
 import re
 import time
-import win32gui, win32api, win32con
 
 # local packages
 # import Fluigent.SDK as fgt
@@ -36,7 +34,46 @@ def reconnect(signal, newhandler=None, oldhandler=None):
         pass
     if newhandler is not None:
         signal.connect(newhandler)
-        
+
+
+def isFileList(fn:str) -> bool:
+    '''determine if this file is a list of sbp files'''
+    return fn.endswith('list.txt') or fn.endswith('List.txt')
+
+def readFileList(fn:str) -> List[str]:
+    '''read the full paths of the files in a list of files. Break points are kept as BREAK'''
+    out = []
+    dirname = os.path.dirname(fn)
+    with open(fn, mode='r') as f:
+        for line0 in f:
+            line = line0.strip()
+            if line=='BREAK':
+                out.append(line)
+            elif len(line)>0:
+                out.append(os.path.join(dirname, line))
+    return out
+
+def queueEntry(fn:str) -> str:
+    '''determine what to do with this entry in the queue: run it, stop at a break point, or skip a missing file'''
+    if os.path.exists(fn):
+        return 'run'
+    if fn=='BREAK':
+        return 'break'
+    return 'missing'
+
+def nextIndex(index:int, count:int) -> int:
+    '''get the index of the next file in a queue of count files. At the end of the queue, go back to the beginning'''
+    if count<=1:
+        return 0
+    newNum = index+1
+    if newNum>=count:
+        newNum = 0
+    return newNum
+
+def playNext(autoPlay:bool, index:int) -> bool:
+    '''determine if the next file should run automatically. The queue stops when it comes back to the beginning'''
+    return autoPlay and index>0
+
 
 class runButt(QPushButton):
     '''holds run button'''
@@ -69,6 +106,28 @@ class runButt(QPushButton):
     
 
 
+class precompileSignals(QObject):
+    status = pyqtSignal(str, str)   # full path of the file, status
+    
+class precompileSBP(QRunnable):
+    '''parse a shopbot file and build its point table in the background, so it is ready when the print starts'''
+    
+    def __init__(self, fn:str):
+        super(precompileSBP,self).__init__()
+        self.fn = fn
+        self.signals = precompileSignals()
+        
+    @pyqtSlot()
+    def run(self) -> None:
+        '''parse the file into the cache'''
+        try:
+            sp = loadSBP(self.fn)
+        except Exception as e:
+            self.signals.status.emit(self.fn, f'Error: {e}')
+        else:
+            self.signals.status.emit(self.fn, f'Ready. Predicted print time {formatDuration(sp.motion.duration)}')
+
+
 class sbpNameList(QHBoxLayout):
     '''holds widget and list of shopbot files'''
     
@@ -76,6 +135,9 @@ class sbpNameList(QHBoxLayout):
         super(sbpNameList, self).__init__()
         self.sbBox = sbBox
         self.sbpRealList = []
+        self.fileStatus = {}    # precompile status of each file, keyed by full path
+        self.pool = QThreadPool()   # separate pool so parsing doesn't hold up the camera threads
+        self.pool.setMaxThreadCount(2)
         
         self.successLayout(**kwargs)        
         
@@ -181,6 +243,43 @@ class sbpNameList(QHBoxLayout):
         return -1
     
     
+    def precompile(self, fn:str) -> None:
+        '''start parsing the file in the background'''
+        if not fn.endswith('.sbp') or not os.path.exists(fn):
+            return
+        if isLoaded(fn):
+            self.fileStatus[fn] = f'Ready. Predicted print time {formatDuration(loadSBP(fn).motion.duration)}'
+            return
+        self.fileStatus[fn] = 'Parsing'
+        worker = precompileSBP(fn)
+        worker.signals.status.connect(self.updateFileStatus)
+        self.pool.start(worker)
+        
+    @pyqtSlot(str, str)
+    def updateFileStatus(self, fn:str, status:str) -> None:
+        '''store the precompile status of the file and show it on its items'''
+        self.fileStatus[fn] = status
+        if status.startswith('Error'):
+            logging.error(f'Could not read {fn}: {status}')
+        for i in range(self.listW.count()):
+            item = self.listW.item(i)
+            if self.getFullPath(item.text())==fn:
+                self.showFileStatus(item)
+                
+    def showFileStatus(self, item:QListWidgetItem) -> None:
+        '''show the precompile status of the item in its color and tooltip'''
+        fn = self.getFullPath(item.text())
+        if not fn in self.fileStatus:
+            return
+        status = self.fileStatus[fn]
+        if status.startswith('Ready'):
+            item.setForeground(QBrush())
+        elif status=='Parsing':
+            item.setForeground(QBrush(QColor('#888888')))
+        else:
+            item.setForeground(QBrush(QColor('#b0401e')))
+        item.setToolTip(status)
+    
     def updateItem(self, item:QListWidgetItem, active:bool) -> None:
         '''Update the item status to active or inactive'''
         if active:
@@ -222,31 +321,19 @@ class sbpNameList(QHBoxLayout):
         if self.listW.count()==1:
             # there is only one file in the list, so we're done.
             return
-        newNum = self.sbpNumber() + 1
-        if newNum>=self.listW.count(): 
-            # if we're at the end of the list, restart from the beginning
-            newNum = 0
-        self.activate(newNum)
+        self.activate(nextIndex(self.sbpNumber(), self.listW.count()))
         
     def addFileList(self, fn) -> bool:
         '''check if this file is a list of files and read in all of the files in the list. return true if it is a list of files'''
-        if not (fn.endswith('list.txt') or fn.endswith('List.txt')):
+        if not isFileList(fn):
             # this is not a list of files
             return False
-        dirname = os.path.dirname(fn)
-        with open(fn, mode='r') as f:
-            for line0 in f:
-                line = line0.strip()
-                # iterate through lines in the file and add them to the run list
-                if line=='BREAK':
-                    self.addFile(line)  # just add the break
-                else:
-                    # add full path name to list
-                    path = os.path.join(dirname, line)
-                    if os.path.exists(path):
-                        self.addFile(path)
-                    else:
-                        logging.error(f'Cannot add file in {fn}. File does not exist: {path}')
+        for path in readFileList(fn):
+            # iterate through lines in the file and add them to the run list
+            if queueEntry(path)=='missing':
+                logging.error(f'Cannot add file in {fn}. File does not exist: {path}')
+            else:
+                self.addFile(path)
         return True
 
     
@@ -275,6 +362,8 @@ class sbpNameList(QHBoxLayout):
             self.listW.insertItem(position, item)
         else:
             self.listW.addItem(item) # add it to the list
+        self.precompile(fn)   # start building the point table in the background
+        self.showFileStatus(item)
         if self.listW.count()>1: # if there was already an item in the list
             item0 = self.listW.item(0) # take the first item
             if not os.path.exists(self.getFullPath(item0.text())) and not item0.text()=='BREAK': # if the original item isn't a real file
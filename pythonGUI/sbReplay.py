@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+'''Shopbot GUI functions for replaying recorded print telemetry through the print loop, to test changes to the tracking settings'''
+
+# external packages
+import os, sys
+import copy
+from typing import List, Dict, Tuple, Union, Any, TextIO
+import logging
+import numpy as np
+
+# local packages
+from flags import *
+from sbprint import *
+from sbprintTelemetry import *
+
+#----------------------------------------------------------------------
+
+class replayBackend(memoryBackend):
+    '''holds the keys from one record of a telemetry file. The clock is the time of the record, so the print loop sees the same timing as the recorded print, and sleep does not wait'''
+
+    def __init__(self):
+        super(replayBackend, self).__init__()
+        self.t = 0
+
+    def setRecord(self, r:np.void) -> None:
+        '''put the values from a record into the keys'''
+        self.t = float(r['t'])
+        self.set(Loc_1=str(r['x']), Loc_2=str(r['y']), Loc_3=str(r['z']), OutPutSwitches=str(r['rawFlag'])
+                 , Status=str(r['status']), LAstRead=str(r['lastRead']))
+
+    def clock(self) -> float:
+        return self.t
+
+    def sleep(self, dt:float) -> None:
+        return
+
+
+class replayArduino:
+    '''stands in for the arduino during a replay. the flags were already cross-referenced with the pins when they were recorded, so readSB gives back the recorded flag'''
+
+    def __init__(self, pins:dict):
+        self.pins = pins
+        self.connected = False
+        self.flag = 0
+        self.pinStates = 0
+
+    def setRecord(self, r:np.void) -> None:
+        '''store the flag and pin states from a record'''
+        self.flag = int(r['flag'])
+        self.pinStates = int(r['pins'])
+
+    def readSB(self, sbFlag:int) -> int:
+        return self.flag
+
+
+def replayTelemetry(fn:str, pSettings:dict=None, sbpfile:str='') -> dict:
+    '''feed the records in the telemetry file through a print loop as fast as possible. pSettings replaces the recorded print settings, and sbpfile replaces the recorded sbp file, if given. returns the result of the print and a list of (time, flag0, on) for each time a channel turned on or off'''
+    meta, records = readTelemetry(fn)
+    if len(records)==0:
+        raise ValueError(f'No records in {fn}')
+    if pSettings is None:
+        pSettings = meta['pSettings']
+    if len(sbpfile)==0:
+        sbpfile = meta['sbpfile']
+    pins = dict([[int(flag1), pin] for flag1,pin in meta['pins'].items()])
+    modes = dict([[int(flag0), mode] for flag0,mode in meta['modes'].items()])
+
+    backend = replayBackend()
+    ard = replayArduino(pins)
+    backend.setRecord(records[0])
+    ard.setRecord(records[0])
+    keys = SBKeys(0, ard, backend)
+    keys.runningSBP = True
+    pl = printLoop(meta['dt'], keys, sbpfile, copy.deepcopy(pSettings), None, meta['sbRunFlag1'], modes=modes)
+
+    events = []
+    on = dict([[flag0, cw.on] for flag0,cw in pl.channelWatches.items()])
+    result = ''
+    for r in records:
+        backend.setRecord(r)
+        ard.setRecord(r)
+        result = pl.step(keys.snapshot())
+        for flag0,cw in pl.channelWatches.items():
+            if not cw.on==on[flag0]:
+                on[flag0] = cw.on
+                events.append((backend.t, flag0, cw.on))
+        if len(result)>0:
+            break
+    pl.close()
+    return {'result':result, 'steps':len(records), 'events':events, 'duration':float(records[-1]['t']-records[0]['t'])}
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+'''Shopbot GUI simulator of the SB3 software, for running prints without the shopbot'''
+
+# external packages
+import os, sys
+import time
+import threading
+from typing import List, Dict, Tuple, Union, Any, TextIO
+import logging
+import numpy as np
+
+# local packages
+from sbKeyBackend import *
+from sbpCache import *
+
+#----------------------------------------------------------------------
+
+class simClock:
+    '''clock for the simulator. speed is how many times faster than real time the clock runs. If speed is 0, the clock only moves forward when something sleeps, so a print runs as fast as the computer can step through it'''
+
+    def __init__(self, speed:float=1):
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.t = 0                        # virtual time in s, if speed is 0
+        self.t0 = time.perf_counter()     # real time when the clock started
+
+    def clock(self) -> float:
+        '''get the simulated time in s'''
+        if self.speed<=0:
+            with self.lock:
+                return self.t
+        return (time.perf_counter()-self.t0)*self.speed
+
+    def sleep(self, dt:float) -> None:
+        '''wait dt simulated seconds'''
+        if dt<=0:
+            return
+        if self.speed<=0:
+            with self.lock:
+                self.t+=dt
+        else:
+            time.sleep(dt/self.speed)
+
+
+class sb3Simulator(keyBackend):
+    '''simulates the keys that the SB3 software writes while it runs an sbp file. The stage follows the ramped moves from the motion model, the output flags follow the SO lines, and the last line read runs lookahead moves ahead of the current move, like the SB3 read-ahead buffer.
+    speed is the speed of the clock, where 0 runs as fast as possible. If file is given, start running the file right away'''
+
+    def __init__(self, file:str='', speed:float=1, lookahead:int=20):
+        self.simClock = simClock(speed)
+        self.lookahead = lookahead    # number of moves the SB3 software reads ahead of the move it is running
+        self.values = memoryBackend()
+        self.file = ''
+        self.tStart = -1     # time the file started, -1 if no file has been started
+        self.tStop = np.inf  # time into the file when stop was hit
+        self.lastUpdate = -1
+        self.frozen = False   # True during a snapshot pass, so every key comes from the same update
+        if len(file)>0:
+            self.runFile('', file)
+
+    def clock(self) -> float:
+        return self.simClock.clock()
+
+    def sleep(self, dt:float) -> None:
+        self.simClock.sleep(dt)
+
+    #------------------------------
+
+    def runFile(self, sb3File:str, file:str) -> None:
+        '''start running the sbp file'''
+        sp = loadSBP(file)
+        self.file = file
+        self.points = sp.points
+        self.motion = sp.motion
+        self.findFlags()
+        self.tStop = np.inf
+        self.tStart = self.clock()
+        self.lastUpdate = -1
+        logging.info(f'Simulating {os.path.basename(file)}, predicted time {formatDuration(self.motion.duration)}')
+
+    def share(self) -> dict:
+        '''get the state another process needs to follow the same run. perf_counter is a system-wide clock, so the start times carry over'''
+        return {'file':self.file, 'speed':self.simClock.speed, 'lookahead':self.lookahead
+                , 't0':self.simClock.t0, 't':self.simClock.clock(), 'tStart':self.tStart, 'tStop':self.tStop}
+
+    def attach(self, shared:dict) -> None:
+        '''follow the run from another simulator, using the state from share()'''
+        self.simClock.t0 = shared['t0']
+        self.simClock.t = shared['t']
+        if len(shared['file'])>0:
+            self.runFile('', shared['file'])
+            self.tStart = shared['tStart']
+            self.tStop = shared['tStop']
+
+    def findFlags(self) -> None:
+        '''find the output flag value at the end of each row'''
+        pts = self.points
+        n = len(pts)
+        self.flagAfter = np.zeros(n, dtype=np.int64)
+        for ch,c in pts.col.items():
+            state = pts.after[:,c].astype(np.float64)
+            state[state<0] = np.nan
+            valid = ~np.isnan(state)
+            idx = np.where(valid, np.arange(n), 0)
+            np.maximum.accumulate(idx, out=idx)    # carry the last state forward through rows with no state
+            state = np.where(valid[idx], state[idx], 0)
+            self.flagAfter = self.flagAfter + (state==1)*2**ch
+
+    def stop(self) -> None:
+        '''hit the stop button. the stage stops where it is'''
+        if self.tStart>=0:
+            self.tStop = min(self.tStop, self.clock()-self.tStart)
+
+    #------------------------------
+
+    def begin(self, t:float) -> None:
+        '''put the state at time t into the keys, and hold it until end'''
+        self.update(t)
+        self.frozen = True
+
+    def end(self) -> None:
+        self.frozen = False
+
+    def update(self, now:float=-1) -> None:
+        '''put the state of the machine at time now into the keys. If now is not given, use the current time'''
+        if now<0:
+            now = self.clock()
+        if now==self.lastUpdate:
+            return
+        self.lastUpdate = now
+        if self.tStart<0:
+            self.values.set(Status='0')
+            return
+        t = min(now-self.tStart, self.tStop)
+        n = len(self.points)
+        i = self.motion.rowAt(t)       # row the stage is on
+        done = t>=self.motion.duration
+        x,y,z = self.motion.position(t)
+        if i>0 or done:
+            flag = int(self.flagAfter[i-1 if not done else n-1])
+        else:
+            flag = 0
+        if self.tStop<np.inf:
+            status = 1+2**4
+        elif done:
+            status = 0
+        else:
+            status = 1
+        lastRead = int(self.points.line[min(i+self.lookahead, n-1)])
+        self.values.set(Loc_1=f'{x:.5f}', Loc_2=f'{y:.5f}', Loc_3=f'{z:.5f}', OutPutSwitches=str(flag), Status=str(status), LAstRead=str(lastRead))
+
+    def open(self, folder:str) -> dict:
+        return self.values.open(folder)
+
+    def query(self, handle:dict, value:str) -> Tuple[Any, int]:
+        if not self.frozen:
+            self.update()
+        return self.values.query(handle, value)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+'''Caches of parsed shopbot files, in memory and on disk'''
+
+# external packages
+import os
+import sys
+import shutil
+import hashlib
+import json
+import threading
+import time
+import collections
+from typing import List, Dict, Tuple, Union, Any, TextIO
+import logging
+import numpy as np
+
+# local packages
+from config import cfg
+from sbpRead import *
+from sbpMotion import *
+
+#-----------------------------------------------------
+
+def fileHash(file:str) -> str:
+    '''get a hash of the contents of the file and the parser version'''
+    h = hashlib.sha1(f'sbpParser{sbpParserVersion}'.encode())
+    with open(file, mode='rb') as f:
+        for chunk in iter(lambda: f.read(2**20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class cachedSBP:
+    '''a parsed sbp file loaded from the point cache. Holds the same header, channels, triggered channels, and point table as SBPPoints'''
+
+    def __init__(self, file:str, header:SBPHeader, triggered:list, points:pointTable):
+        self.file = file
+        self.header = header
+        self.triggered = triggered
+        self.points = points
+        self.channels = points.channels
+
+
+class pointCache:
+    '''stores point tables on disk in a central folder, keyed by the hash of the sbp file. Each entry is a folder of .npy files that can be memory mapped, plus a json file of header values.
+    When the folder gets bigger than maxMB, the least recently used entries are deleted. Temporary folders older than staleAge s were left by writers that died, and are deleted too'''
+
+    def __init__(self, folder:str='', maxMB:float=500, staleAge:float=3600):
+        if len(folder)==0:
+            folder = os.path.join(os.path.expanduser('~'), '.sbgui', 'pointCache')
+        self.folder = folder
+        self.maxBytes = maxMB*2**20
+        self.staleAge = staleAge
+
+    def entry(self, h:str) -> str:
+        '''get the folder for the hash'''
+        return os.path.join(self.folder, h)
+
+    def get(self, file:str, h:str) -> Union[cachedSBP, None]:
+        '''load the file from the cache. return None if it is not in the cache'''
+        folder = self.entry(h)
+        metafile = os.path.join(folder, 'meta.json')
+        if not os.path.exists(metafile):
+            return None
+        try:
+            with open(metafile, mode='r') as f:
+                meta = json.load(f)
+            arrays = dict([[s, np.load(os.path.join(folder, f'{s}.npy'), mmap_mode='c')] for s in pointTable.columns])
+        except (OSError, ValueError) as e:
+            logging.warning(f'Could not read {file} from point cache: {e}')
+            return None
+        os.utime(metafile)    # mark this entry as recently used
+        points = pointTable(meta['channels'], **arrays)
+        header = SBPHeader(file, d=meta['header'])
+        return cachedSBP(file, header, meta['triggered'], points)
+
+    def put(self, sp:SBPPoints, h:str) -> None:
+        '''store the parsed file in the cache'''
+        folder = self.entry(h)
+        if os.path.exists(folder):
+            return
+        tmp = f'{folder}.{os.getpid()}.{threading.get_ident()}'   # write to a temporary folder so readers never see half an entry
+        try:
+            os.makedirs(tmp)
+            for s,arr in sp.points.arrays().items():
+                np.save(os.path.join(tmp, f'{s}.npy'), arr)
+            meta = {'file':os.path.abspath(sp.file), 'version':sbpParserVersion, 'channels':sp.points.channels, 'triggered':sp.triggered, 'header':sp.header.toDict()}
+            with open(os.path.join(tmp, 'meta.json'), mode='w') as f:
+                json.dump(meta, f)
+            os.replace(tmp, folder)
+        except (OSError, TypeError, ValueError) as e:
+            # another thread may have written the same entry, or the disk is not writable
+            if not os.path.exists(folder):
+                logging.warning(f'Could not write {sp.file} to point cache: {e}')
+            return
+        finally:
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp, ignore_errors=True)
+        try:
+            self.evict()
+        except OSError as e:
+            logging.warning(f'Could not clean up point cache: {e}')
+
+    def entrySize(self, folder:str) -> int:
+        '''get the size of an entry in bytes'''
+        return sum([os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder)])
+
+    def evict(self) -> None:
+        '''delete stale temporary folders, then delete the least recently used entries until the cache is under its size limit'''
+        entries = []
+        now = time.time()
+        for h in os.listdir(self.folder):
+            folder = self.entry(h)
+            if '.' in h:
+                # entry that is still being written. if it is old, the writer died before it finished
+                try:
+                    if now-os.path.getmtime(folder)>self.staleAge:
+                        shutil.rmtree(folder, ignore_errors=True)
+                except OSError:
+                    pass
+                continue
+            metafile = os.path.join(folder, 'meta.json')
+            if os.path.exists(metafile):
+                try:
+                    entries.append([os.path.getmtime(metafile), self.entrySize(folder), folder])
+                except OSError:
+                    pass
+        total = sum([e[1] for e in entries])
+        entries.sort()
+        while total>self.maxBytes and len(entries)>1:
+            t, size, folder = entries.pop(0)
+            shutil.rmtree(folder, ignore_errors=True)
+            total = total-size
+
+    def clear(self) -> None:
+        '''delete all entries'''
+        if os.path.exists(self.folder):
+            shutil.rmtree(self.folder, ignore_errors=True)
+
+
+#-----------------------------------------------------
+
+diskCache = pointCache(cfg.shopbot.pointCache.folder, cfg.shopbot.pointCache.maxMB)
+parsedLock = threading.Lock()
+parsedFiles = collections.OrderedDict()   # parsed files, keyed by absolute path, with the most recently used last. values are ((mtime, size), SBPPoints or cachedSBP)
+maxParsed = cfg.shopbot.pointCache.maxFiles if 'maxFiles' in cfg.shopbot.pointCache else 20   # number of parsed files to keep in memory
+parsingLocks = {}  # one lock per file, so if a file is already being parsed in another thread, we wait for it instead of parsing it twice
+
+def loadSBP(file:str) -> Union[SBPPoints, cachedSBP]:
+    '''get the parsed sbp file from memory if it has not changed since it was parsed, then from the point cache on disk, or parse it. The result is shared, so do not edit it'''
+    path = os.path.abspath(file)
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    with parsedLock:
+        if path in parsedFiles and parsedFiles[path][0]==key:
+            parsedFiles.move_to_end(path)
+            return parsedFiles[path][1]
+        if not path in parsingLocks:
+            parsingLocks[path] = threading.Lock()
+        fileLock = parsingLocks[path]
+    with fileLock:
+        with parsedLock:
+            if path in parsedFiles and parsedFiles[path][0]==key:
+                # another thread parsed the file while we were waiting
+                parsedFiles.move_to_end(path)
+                return parsedFiles[path][1]
+        h = fileHash(path)
+        sp = diskCache.get(file, h)
+        if sp is None:
+            sp = SBPPoints(file)
+            diskCache.put(sp, h)
+        sp.motion = motionModel(sp.points, sp.header)   # predicted timing of each move
+        with parsedLock:
+            parsedFiles[path] = (key, sp)
+            parsedFiles.move_to_end(path)
+            while len(parsedFiles)>max(1, maxParsed):
+                # forget the least recently used file
+                parsedFiles.popitem(last=False)
+    return sp
+
+def isLoaded(file:str) -> bool:
+    '''check if the parsed file is in memory and up to date'''
+    path = os.path.abspath(file)
+    if not os.path.exists(path):
+        return False
+    st = os.stat(path)
+    with parsedLock:
+        return path in parsedFiles and parsedFiles[path][0]==(st.st_mtime_ns, st.st_size)
+
+def loadSBPHeader(file:str) -> SBPHeader:
+    '''get the header of the sbp file from the cache. If the file cannot be parsed into points, just read the header'''
+    if not os.path.exists(file) or not file.endswith('.sbp'):
+        return SBPHeader(file)
+    try:
+        return loadSBP(file).header
+    except (ValueError, TypeError, IndexError):
+        # the points could not be parsed
+        return SBPHeader(file)
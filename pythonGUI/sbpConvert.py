@@ -6,7 +6,7 @@ import os
 import sys
 import re
 from typing import List, Dict, Tuple, Union, Any, TextIO
-import sympy as sy
+from functools import lru_cache
 
 
 
@@ -85,16 +85,37 @@ def mean(*dims) -> Union[str, float]:
 #--------------------------
 
 
+scVarPattern = re.compile(r'&([A-Za-z_]\w*)')   # variable names in shopbot expressions, e.g. &spacing
+
+@lru_cache(maxsize=65536)
+def compileSC(vi:str) -> Tuple[Any, Tuple[str], Tuple[str]]:
+    '''Compile the expression vi once. Returns the code object, the variable names used in the expression, and the names they are bound to in the code'''
+    names = tuple(dict.fromkeys(scVarPattern.findall(vi)))    # unique names, in order of appearance
+    keys = tuple([f'_sc_{key}' for key in names])
+    code = compile(scVarPattern.sub(r'_sc_\1', vi).strip(), '<sbp>', 'eval')
+    return code, names, keys
+
+@lru_cache(maxsize=65536)
+def evalSC(vi:str, values:tuple) -> float:
+    '''Evaluate the compiled expression vi, where values holds the values of the variables in the order that compileSC found them'''
+    code, names, keys = compileSC(vi)
+    return float(eval(code, {}, dict(zip(keys, values))))
+
 def floatSC(vi:Union[str, float], vardefs:dict) -> float:
     '''Evaluate the expression vi with the values of any variables'''
     try:
         vout = float(vi)
     except:
         if type(vi) is str:
-            for key, val in vardefs.items():
-                vi = vi.replace(f'&{key}', str(val))
             try:
-                vout = eval(vi)
+                code, names, keys = compileSC(vi)
+                values = []
+                for key in names:
+                    val = vardefs[key]
+                    if type(val) is str:
+                        val = floatSC(val, vardefs)   # variable defined by another expression
+                    values.append(val)
+                vout = evalSC(vi, tuple(values))
             except:
                 print(vi)
                 raise TypeError('Cannot convert to float')
@@ -117,6 +138,7 @@ def strSimplify(vi:Union[str, float], defdict:dict) -> str:
 
     vin = vi.replace('&', 'UND')   # replace & character because sy.simplify will try to translate it if you left any variable names in there
 
+    import sympy as sy   # sympy is slow to import, so only load it when a file has expressions to simplify
     try:
         vout = sy.simplify(vin)
     except:
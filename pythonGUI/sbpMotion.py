@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+'''Functions for predicting the motion of the stage from a shopbot file'''
+
+# external packages
+import os
+import sys
+from typing import List, Dict, Tuple, Union, Any, TextIO
+import logging
+import numpy as np
+
+# local packages
+from sbpRead import *
+
+#-----------------------------------------------------
+
+def trapezoidDistance(t:float, L:float, vi:float, v:float, vo:float, a:float) -> float:
+    '''distance traveled t seconds into a move of length L that starts at speed vi, ramps at acceleration a up to at most speed v, and ramps down to vo at the end. After the end of the move, keep going at vo'''
+    if not np.isfinite(a) or a<=0 or v<=0:
+        return v*t
+    vi = min(vi, v)
+    vo = min(vo, v)
+    vp = min(v, np.sqrt(max((2*a*L+vi**2+vo**2)/2, 0)))   # peak speed
+    vp = max(vp, vi, vo)
+    t1 = (vp-vi)/a                  # time ramping up
+    d1 = (vp**2-vi**2)/(2*a)        # distance ramping up
+    d3 = (vp**2-vo**2)/(2*a)        # distance ramping down
+    d2 = max(L-d1-d3, 0)            # distance at peak speed
+    t2 = d2/vp
+    t3 = (vp-vo)/a                  # time ramping down
+    if t<=0:
+        return 0
+    if t<=t1:
+        return vi*t+a*t**2/2
+    if t<=t1+t2:
+        return d1+vp*(t-t1)
+    if t<=t1+t2+t3:
+        tau = t-t1-t2
+        return d1+d2+vp*tau-a*tau**2/2
+    return d1+d2+d3+vo*(t-t1-t2-t3)
+
+
+def formatDuration(t:float) -> str:
+    '''format a time in s as h:mm:ss'''
+    t = int(round(t))
+    return f'{t//3600}:{(t%3600)//60:02d}:{t%60:02d}'
+
+
+class motionModel:
+    '''predicts the time and position of the stage for each row of a point table, using a trapezoidal speed profile from the VR values in the header.
+    The ramp speed is the speed the stage starts and stops at. The ramp rate is treated as the distance over which the stage ramps from the ramp speed to the move speed.
+    At each corner, the speed drops toward the slow corner speed as the change in direction approaches the 3D ramp threshold, and past the threshold, the stage ramps down to the ramp speed. Moves shorter than the minimum distance don't slow corners.
+    Rows with no translation speed, like PAUSE and SO steps, stop the stage. Rows that change an output flag hold for flagTime s, the time the SB3 software takes to set the output, so every output state lasts long enough to be read from the registry'''
+
+    def __init__(self, points:pointTable, header:SBPHeader, flagTime:float=0.05):
+        self.flagTime = flagTime
+        self.readHeader(header)
+        self.n = len(points)
+        self.findSegments(points)
+        self.planJunctions()
+        self.calcTimes(points)
+
+    def headerVal(self, header:SBPHeader, key:str, default:float) -> float:
+        '''get a value from the header, or the default if it is not there'''
+        if not hasattr(header, key):
+            return default
+        try:
+            return float(header.floatSC(getattr(header, key)))
+        except TypeError:
+            return default
+
+    def readHeader(self, header:SBPHeader) -> None:
+        '''get the ramp values from the header'''
+        self.rampSpeed = self.headerVal(header, 'ramp_speed_move_xy', np.inf)   # no ramping unless the header says so
+        self.rampRate = self.headerVal(header, 'move_ramp_rate', 0)
+        self.thresh = self.headerVal(header, '3D_ramp_thresh', 100)
+        self.minDist = self.headerVal(header, 'min_distance', 0)
+        self.slowCorner = self.headerVal(header, 'slow_corner_speed', 100)/100
+        if not self.thresh>0:
+            self.thresh = 100
+
+    #-----------
+
+    def findSegments(self, points:pointTable) -> None:
+        '''find the start and end of each move'''
+        n = self.n
+        xyz = points.xyz.copy()
+        # carry coordinates forward. before a coordinate is defined, use the first defined value so the stage doesn't move along that axis
+        for j in range(3):
+            col = xyz[:,j]
+            valid = ~np.isnan(col)
+            if not valid.any():
+                col[:] = 0
+                continue
+            idx = np.where(valid, np.arange(n), 0)
+            np.maximum.accumulate(idx, out=idx)
+            col[:] = np.where(valid[idx], col[idx], col[np.argmax(valid)])
+        self.end = xyz                                  # (n,3) position at the end of each row
+        self.start = np.empty_like(xyz)                 # (n,3) position at the start of each row
+        if n>0:
+            self.start[0] = xyz[0]
+            self.start[1:] = xyz[:-1]
+        self.length = np.linalg.norm(self.end-self.start, axis=1)
+        speed = points.speed
+        self.cruise = np.where(np.isnan(speed), 0, speed)   # move speed
+        self.dwell = points.dwell.copy()
+        self.flagChanges = (points.before!=points.after).any(axis=1) if len(points.channels)>0 else np.zeros(n, dtype=bool)   # rows that end in a flag change
+        self.moving = (self.length>0)&(self.cruise>0)          # rows where the stage moves
+        self.stops = (self.cruise==0)&~np.isnan(speed)|(self.dwell>0)   # rows where the stage stops
+        self.accel = np.full(n, np.inf)
+        ramped = self.moving&(self.cruise>self.rampSpeed)&(self.rampRate>0)
+        self.accel[ramped] = (self.cruise[ramped]**2-self.rampSpeed**2)/(2*self.rampRate)
+
+    def junctionSpeed(self, i:int, j:int, stop:bool) -> float:
+        '''get the speed at the corner between moving rows i and j'''
+        vmin = min(self.cruise[i], self.cruise[j])
+        v0 = min(self.rampSpeed, vmin)
+        if stop:
+            return v0
+        if self.length[i]<self.minDist or self.length[j]<self.minDist:
+            return vmin
+        ui = (self.end[i]-self.start[i])/self.length[i]
+        uj = (self.end[j]-self.start[j])/self.length[j]
+        change = 50*(1-np.dot(ui, uj))   # 0 for straight lines, 100 for a reversal
+        if change>=self.thresh:
+            return v0
+        return max(v0, vmin*(1-(1-self.slowCorner)*change/self.thresh))
+
+    def planJunctions(self) -> None:
+        '''find the speed at the start and end of each move, so the stage can always ramp between them'''
+        n = self.n
+        self.vIn = np.zeros(n)
+        self.vOut = np.zeros(n)
+        rows = np.flatnonzero(self.moving)
+        m = len(rows)
+        if m==0:
+            return
+        stopCount = np.cumsum(self.stops)
+        J = np.zeros(m+1)   # speed at each junction, including the start of the first move and end of the last
+        J[0] = min(self.rampSpeed, self.cruise[rows[0]])
+        J[m] = min(self.rampSpeed, self.cruise[rows[-1]])
+        for k in range(1, m):
+            i = rows[k-1]
+            j = rows[k]
+            stop = stopCount[j-1]-stopCount[i]>0   # a pause or flag step between the moves
+            J[k] = self.junctionSpeed(i, j, stop)
+        # make sure the stage can ramp between junctions
+        for k in range(m-1, -1, -1):
+            i = rows[k]
+            J[k] = min(J[k], np.sqrt(J[k+1]**2+2*self.accel[i]*self.length[i]))
+        for k in range(m):
+            i = rows[k]
+            J[k+1] = min(J[k+1], np.sqrt(J[k]**2+2*self.accel[i]*self.length[i]))
+        self.vIn[rows] = J[:-1]
+        self.vOut[rows] = J[1:]
+
+    def calcTimes(self, points:pointTable) -> None:
+        '''get the duration of each row and the cumulative time and distance'''
+        L = self.length
+        v = self.cruise
+        a = self.accel
+        vi = self.vIn
+        vo = self.vOut
+        dur = np.zeros(self.n)
+        m = self.moving
+        ramped = m&np.isfinite(a)
+        flat = m&~ramped
+        dur[flat] = L[flat]/v[flat]
+        if ramped.any():
+            Lr, vr, ar, vir, vor = L[ramped], v[ramped], a[ramped], vi[ramped], vo[ramped]
+            vp = np.minimum(vr, np.sqrt((2*ar*Lr+vir**2+vor**2)/2))
+            vp = np.maximum(vp, np.maximum(vir, vor))
+            d1 = (vp**2-vir**2)/(2*ar)
+            d3 = (vp**2-vor**2)/(2*ar)
+            d2 = np.maximum(Lr-d1-d3, 0)
+            dur[ramped] = (vp-vir)/ar + d2/vp + (vp-vor)/ar
+        dur = dur+self.dwell+np.where(self.flagChanges, self.flagTime, 0)
+        self.tEnd = np.cumsum(dur)          # time at the end of each row, in s
+        self.tStart = self.tEnd-dur         # time at the start of each row, in s
+        self.sEnd = np.cumsum(np.where(m, L, 0))   # distance traveled at the end of each row
+
+    #-----------
+
+    @property
+    def duration(self) -> float:
+        '''predicted time to run the whole file, in s'''
+        if self.n==0:
+            return 0
+        return float(self.tEnd[-1])
+
+    def profile(self, i:int) -> Tuple[float, float, float, float]:
+        '''get the start speed, move speed, end speed, and acceleration of row i'''
+        return float(self.vIn[i]), float(self.cruise[i]), float(self.vOut[i]), float(self.accel[i])
+
+    def rowAt(self, t:float) -> int:
+        '''get the row that the stage is on at time t'''
+        i = int(np.searchsorted(self.tEnd, t, side='right'))
+        return min(i, self.n-1)
+
+    def position(self, t:float) -> List[float]:
+        '''predict the position of the stage t seconds after the start of the file'''
+        if self.n==0:
+            return [np.nan, np.nan, np.nan]
+        i = self.rowAt(t)
+        L = self.length[i]
+        if not self.moving[i]:
+            return list(self.end[i])
+        s = trapezoidDistance(t-self.tStart[i], L, *self.profile(i))
+        frac = min(s/L, 1)
+        return list(self.start[i]+frac*(self.end[i]-self.start[i]))
@@ -6,7 +6,6 @@ import os
 import sys
 import re
 from typing import List, Dict, Tuple, Union, Any, TextIO
-import pandas as pd
 import logging
 import numpy as np
 
@@ -18,7 +17,12 @@ from sbpConvert import *
 class SBPHeader:
     '''read header data from the current shopbot file and return an object'''
     
-    def __init__(self, sbpName:str):
+    def __init__(self, sbpName:str, f:TextIO=None, d:dict=None):
+        '''if f is an open file, read the header from f and store the first line after the header in endLine. if d is a dictionary of header values, e.g. from the point cache, use those instead of reading the file'''
+        if d is not None:
+            for key,val in d.items():
+                setattr(self, key, val)
+            return
         if not os.path.exists(sbpName):
             return
         self.SBPfile=os.path.basename(sbpName)
@@ -26,13 +30,20 @@ class SBPHeader:
         self.vardefs = {}
         
         # read the header into the dictionary
-        with open(sbpName, mode='r') as f:
-            cont = True
-            while cont:
-                l = f.readline()
-                self.hrows+=1
-                cont = self.readLine(l)
-            # self.hrows-=1
+        if f is None:
+            with open(sbpName, mode='r') as f:
+                self.readHeader(f)
+        else:
+            self.endLine = self.readHeader(f)
+            
+    def readHeader(self, f:TextIO) -> str:
+        '''read lines from the file until the header ends. return the line that ended the header'''
+        cont = True
+        while cont:
+            l = f.readline()
+            self.hrows+=1
+            cont = self.readLine(l)
+        return l
                 
     def readToDict(self, spl:List[str], idict:dict) -> dict:
         '''given a dictionary of indices and names, read values into the dictionary'''
@@ -194,7 +205,7 @@ class SBPHeader:
     
     def print(self) -> None:
         for key in self.__dict__:
-            if not key in ['vardefs']:
+            if not key in ['vardefs', 'endLine']:
                 print(f'{key}: {getattr(self, key)}')
 
 
@@ -210,7 +221,7 @@ class SBPHeader:
                 units[s.lower()] = ''
 
         for key in self.__dict__:
-            if not key in ['vardefs', 'hrows']:
+            if not key in ['vardefs', 'hrows', 'endLine']:
                 u = ''
                 if key.startswith('&') or key in ['circle']:
                     u = units['xyz']
@@ -243,121 +254,370 @@ class SBPHeader:
         '''Evaluate the expression vi with the values of all variables'''
         return floatSC(vi, self.vardefs)
     
+    def toDict(self) -> dict:
+        '''get the header values as a dictionary'''
+        return dict([[key, val] for key,val in self.__dict__.items() if not key=='endLine'])
     
     
+    
+def toFloat(v:Any) -> float:
+    '''convert a coordinate to a float, or NaN if it is blank'''
+    if v is None or (type(v) is str and len(v.strip())==0):
+        return np.nan
+    return float(v)
+
+
+class xyzPoint:
+    '''a position of the stage, with the line number and translation speed if it came from a row of the sbp file. Coordinates that are missing or blank are stored as NaN, so the math on the points never has to check types'''
+    __slots__ = ['x', 'y', 'z', 'line', 'speed']
+
+    def __init__(self, x:float=np.nan, y:float=np.nan, z:float=np.nan, line:int=-1, speed:float=np.nan):
+        self.x = toFloat(x)
+        self.y = toFloat(y)
+        self.z = toFloat(z)
+        self.line = int(line)     # line in the sbp file, -1 if the point is not from the file
+        self.speed = toFloat(speed)
+
+    def __iter__(self):
+        return iter((self.x, self.y, self.z))
+
+    def __repr__(self) -> str:
+        return f'xyzPoint({self.x}, {self.y}, {self.z}, line={self.line}, speed={self.speed})'
+
+    @property
+    def inFile(self) -> bool:
+        '''this point came from a row of the sbp file'''
+        return self.line>=0
+
+    @property
+    def defined(self) -> bool:
+        '''all of the coordinates are numbers'''
+        return self.x==self.x and self.y==self.y and self.z==self.z
+
+    def xyz(self) -> List[float]:
+        '''get the coordinates as a list'''
+        return [self.x, self.y, self.z]
+
+    def delta(self, p2:'xyzPoint') -> Tuple[float,float,float]:
+        '''get the difference from this point to p2. If a coordinate is missing in either point, its difference is 0'''
+        dx = p2.x-self.x
+        dy = p2.y-self.y
+        dz = p2.z-self.z
+        # NaN is the only value that is not equal to itself
+        return (dx if dx==dx else 0), (dy if dy==dy else 0), (dz if dz==dz else 0)
+
+    def equals(self, p2:'xyzPoint') -> bool:
+        '''the coordinates of the two points are the same'''
+        return self.x==p2.x and self.y==p2.y and self.z==p2.z
+
+
+
+sbpParserVersion = 2    # increase this when the parser or the point table changes, so cached tables are rebuilt
+
+class pointTable:
+    '''columnar table of the points in a shopbot file. Coordinates, line numbers, and speeds are typed arrays, and the flag states are int8 matrices with one column per channel.
+    In the flag matrices, 0 and 1 are flag states, and -1 means that the row does not hold a state for that channel. Rows that only change the ink speed have a NaN speed, and store the channel and new speed in inkChannel and inkSpeed'''
+    columns = ['xyz', 'line', 'speed', 'before', 'after', 'inkChannel', 'inkSpeed', 'dwell']
+
+    def __init__(self, channels:list, xyz:np.ndarray, line:np.ndarray, speed:np.ndarray, before:np.ndarray, after:np.ndarray, inkChannel:np.ndarray, inkSpeed:np.ndarray, dwell:np.ndarray):
+        self.channels = [int(c) for c in channels]   # 0-indexed flags, one column in before and after for each
+        self.col = dict([[c,i] for i,c in enumerate(self.channels)])   # column of each flag in the flag matrices
+        self.xyz = np.ascontiguousarray(xyz, dtype=np.float64)       # (n,3) x,y,z coordinates, NaN if not defined
+        self.line = np.ascontiguousarray(line, dtype=np.int32)       # line number in the sbp file
+        self.speed = np.ascontiguousarray(speed, dtype=np.float64)   # translation speed, NaN for ink speed rows
+        self.before = np.ascontiguousarray(before, dtype=np.int8)    # (n, channels) flag state at the start of the move
+        self.after = np.ascontiguousarray(after, dtype=np.int8)      # (n, channels) flag state at the end of the move
+        self.inkChannel = np.ascontiguousarray(inkChannel, dtype=np.int8)   # channel whose ink speed changes at this row, -1 if none
+        self.inkSpeed = np.ascontiguousarray(inkSpeed, dtype=np.float64)    # new ink speed, NaN if none
+        self.dwell = np.ascontiguousarray(dwell, dtype=np.float64)          # time in s that the stage waits at this row, from PAUSE
+        self.updateValid()
+        self.findTransitions()
+
+    def updateValid(self) -> None:
+        '''find the previous and next rows with coordinates for each row. -1 if there is none. Run this again if the coordinates change'''
+        n = len(self.line)
+        i = np.arange(n, dtype=np.int32)
+        valid = ~np.isnan(self.xyz[:,0])
+        upTo = np.maximum.accumulate(np.where(valid, i, -1)) if n>0 else i      # last valid row at or before each row
+        fromi = np.minimum.accumulate(np.where(valid, i, n)[::-1])[::-1] if n>0 else i   # first valid row at or after each row
+        self.prevValid = np.full(n, -1, dtype=np.int32)
+        self.prevValid[1:] = upTo[:-1]
+        self.nextValid = np.full(n, -1, dtype=np.int32)
+        self.nextValid[:-1] = np.where(fromi[1:]<n, fromi[1:], -1)
+
+    def __len__(self) -> int:
+        return len(self.line)
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.xyz[:,0]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.xyz[:,1]
+
+    @property
+    def z(self) -> np.ndarray:
+        return self.xyz[:,2]
+
+    def arrays(self) -> dict:
+        '''get a dictionary of the arrays in the table'''
+        return dict([[s, getattr(self, s)] for s in pointTable.columns])
+
+    @property
+    def nbytes(self) -> int:
+        '''memory held by the table'''
+        return sum([getattr(self, s).nbytes for s in pointTable.columns])
+
+    def copy(self) -> 'pointTable':
+        '''copy the table. The coordinates are copied so they can be filled in, and the other columns are shared'''
+        return pointTable(self.channels, self.xyz.copy(), self.line, self.speed, self.before, self.after, self.inkChannel, self.inkSpeed, self.dwell)
+
+    def point(self, i:int) -> xyzPoint:
+        '''get the coordinates, line, and speed of a single row as a point'''
+        x,y,z = self.xyz[i].tolist()
+        return xyzPoint(x, y, z, int(self.line[i]), float(self.speed[i]))
+
+    def flowStep(self, i:int) -> bool:
+        '''this row has no translation speed, so it only changes the flow speed'''
+        return bool(np.isnan(self.speed[i]))
+
+    def flagChange(self, i:int) -> bool:
+        '''any flag changes at the end of row i'''
+        return bool((self.before[i]!=self.after[i]).any())
+
+    def flagState(self, i:int, flag0:int) -> Tuple[int,int]:
+        '''get the state of the 0-indexed flag at the start and end of row i. -1 if there is no state'''
+        if i<0 or i>=len(self.line) or not flag0 in self.col:
+            return -1,-1
+        c = self.col[flag0]
+        return int(self.before[i,c]), int(self.after[i,c])
+
+    def findTransitions(self) -> None:
+        '''find the sorted rows and line numbers where each flag turns on and off'''
+        self.onRows = {}
+        self.offRows = {}
+        self.onLines = {}
+        self.offLines = {}
+        for flag0,c in self.col.items():
+            b = self.before[:,c]
+            a = self.after[:,c]
+            self.onRows[flag0] = np.flatnonzero((b==0)&(a==1))
+            self.offRows[flag0] = np.flatnonzero((b==1)&(a==0))
+            self.onLines[flag0] = self.line[self.onRows[flag0]]
+            self.offLines[flag0] = self.line[self.offRows[flag0]]
+
+    def transitions(self, flag0:int, on:bool) -> np.ndarray:
+        '''get the indices of the rows where the flag turns on or off'''
+        if on:
+            d = self.onRows
+        else:
+            d = self.offRows
+        return d.get(flag0, np.zeros(0, dtype=np.int64))
+
+    def transitionLines(self, flag0:int, on:bool) -> np.ndarray:
+        '''get the line numbers where the flag turns on or off'''
+        if on:
+            d = self.onLines
+        else:
+            d = self.offLines
+        return d.get(flag0, np.zeros(0, dtype=np.int32))
+
+    def toDataFrame(self) -> 'pd.DataFrame':
+        '''convert the table to a dataframe in the format of the old csv export'''
+        import pandas as pd   # pandas is slow to import, so only load it when we export
+        d = {'x':self.x, 'y':self.y, 'z':self.z, 'line':self.line}
+        ink = self.inkChannel>=0
+        for c in self.channels:
+            for s in ['before', 'after']:
+                vals = getattr(self, s)[:,self.col[c]].astype(np.float64)
+                vals[vals<0] = np.nan
+                vals[ink] = np.nan
+                if s=='before':
+                    vals[self.inkChannel==c] = -1000    # -1000 is code for "change speed"
+                else:
+                    vals[self.inkChannel==c] = self.inkSpeed[self.inkChannel==c]
+                d[f'p{c}_{s}'] = vals
+        d['speed'] = self.speed
+        return pd.DataFrame(d)
+
+
 class SBPPoints:
     '''this class holds methods and structures to track where the stage should be, and what state the pressure controller should be in'''
-    
+
     def __init__(self, file:str):
         if not file.endswith('.sbp'):
             raise ValueError('Input to SBPPoints must be an SBP file')
-        self.header = SBPHeader(file)  # scrape variables
-        self.line = 0 
-        if hasattr(self.header, 'speed_move_xy'):
-            self.ms = self.header.speed_move_xy 
+        self.file = file
+        self.line = 0
+        self.channels = []    # 0-indexed flags that have a column in the table
+        self.triggered = []   # 0-indexed flags that are turned on in the file, in the order they are first turned on
+        self.cp = [np.nan, np.nan, np.nan]
+        self.pressures = {}
+        self.initColumns()
+        with open(file, mode='r') as f:
+            # read the header, then the points, in one pass through the file
+            self.header = SBPHeader(file, f)  # scrape variables
+            if hasattr(self.header, 'speed_move_xy'):
+                self.ms = self.floatSC(self.header.speed_move_xy)
+            else:
+                raise ValueError(f'Missing move speed definition in {file}')
+            if hasattr(self.header, 'speed_jog_xy'):
+                self.js = self.floatSC(self.header.speed_jog_xy)
+            else:
+                self.js = np.nan
+            self.appendRow(self.header.hrows, 0)    # starting point
+            self.scrapeFile(f)
+        self.points = self.buildTable()
+
+    def initColumns(self) -> None:
+        '''create lists to collect the columns while we read the file'''
+        self.cols = dict([[s, []] for s in ['x', 'y', 'z', 'line', 'speed', 'inkChannel', 'inkSpeed', 'dwell']])
+        self.col = {}       # column of each flag in the flag lists
+        self.before = []    # one list of flag states per channel
+        self.after = []
+        self.lastPoint = 0   # index of the last row that isn't an ink speed change
+
+    def addChannel(self, channel:int, triggered:bool) -> None:
+        '''add a column for a channel. Triggered channels are off in all of the points so far. Otherwise, the channel has no state'''
+        if triggered:
+            fill = 0
         else:
-            raise ValueError(f'Missing move speed definition in {file}')
-        if hasattr(self.header, 'speed_jog_xy'):
-            self.js = self.header.speed_jog_xy
+            fill = -1
+        states = [fill if c<0 else -1 for c in self.cols['inkChannel']]   # ink speed rows have no state
+        if channel in self.col:
+            self.before[self.col[channel]] = states
+            self.after[self.col[channel]] = list(states)
         else:
-            self.js = np.nan
-        self.file = file
-        self.channels = channelsTriggered(file)
-        self.cp = ['','','']
-        self.points = [{'x':'', 'y':'', 'z':'', 'line':self.header.hrows}]   # list of dictionary points
-        self.pressures = dict([[i,0] for i in self.channels])   
-        for channel in self.channels:
-            self.points[0][f'p{channel}_before'] = 0
-            self.points[0][f'p{channel}_after'] = 0
-        self.points[0]['speed'] = 0
-        self.scrapeFile()
-        
-        
-    def scrapeFile(self) -> None:
-        '''scrape lines from the file into the list of points'''
-        # read the header into the dictionary
-        with open(self.file, mode='r') as f:
-            for i in range(self.header.hrows):
-                self.line+=1
-                l = f.readline()
-            while len(l)>0:
-                self.readLine(l)    # interpret the line
-                self.lastLine = l   # store the line
-                self.line+=1
-                l = f.readline()    # get a new line
-                
-                
-                
+            self.channels.append(channel)
+            self.col[channel] = len(self.channels)-1
+            self.before.append(states)
+            self.after.append(list(states))
+
+    def triggerChannel(self, channel:int) -> None:
+        '''the channel turns on for the first time'''
+        self.triggered.append(channel)
+        self.addChannel(channel, True)
+
+    def appendRow(self, line:int, speed:float, dwell:float=0) -> None:
+        '''add a row with the current position and flag states'''
+        for i,s in enumerate(['x', 'y', 'z']):
+            self.cols[s].append(self.cp[i])
+        self.cols['line'].append(line)
+        self.cols['speed'].append(speed)
+        self.cols['inkChannel'].append(-1)
+        self.cols['inkSpeed'].append(np.nan)
+        self.cols['dwell'].append(dwell)
+        for c,i in self.col.items():
+            if c in self.triggered:
+                p = int(self.pressures[c])
+            else:
+                p = -1
+            self.before[i].append(p)
+            self.after[i].append(p)
+        self.lastPoint = len(self.cols['line'])-1
+
+    def buildTable(self) -> pointTable:
+        '''convert the column lists into a table of arrays'''
+        n = len(self.cols['line'])
+        xyz = np.empty((n,3), dtype=np.float64)
+        for i,s in enumerate(['x', 'y', 'z']):
+            xyz[:,i] = self.cols[s]
+        nc = len(self.channels)
+        before = np.empty((n, nc), dtype=np.int8)
+        after = np.empty((n, nc), dtype=np.int8)
+        for i in range(nc):
+            before[:,i] = self.before[i]
+            after[:,i] = self.after[i]
+        return pointTable(self.channels, xyz, self.cols['line'], self.cols['speed'], before, after, self.cols['inkChannel'], self.cols['inkSpeed'], self.cols['dwell'])
+
+    def scrapeFile(self, f:TextIO) -> None:
+        '''scrape lines from the open file into the list of points, starting with the line that ended the header'''
+        self.line = self.header.hrows
+        l = self.header.endLine
+        while len(l)>0:
+            self.readLine(l)    # interpret the line
+            self.lastLine = l   # store the line
+            self.line+=1
+            l = f.readline()    # get a new line
+
+
+
     def floatSC(self, vi:Union[str, float]) -> float:
         '''evaluate the expression vi with the variable dictionary'''
         return floatSC(vi, self.header.vardefs)
-    
-    def addPoint(self, command:str) -> None:
+
+    def addPoint(self, command:str, dwell:float=0) -> None:
         '''add the current point to the list'''
-        p1 = {'line':self.line, 'x':self.cp[0], 'y':self.cp[1], 'z':self.cp[2]}
-        # print(self.pressures)
-        for c in self.channels:
-            for s in ['before', 'after']:
-                p1[f'p{c}_{s}'] = self.pressures[c]
         if command.startswith('M'):
-            p1['speed'] = self.ms
+            speed = self.ms
         elif command.startswith('J'):
-            p1['speed'] = self.js
-        elif command.startswith('PAUSE'):
-            p1['speed'] = 0
+            speed = self.js
         else:
-            p1['speed'] = 0
-        # if p1['speed']==0 and len(self.points)>1:
-        #     # only add this point if we're changing channels
-        #     add = False
-        #     for c in self.channels:
-        #         if not p1[f'p{c}_before'] == p1[f'p{c}_after']:
-        #             add = True
-        #     if add:
-        #         self.points.append(p1)
-        #     else:
-        #         print(self.points)
-        # else:
-        #     self.points.append(p1)
-        self.points.append(p1)
+            speed = 0
+        self.appendRow(self.line, speed, dwell)
         
+    def readPause(self, l:str) -> None:
+        '''read a PAUSE line. PAUSE without a time waits for the user, so we can't predict the dwell time'''
+        t = l.strip()[5:].strip(' ,')
+        if len(t)==0:
+            dwell = 0
+        elif not all([name in self.header.vardefs for name in scVarPattern.findall(t)]):
+            # the time uses a variable that is not defined in the file, so it is only known when the file runs
+            dwell = 0
+        else:
+            try:
+                dwell = self.floatSC(t)
+            except TypeError:
+                dwell = 0
+        self.addPoint('PAUSE', dwell)
+
     def changeInkSpeed(self, command:str) -> None:
         '''add a change of ink speed to the list'''
         spl = re.split('=', command)
-        channel = spl[0][-1]
+        channel = int(spl[0][-1])
         val = float(spl[1])
-        self.points.append({'line':self.line, f'p{channel}_before':-1000, f'p{channel}_after':val})  # -1000 is code for "change speed"    
-        
+        if not channel in self.col:
+            self.addChannel(channel, False)
+        for s in ['x', 'y', 'z', 'speed']:
+            self.cols[s].append(np.nan)
+        self.cols['line'].append(self.line)
+        self.cols['inkChannel'].append(channel)
+        self.cols['inkSpeed'].append(val)
+        self.cols['dwell'].append(0)
+        for i in range(len(self.channels)):
+            self.before[i].append(-1)
+            self.after[i].append(-1)
+
     def readLineSO(self, spl:list) -> None:
         '''read an SO line'''
         if hasattr(self, 'lastLine'):
             if self.lastLine.startswith('SO'):
                 # turned off/on
                 self.addPoint('')
-                
+
         # get the flag
         li = spl[1]
         if type(li) is str:
             if li[1:] in self.header.vardefs:
-                channel = self.header.vardefs[li[1:]]-1
+                channel = int(self.floatSC(li))-1
             else:
                 print(self.header.vardefs)
                 raise ValueError(f'Missing pressure channel in header: {li}')
         else:
             channel = int(spl[1])-1 # shopbot flags are 1-indexed, but we store 0-indexed
-            
+
         # get the value we're setting the flag to
-        self.pressures[channel] = spl[2]
-
-        # note that the previous point ends in a flag change
-        i = -1
-        plast = self.points[i]
-        while (not f'p{int(channel)}_after' in plast or plast[f'p{int(channel)}_before']<0) and i>-len(self.points):
-            i = i-1
-            plast = self.points[i]
-        if f'p{int(channel)}_after' in plast and plast[f'p{int(channel)}_after'] in [0,1]:
-            self.points[i][f'p{int(channel)}_after'] = self.pressures[channel]   # 0-indexed
-            
+        self.pressures[channel] = self.floatSC(spl[2])
+        if self.pressures[channel]==1 and not channel in self.triggered:
+            self.triggerChannel(channel)
+
+        # note that the last point ends in a flag change
+        if channel in self.triggered:
+            after = self.after[self.col[channel]]
+            if after[self.lastPoint] in [0,1]:
+                after[self.lastPoint] = int(self.pressures[channel])
+
     def readLineMove(self, spl:list) -> None:
         '''read a move'''
         if spl[0][1] in ['X', 'Y', 'Z']:
@@ -370,11 +630,11 @@ class SBPPoints:
         elif spl[0][1] =='S':
             # change translation speed
             if spl[0][0]=='M':
-                self.ms = spl[1]
+                self.ms = self.floatSC(spl[1])
             elif spl[0][0]=='J':
-                self.js = spl[1]
+                self.js = self.floatSC(spl[1])
         self.addPoint(spl[0])
-            
+
     def readLine(self, l:str) -> None:
         '''read a line into the list of points'''
         spl = splitStrip(l)
@@ -383,19 +643,15 @@ class SBPPoints:
         elif spl[0][0] in ['M', 'J']:
             self.readLineMove(spl)
         elif spl[0].startswith('PAUSE'):
-            self.addPoint('PAUSE')
+            self.readPause(l)
         elif spl[0].startswith('\'ink_speed'):
             self.changeInkSpeed(spl[0])
-            
-            
+
+
     def export(self) -> None:
         '''export the points table to file'''
-        df = pd.DataFrame(self.points)
+        df = self.points.toDataFrame()
         fn = self.file.replace('.sbp', '.csv')
         df.to_csv(fn)
         print(f'Exported points to {fn}')
-            
-      
-
-    
 
@@ -9,11 +9,17 @@ from typing import List, Dict, Tuple, Union, Any, TextIO
 import logging
 import csv
 import re
-import win32gui, win32api, win32con
+try:
+    import win32gui, win32api, win32con
+except ModuleNotFoundError:
+    win32gui = None   # not on windows. there are no SB3 windows to manage
 import time
 import datetime
 import traceback
-import pyautogui
+try:
+    import pyautogui
+except ModuleNotFoundError:
+    pyautogui = None
 
 # local packages
 from config import cfg
@@ -27,6 +33,10 @@ from sbpRead import *
 from sbprintChannel import *
 from sbprintWatch import *
 from sbprintDiag import *
+from sbKeyBackend import *
+from sbprintTiming import *
+from sbprintTelemetry import *
+from sbprintTable import *
 
 
 ##################################################  
@@ -189,6 +199,7 @@ class waitForReady(QRunnable):
     @pyqtSlot()
     def run(self) -> None:
         '''check the shopbot status'''
+        scheduler = tickScheduler(self.dt, self.keys.clock, self.keys.sleep)
         while True:
             self.keys.lock()
             ready = self.keys.SBisReady()
@@ -198,7 +209,7 @@ class waitForReady(QRunnable):
                 self.signals.finished.emit()
                 return
             else:
-                time.sleep(self.dt/1000)  # loop every self.dt seconds
+                scheduler.wait()  # loop every self.dt ms
         
 #-----------------------------------------------
 
@@ -221,6 +232,7 @@ class waitForStart(QRunnable):
       
     @pyqtSlot()
     def run(self):
+        scheduler = tickScheduler(self.dt, self.keys.clock, self.keys.sleep)
         while True:
             self.killSpindlePopup()
             self.keys.lock()
@@ -232,7 +244,7 @@ class waitForStart(QRunnable):
                 self.signals.finished.emit()
                 return
             else:
-                time.sleep(self.dt/1000)
+                scheduler.wait()
             
     @pyqtSlot(str,bool)
     def updateStatus(self, status:str, log:bool):
@@ -242,7 +254,7 @@ class waitForStart(QRunnable):
     
     def killSpindlePopup(self) -> None:
         '''if we use output flag 1 (1-indexed), the shopbot thinks we are starting the router/spindle and triggers a popup. Because we do not have a router/spindle on this instrument, this popup is irrelevant. This function automatically checks if the window is open and closes the window'''
-        if self.spindleKilled==3:
+        if self.spindleKilled==3 or win32gui is None:
             return
         hwndMain = win32gui.FindWindow(None, 'NOW STARTING ROUTER/SPINDLE !')
         if hwndMain>0:
@@ -277,6 +289,8 @@ class waitForStart(QRunnable):
     @pyqtSlot()
     def killSpindleUgly(self) -> None:
         '''actually kill the spindle'''
+        if pyautogui is None:
+            return
         pyautogui.moveTo(2106, 1181)
         pyautogui.click()
         self.spindleKilled = 2
@@ -287,6 +301,36 @@ class waitForStart(QRunnable):
 
 
     
+def connectFluigentSignals(sbWin, flag0:int, signals:channelWatchSignals) -> bool:
+    '''connect channel watch signals to the fluigent channels that use the 0-indexed flag. return True if any were connected'''
+    found = False
+    if hasattr(sbWin, 'fluBox') and hasattr(sbWin.fluBox, 'pchannels'):
+        for channel in sbWin.fluBox.pchannels:
+            if channel.flag1-1==flag0:
+                # connect signals to fluigent functions and calibration functions
+                found = True
+                signals.goToPressure.connect(channel.goToRunPressure)
+                signals.zeroChannel.connect(channel.zeroChannel)
+                signals.printStatus.connect(channel.updatePrintStatus)
+                if hasattr(sbWin, 'calibDialog'):
+                    if channel.chanNum0<len(sbWin.calibDialog.calibWidgets):
+                        calibBox = sbWin.calibDialog.calibWidgets[channel.chanNum0]
+                        signals.updateSpeed.connect(calibBox.updateSpeedAndPressure)
+    return found
+
+def connectCameraSignals(sbWin, flag0:int, signals:channelWatchSignals) -> bool:
+    '''connect channel watch signals to the camera that uses the 0-indexed flag. return True if one was connected'''
+    if hasattr(sbWin, 'camBoxes'):
+        fdict = sbWin.camBoxes.listFlags0()
+        if flag0 in fdict:
+            camBox = fdict[flag0]
+            # camBox.tempCheck()    # set the record checkbox to checked
+            # cw.signals.finished.connect(camBox.resetCheck)  # reset the checkbox when done
+            signals.snap.connect(camBox.cameraPic)   # connect signal to snap function
+            return True
+    return False
+
+
 class printLoopSignals(QObject):
     finished = pyqtSignal()   # print is done
     aborted = pyqtSignal()    # print was aborted from sbp app
@@ -304,9 +348,11 @@ class printLoop(QObject):
     keys is an SBKeys object
     sbpfile is the name of the sbp file '''
     
-    def __init__(self, dt:float, keys:QMutex, sbpfile:str, pSettings:dict, sbWin, sbRunFlag1:int):
+    def __init__(self, dt:float, keys:QMutex, sbpfile:str, pSettings:dict, sbWin, sbRunFlag1:int, modes:dict={}):
+        '''modes holds the behavior of each 0-indexed flag, 1 for fluigent and 2 for camera, if the devices are not in sbWin'''
         super(printLoop,self).__init__()
         self.dt = dt
+        self.givenModes = modes
         self.keys = keys    # holds windows registry keys
         self.signals = printLoopSignals()
         self.channelWatches = {}
@@ -323,17 +369,31 @@ class printLoop(QObject):
         self.timeTaken = False
         self.sbWin = sbWin
         self.sbRunFlag1 = sbRunFlag1
+        self.adaptive = cfg.shopbot.tick.adaptive      # shorten the period when a flag change is coming up
+        self.fastScale = cfg.shopbot.tick.fastScale    # fraction of the period to use when a flag change is coming up
+        self.horizon = cfg.shopbot.tick.horizon        # number of periods ahead to look for flag changes
+        self.scheduler = tickScheduler(dt, keys.clock, keys.sleep)
+        self.sbpfile = sbpfile
+        self.recorder = None     # records the keys read at each step, if telemetry is on
+        self.gate = changeGate() # only send the estimate and status to the GUI when they change
+        self.keys.gate.reset()   # send the first values of the new print to the GUI
+        self.timer = stageTimer(cfg.shopbot.tick.instrument)   # times the stages of each step
+        self.keys.timer = self.timer
+        self.stageNames = {}     # name of the stage timer for each channel
         self.setUpPointWatch(pSettings, dt, sbpfile)
         self.assignFlags()
         
         
     def setUpPointWatch(self, pSettings:dict, dt:float, sbpfile:str) -> None:
         '''set up the point watch object'''
-        camFlags = self.sbWin.camBoxes.listFlags0()
-        self.pw = pointWatch(pSettings, dt, self.diagStr, self, self.runSimple, list(camFlags.keys()))
+        if hasattr(self.sbWin, 'camBoxes'):
+            camFlags = self.sbWin.camBoxes.listFlags0()
+        else:
+            camFlags = {}
+        self.pw = pointWatch(pSettings, dt, self.diagStr, self, self.runSimple, list(camFlags.keys()), self.keys.clock)
         self.pw.signals.trusted.connect(self.updateTrusted)
         self.readKeys()   # intialize flag, loc
-        self.pw.readCSV(sbpfile)
+        self.pw.readSBP(sbpfile)
         
     # @pyqtSlot(str)
     # def updatePrintStatus(self, s:str) -> None:
@@ -347,46 +407,30 @@ class printLoop(QObject):
 
     @pyqtSlot()
     def assignFlags(self) -> None:
-        '''for each flag in the points csv, assign behaviors using a dictionary of channelWatch objects'''
+        '''for each flag in the points table, assign behaviors using a dictionary of channelWatch objects'''
         
         # create channels
-        for key in self.pw.points:
-            if key.startswith('p') and key.endswith('_before'):
-                # only take the before
-                spl = re.split('p|_', key)
-                flag0 = int(spl[1])   # 0-indexed
-                if not flag0==self.sbRunFlag1-1:
-                    self.channelWatches[flag0] = channelWatch(flag0, self.pSettings, self.diagStr, self.pw, self.keys.arduino.pins, self.runSimple)
+        for flag0 in self.pw.points.channels:
+            # flags are 0-indexed
+            if not flag0==self.sbRunFlag1-1:
+                self.channelWatches[flag0] = channelWatch(flag0, self.pSettings, self.diagStr, self.pw, self.keys.arduino.pins, self.runSimple)
+                self.stageNames[flag0] = f'assess flag {flag0+1}'
    
-        # assign behaviors to channels
-        if hasattr(self.sbWin, 'fluBox') and hasattr(self.sbWin.fluBox, 'pchannels'):
-            for channel in self.sbWin.fluBox.pchannels:
-                flag0 = channel.flag1-1
-                if flag0 in self.channelWatches:
-                    cw = self.channelWatches[flag0]
-                    # connect signals to fluigent functions and calibration functions
-                    cw.mode = 1
-                    self.modes.append(1)
-                    cw.signals.goToPressure.connect(channel.goToRunPressure)
-                    cw.signals.zeroChannel.connect(channel.zeroChannel)
-                    cw.signals.printStatus.connect(channel.updatePrintStatus)
-                    if hasattr(self.sbWin, 'calibDialog'):
-                        if channel.chanNum0<len(self.sbWin.calibDialog.calibWidgets):
-                            calibBox = self.sbWin.calibDialog.calibWidgets[channel.chanNum0]
-                            cw.signals.updateSpeed.connect(calibBox.updateSpeedAndPressure)
-
-        # assign behaviors to cameras
-        if hasattr(self.sbWin, 'camBoxes'):
-            fdict = self.sbWin.camBoxes.listFlags0()
-            for flag0 in fdict:
-                if flag0 in self.channelWatches:
-                    cw = self.channelWatches[flag0]
-                    cw.mode = 2
-                    self.modes.append(2)
-                    camBox = fdict[flag0]
-                    # camBox.tempCheck()    # set the record checkbox to checked
-                    # cw.signals.finished.connect(camBox.resetCheck)  # reset the checkbox when done
-                    cw.signals.snap.connect(camBox.cameraPic)   # connect signal to snap function
+        # assign behaviors to channels and cameras
+        for flag0,cw in self.channelWatches.items():
+            if connectFluigentSignals(self.sbWin, flag0, cw.signals):
+                cw.mode = 1
+                self.modes.append(1)
+        for flag0,cw in self.channelWatches.items():
+            if connectCameraSignals(self.sbWin, flag0, cw.signals):
+                cw.mode = 2
+                self.modes.append(2)
+                
+        # behaviors assigned by another process that holds the devices
+        for flag0,mode in self.givenModes.items():
+            if flag0 in self.channelWatches:
+                self.channelWatches[flag0].mode = mode
+                self.modes.append(mode)
                     
         self.defineHeader()
 
@@ -399,6 +443,8 @@ class printLoop(QObject):
     def killSBP(self) -> None:
         '''kill the print'''
         # print('killing sbp')
+        if win32gui is None:
+            return
         hwndMain = win32gui.FindWindow(None, 'ShopBotEASY')
         if hwndMain>0:
             # print('killing print')
@@ -449,21 +495,27 @@ class printLoop(QObject):
         
     def printRow(self):
         '''print the table and status if in the right mode. return status to the shopbot box'''
-        self.signals.status.emit(self.diagStr.status)
+        # statuses are events that stack up in the GUI, so only empty ones are suppressed
+        delivered = len(self.diagStr.status)>0
+        self.gate.count('status', delivered)
+        if delivered:
+            self.signals.status.emit(self.diagStr.status)
         self.diagStr.printRow()
 
 
     #-------------------------------------
     
-    def readKeys(self) -> None:
-        '''initialize the flag and locations'''
-        self.keys.lock()
-        self.sbFlag = self.keys.getSBFlag()   # gets flag and sends signal back to GUI from keys
-        self.pw.updateReadLoc(self.keys.getLoc())       # gets SB3 location and sends signal back to GUI from keys
-        self.runningSBP = self.keys.runningSBP   # checks if the stop button has been hit
-        self.pw.updateLastRead(self.keys.getLastRead())  # get the last line read into the shopbot. this is ahead of the line it is running
-        newDiag = self.keys.diag                # logging mode           
-        self.keys.unlock()
+    def readKeys(self, snap:keySnapshot=None) -> None:
+        '''initialize the flag and locations from a snapshot of the keys. If there is no snapshot, read the keys'''
+        if snap is None:
+            snap = self.keys.snapshot()    # gets flag, location, and last line, and sends signals back to GUI from keys
+        self.sbFlag = snap.flag
+        t0 = self.timer.start()
+        self.pw.updateReadLoc(snap.loc)
+        self.timer.stop('readLoc', t0)
+        self.runningSBP = snap.running   # checks if the stop button has been hit
+        self.pw.updateLastRead(snap.lastRead)  # get the last line read into the shopbot. this is ahead of the line it is running
+        newDiag = snap.diag                # logging mode           
         
         # update diagnostic mode
         if not hasattr(self, 'diag') or not newDiag==self.diag:
@@ -471,25 +523,28 @@ class printLoop(QObject):
             self.diagStr.diag = newDiag
     
     @pyqtSlot()
-    def updateState(self) -> None:
+    def updateState(self, snap:keySnapshot=None) -> None:
         '''get values from the keys'''
-        self.readKeys()
+        self.readKeys(snap)
         if not self.runSimple==1:
             est = self.pw.d.estimate
-            if len(est)>0 and type(est) is list:
-                self.signals.estimate.emit(est[0], est[1], est[2])  # update the estimate in the display
+            if est.defined and self.gate.changed('estimate', (round(est.x, 3), round(est.y, 3), round(est.z, 3))):
+                # update the estimate in the display, if it changed at the resolution of the display
+                self.signals.estimate.emit(est.x, est.y, est.z)
             # don't need to update the read point in display because flags.py already did it
             # determine if we can go onto the next point
+        t0 = self.timer.start()
         self.diagPosRow(newPoint=False)             # get diagnostic row
+        self.timer.stop('diag', t0)
 
     
     #---------------------------------
     # each new point
 
-    def updateSpeeds(self, t:dict):
-        '''update flow speeds'''
+    def updateSpeeds(self, i:int):
+        '''update flow speeds from row i of the points table'''
         for flag0, cw in self.channelWatches.items():
-            cw.updateSpeed(t)
+            cw.updateSpeed(i)
 
     def defineStates(self) -> None:
         ''''determine the state of the print, i.e. what we should watch for'''
@@ -499,22 +554,23 @@ class printLoop(QObject):
             
     def readPoint(self, letQueuedKill:bool=True) -> None:
         '''read a new point'''
-        t = self.pw.readPoint(letQueuedKill)   # get new target
-        if len(t)==0:
+        i = self.pw.readPoint(letQueuedKill)   # get index of new target
+        if i<0:
             # print('read point rejected')
             # read point was rejected
             return
-        if pd.isna(t['speed']):
+        if self.pw.points.flowStep(i):
             # this is just a flow speed step. adjust speeds and go to the next point
-            self.updateSpeeds(dict(t))
+            self.updateSpeeds(i)
             if self.diag>1:
                 self.diagStr.addStatus(f'Update flow speed')
             self.readPoint()
             return
         else:
             # this is a new point. update the channelWatches and update the gui
-            self.signals.target.emit(*toXYZ(t))          # update gui
-            self.signals.targetLine.emit(int(t['line']))
+            t = self.pw.d.target
+            self.signals.target.emit(t.x, t.y, t.z)          # update gui
+            self.signals.targetLine.emit(t.line)
             self.signals.speed.emit(self.pw.speed)     
             self.defineStates()
             # if self.diag>1:  
@@ -527,8 +583,8 @@ class printLoop(QObject):
     def flagDone(self) -> bool:
         return self.sbFlag==0
 
-    def evalState(self) -> bool:
-        '''determine what to do about the channels'''
+    def evalState(self, snap:keySnapshot=None) -> bool:
+        '''determine what to do about the channels. snap is a snapshot of the keys'''
         # get keys and position, new estimate position
     
         
@@ -537,73 +593,165 @@ class printLoop(QObject):
             if self.pw.printStarted():
                 self.printStarted = True
 
-        self.updateState()   # get status from sb3 and arduino, let pointWatch and distances recalculate 
+        self.updateState(snap)   # get status from sb3 and arduino, let pointWatch and distances recalculate 
         if self.runSimple==1 and self.flagDone():
             # print finished, end loop
             self.diagStr.addStatus('DONE flag off')
+            t0 = self.timer.start()
             self.printRow()
+            self.timer.stop('diag', t0)
             return True
 
         tc = False
         for flag0, cw in self.channelWatches.items():
             # determine if each channel has reached the action
+            t0 = self.timer.start()
             trustChanged = cw.assessPosition(self.sbFlag)
+            self.timer.stop(self.stageNames[flag0], t0)
             tc = tc or trustChanged
         
         if not self.pw.tableDone:
             if not tc and self.pw.readyForNextPoint():
                 # pointWatch says it's time for the next point
+                t0 = self.timer.start()
                 for cw in self.channelWatches.values():
                     # make any channels not attached to a trustworthy flag finish this move
                     cw.forceAction()
                 self.readPoint()
+                self.timer.stop('readPoint', t0)
 
             if self.pw.tableDone:
                 self.diagStr.addStatus('last pt hit')
             
+        t0 = self.timer.start()
         self.printRow()
+        self.timer.stop('diag', t0)
         return self.pw.tableDone and self.flagDone()
 
     #----------------------------
     
+    def adaptPeriod(self) -> None:
+        '''shorten the loop period while a flag change is expected soon'''
+        if not self.adaptive:
+            return
+        if self.pw.transitionSoon(self.horizon*self.dt/1000):
+            self.scheduler.setPeriod(self.dt*self.fastScale)
+        else:
+            self.scheduler.setPeriod(self.dt)
+    
+    def startRecording(self) -> None:
+        '''start recording the keys read at each step to a telemetry file'''
+        if not cfg.shopbot.telemetry.record:
+            return
+        folder = telemetryFolder(cfg.shopbot.telemetry.folder)
+        stamp = datetime.datetime.now().strftime('%y%m%d_%H%M%S')
+        fn = os.path.join(folder, f'{os.path.splitext(os.path.basename(self.sbpfile))[0]}_{stamp}.sbtlm')
+        meta = {'sbpfile':os.path.abspath(self.sbpfile), 'dt':self.dt, 'pSettings':self.pSettings
+                , 'sbRunFlag1':self.sbRunFlag1, 'pins':self.keys.arduino.pins
+                , 'modes':dict([[flag0, cw.mode] for flag0,cw in self.channelWatches.items()])
+                , 'start':stamp}
+        try:
+            self.recorder = telemetryRecorder(fn, meta)
+        except OSError as e:
+            logging.warning(f'Could not record telemetry to {fn}: {e}')
+            self.recorder = None
+
+    def readEdges(self) -> None:
+        '''give the times of the flag edges the arduino saw since the last step to the point watch, so moves start at the real edge'''
+        if not hasattr(self.keys.arduino, 'readEdges'):
+            return
+        t0 = self.timer.start()
+        self.pw.updateEdges(self.keys.arduino.readEdges())
+        self.timer.stop('edges', t0)
+
+    def exportDiagnostics(self) -> None:
+        '''save the diagnostics from the end of the print next to the time series table'''
+        fn = getattr(self.sbWin, 'fileName', '')
+        if len(fn)==0:
+            return
+        fn = f'{os.path.splitext(fn)[0]}_diag.csv'
+        try:
+            self.diagStr.export(fn)
+        except OSError as e:
+            logging.warning(f'Could not save diagnostics to {fn}: {e}')
+        else:
+            logging.info(f'Saved {fn}')
+
+    def writeStageTimes(self) -> None:
+        '''log the stage times, and save them next to the time series table'''
+        logging.info(f'Print loop stage times:\n{self.timer.summaryString()}')
+        fn = getattr(self.sbWin, 'fileName', '')
+        if len(fn)==0:
+            return
+        fn = f'{os.path.splitext(fn)[0]}_stages.csv'
+        try:
+            self.timer.writeSummary(fn)
+        except OSError as e:
+            logging.warning(f'Could not save stage times to {fn}: {e}')
+        else:
+            logging.info(f'Saved {fn}')
+
+    def step(self, snap:keySnapshot) -> str:
+        '''evaluate one step of the print from a snapshot of the keys. return 'aborted' or 'finished' if the print ended, otherwise an empty string'''
+        if not self.recorder is None:
+            self.recorder.write(snap)
+        if snap.stopHit:
+            # stop hit on shopbot
+            return 'aborted'
+
+        killed = self.stopHitPoint()
+        if killed:
+            if self.pw.retracting(diag=True):
+                # final withdrawal
+                return 'finished'
+            else:
+                # stop hit on shopbot
+                return 'aborted'
+
+        self.readEdges()
+
+        # evaluate status
+        if self.evalState(snap):
+            return 'finished'
+        return ''
+    
     @pyqtSlot()
     def run(self):
+        self.startRecording()
+        self.scheduler.start()
         while True:  
-            # check for stop hit
-            self.keys.lock()
-            abort = self.keys.checkStop()
-            self.keys.unlock()
-            if abort:
-                # stop hit on shopbot
+            # read the keys once for this step, and check for stop hit
+            t0 = self.timer.start()
+            result = self.step(self.keys.snapshot())
+            self.timer.stop('step', t0)
+            if result=='aborted':
                 self.close()
                 self.signals.aborted.emit()
                 return
-
-            killed = self.stopHitPoint()
-            if killed:
-                if self.pw.retracting(diag=True):
-                    # final withdrawal
-                    time.sleep(1) # wait 1 second before stopping videos
-                    self.close()
-                    self.signals.finished.emit()
-                else:
-                    # stop hit on shopbot
-                    self.close()
-                    self.signals.aborted.emit()
-                return
-
-            # evaluate status
-            done = self.evalState()
-            if done:
-                time.sleep(1) # wait 1 second before stopping videos
+            if result=='finished':
+                self.keys.sleep(1) # wait 1 second before stopping videos
                 self.close()
                 self.signals.finished.emit()
                 return
 
-            time.sleep(self.dt/1000)
+            self.adaptPeriod()
+            self.scheduler.wait()    # wait for the next step, without adding the time this step took
     
     def close(self):
-        '''close all the channels'''
+        '''close all the channels and log the loop timing'''
+        logging.info(f'Print loop timing: {self.scheduler.statsString()}')
+        logging.info(f'Print loop signals: {self.gate.statsString()}; keys: {self.keys.gate.statsString()}')
+        if hasattr(self.sbWin, 'flagBox') and hasattr(self.sbWin.flagBox, 'drawn'):
+            logging.info(f'Display: {self.sbWin.flagBox.drawn} values drawn, {self.sbWin.flagBox.coalesced} coalesced')
+        if self.timer.on:
+            self.writeStageTimes()
+        self.diagStr.close()
+        if self.diag>1:
+            self.exportDiagnostics()
+        self.keys.timer = stageTimer()
+        if not self.recorder is None:
+            self.recorder.close()
+            self.recorder = None
         for flag0,item in self.channelWatches.items():
             item.close()
     
@@ -9,7 +9,6 @@ from typing import List, Dict, Tuple, Union, Any, TextIO
 import logging
 import csv
 import re
-import win32gui, win32api, win32con
 import time
 import datetime
 
@@ -85,37 +84,10 @@ class channelWatch(QObject):
         if self.mode==1 or self.mode==2:
             self.diagStr.addHeader(f'  :              ')
     
-    def diagPosRow(self, sbflag:int) -> str:
-        flagOn0 = flagOn(sbflag, self.flag0)
-        s = f'{self.flag0+1:2.0f}'
-        if flagOn0:
-            s = s + ':ON '
-        else:
-            s = s + ':OFF'
-        s = s + ' '
-        if self.mode==1:
-            s = s + 'flu'
-        elif self.mode==2:
-            s = s + 'cam'
-        else:
-            # this is just a dummy flag, don't report values
-            return
-        s = s + ' '
-        if self.state==0:
-            s = s + 'non'
-        elif self.state==1:
-            s = s + 'on '
-        elif self.state==4:
-            s = s + 'sna'
-        elif self.state==5:
-            s = s + 'off'
-        elif self.state==6:
-            s = s + 'sno'
-        if self.on:
-            s = s + ' ye'
-        else:
-            s = s + ' no'
-        self.diagStr.addRow(s)
+    def diagPosRow(self, sbflag:int) -> None:
+        '''record the state of the channel for this time step. the diagnostics thread formats it later'''
+        if self.mode==1 or self.mode==2:
+            self.diagStr.recordChannel(self.flag0, self.mode, self.state, self.on, flagOn(sbflag, self.flag0))
         
             
     @pyqtSlot(str, str)
@@ -179,26 +151,19 @@ class channelWatch(QObject):
     #------------------------------------
     # each new point
             
-    def afterCol(self) -> str:
-        return f'p{self.flag0}_after'
-    
-    def beforeCol(self) -> str:
-        return f'p{self.flag0}_before'
-    
     def sendSpeed(self, speed:float) -> None:
         print(speed)
         self.signals.updateSpeed.emit(speed)
     
-    @pyqtSlot(dict)
-    def updateSpeed(self, t:dict) -> None:
-        '''send new extrusion speed to fluigent'''
-        beforecol = float(t[self.beforeCol()])
-        speed = float(str(t[self.afterCol()]))
-        if beforecol>=0:
+    @pyqtSlot(int)
+    def updateSpeed(self, i:int) -> None:
+        '''send new extrusion speed to fluigent, if row i of the points table changes the speed of this channel'''
+        points = self.pw.points
+        if not points.inkChannel[i]==self.flag0:
             return
+        speed = float(points.inkSpeed[i])
         if not speed>0:
             return
-        # negative value in before flag indicates that this is a special row
         self.sendSpeed(speed)
         if not self.on:
             return
@@ -206,9 +171,9 @@ class channelWatch(QObject):
         self.signals.goToPressure.emit(1)
                 
     def stateChange(self, s):
-        '''get the state of this flag at the beginning of the line'''
-        pt = getattr(self.pw.d, s)
-        return {'before':pt[self.beforeCol()], 'after':pt[self.afterCol()]}                
+        '''get the state of this flag at the beginning and end of the last, target, or next line'''
+        b,a = self.pw.points.flagState(getattr(self.pw, f'{s}i'), self.flag0)
+        return {'before':b, 'after':a}                
                 
     def defineStateCamera(self) -> None:
         '''define the state for a camera action'''
@@ -231,8 +196,8 @@ class channelWatch(QObject):
             self.bl = self.burstLength['value']
         else:
             # burst length is a time. calculate length from speed
-            if 'speed' in self.pw.d.target:
-                self.bl = self.burstLength['value']*self.pw.d.target['speed']
+            if self.pw.d.target.inFile:
+                self.bl = self.burstLength['value']*self.pw.d.target.speed
             else:
                 self.bl = 0
             
@@ -248,7 +213,7 @@ class channelWatch(QObject):
             self.state=1
             if self.critTimeOn['units']=='s':
                 # calculate crit distance based on speed
-                self.critDistance = abs(self.critTimeOn['value'])*self.pw.d.target['speed']
+                self.critDistance = abs(self.critTimeOn['value'])*self.pw.d.target.speed
             elif self.critTimeOn['units']=='mm':
                 # already know crit distance
                 self.critDistance = abs(self.critTimeOn['value'])
@@ -269,10 +234,10 @@ class channelWatch(QObject):
             self.state = 5
             if self.critTimeOff['units']=='s':
                 # calculate 
-                if 'speed' in self.pw.d.next:
-                    speed = self.pw.d.next['speed']
+                if self.pw.d.next.inFile:
+                    speed = self.pw.d.next.speed
                 else:
-                    speed = self.pw.d.target['speed']
+                    speed = self.pw.d.target.speed
                 self.critDistance = self.critTimeOff['value']*speed
             else:
                 self.critDistance = self.critTimeOff['value']
@@ -367,21 +332,25 @@ class channelWatch(QObject):
 
     def flagOnSadd(self) -> None:
         '''send out a message that the flag has turned on pressure or initiated the snap'''
+        lag = self.pw.edgeLag(self.flag0, True)
+        d = {'Flag on':True, f'{lag:.1f} ms after edge':lag>=0}
         if self.mode==1:
             # fluigent
-            self.getSadd('ON ', {'Flag on':True})
+            self.getSadd('ON ', d)
         elif self.mode==2:
-            self.getSadd('SNAP ', {'Flag on':True})
+            self.getSadd('SNAP ', d)
         else:
-            self.getSadd('EMPTY ', {'Flag on':True})
+            self.getSadd('EMPTY ', d)
             
     def flagOffSadd(self) -> None:
         '''send out a message that the flag has turned off pressure or stopped the snap'''
+        lag = self.pw.edgeLag(self.flag0, False)
+        d = {'Flag off':True, f'{lag:.1f} ms after edge':lag>=0}
         if self.mode==1:
             # fluigent
-            self.getSadd('OFF ', {'Flag off':True})
+            self.getSadd('OFF ', d)
         elif self.mode==2:
-            self.getSadd('SNOFF ', {'Flag off':True})
+            self.getSadd('SNOFF ', d)
         else:
             self.getSadd('EMPTY ', {'Flag on':True})
             
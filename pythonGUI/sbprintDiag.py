@@ -3,63 +3,222 @@
 
 # external packages
 from PyQt5.QtCore import pyqtSignal, pyqtSlot, QMutex, QObject, QRunnable, QThread, QTimer
-from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget 
+from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget
 import os, sys
 from typing import List, Dict, Tuple, Union, Any, TextIO
 import logging
 import re
+import csv
+import threading
+import numpy as np
 
 # local packages
 from config import cfg
 from general import *
 
-##################################################  
+##################################################
+
+pointColumns = ['t', 'xd', 'yd', 'zd', 'xe', 'ye', 'ze', 'xt', 'yt', 'zt', 'speed', 'trd', 'lrd', 'tld', 'ted', 'led']   # float values recorded from the point watch
+pointIntColumns = ['tln', 'qln', 'flag', 'bits']   # integer values recorded from the point watch. bits holds timeTaken, hitRead, trusted
+channelColumns = ['mode', 'state', 'on', 'flagOn']  # values recorded from each channel watch
+stateNames = {0:'non', 1:'on ', 4:'sna', 5:'off', 6:'sno'}
 
 
 class diagStr:
-    '''holds a diagnostic string that describes the current time step'''
-    
-    def __init__(self, diag:int):
+    '''holds diagnostics for each time step. The tracking loop records numbers into preallocated ring buffers, and a background thread turns them into text, so formatting and printing do not slow down the loop.
+    The tracking loop is the only writer and the printer is the only reader. A row is only read after the writer moves the head past it'''
+
+    def __init__(self, diag:int, size:int=16384, numFlags:int=16):
         self.header = '\t'
-        self.newRow()
         self.diag = diag
-        self.printi = 0
-        self.lastPrinted = ''
-        
+        self.size = size
+        self.floats = np.full((size, len(pointColumns)), np.nan)
+        self.ints = np.zeros((size, len(pointIntColumns)), dtype=np.int64)
+        self.hasPoint = np.zeros(size, dtype=bool)
+        self.channels = np.full((size, numFlags, len(channelColumns)), -1, dtype=np.int8)
+        self.statuses = ['']*size
+        self.head = 0          # number of rows finished
+        self.trackPoints = True
+        self.printer = None
+        self.newRow()
+
     def newRow(self):
-        self.row = '\t'
+        '''clear the row for the next time step'''
+        i = self.head % self.size
+        self.hasPoint[i] = False
+        self.channels[i,:,0] = -1
         self.status = ''
-        
+
     def addHeader(self, s) -> None:
         self.header = self.header +' | '+ s
-        
-    def addRow(self, s:str) -> None:
-        self.row = self.row + ' | '+ s
-        
+
     def addStatus(self, s:str) -> None:
         if len(self.status)>0:
             self.status = self.status + ', '
         self.status = self.status + s
-        
+
+    def recordPoint(self, pw, flag:int) -> None:
+        '''record the positions, distances, and state of the point watch for this time step'''
+        d = pw.d
+        i = self.head % self.size
+        r = d.read
+        e = d.estimate
+        t = d.target
+        self.floats[i] = (pw.clock(), r.x, r.y, r.z, e.x, e.y, e.z, t.x, t.y, t.z, pw.speed, d.trd, d.lrd, d.tld, d.ted, d.led)
+        self.ints[i] = (t.line, pw.queuedLine, flag, int(pw.timeTaken)+2*int(pw.hitRead)+4*int(pw.trusted))
+        self.hasPoint[i] = True
+        self.trackPoints = pw.trackPoints
+
+    def recordChannel(self, flag0:int, mode:int, state:int, on:bool, flagOn0:bool) -> None:
+        '''record the state of a channel watch for this time step'''
+        self.channels[self.head % self.size, flag0] = (mode, state, on, flagOn0)
+
     def printRow(self) -> None:
-        line = f'{self.row}| {self.status}'
-        if line==self.lastPrinted:
-            # no change, don't print
-            self.newRow()
-            return
-        self.lastPrinted = line
-        if self.diag>2:
-            # print every step
-            print(line)
-            self.printi+=1
-        elif self.diag>1 and len(self.status)>0:
-            print(line)
-            self.printi+=1
-        if (self.diag>1 and (self.printi>50)):
-            print(self.header)
-            self.printi = 0
+        '''finish the row for this time step, and let the printer format it'''
+        self.statuses[self.head % self.size] = self.status
+        self.head+=1
         self.newRow()
-            
+        if self.diag>1 and self.printer is None:
+            self.startPrinter()
+
     def printHeader(self) -> None:
         if self.diag>1:
-            print(self.header)
\ No newline at end of file
+            self.startPrinter()
+
+    #----------------------------
+    # formatting, outside of the tracking loop
+
+    def formatChannel(self, flag0:int, c:np.ndarray) -> str:
+        '''format the state of one channel, like 5:ON  flu on  ye'''
+        mode, state, on, flagOn0 = [int(v) for v in c]
+        s = f'{flag0+1:2.0f}'
+        if flagOn0:
+            s = s + ':ON '
+        else:
+            s = s + ':OFF'
+        s = s + ' '
+        if mode==1:
+            s = s + 'flu'
+        elif mode==2:
+            s = s + 'cam'
+        s = s + ' ' + stateNames.get(state, '')
+        if on:
+            s = s + ' ye'
+        else:
+            s = s + ' no'
+        return s
+
+    def formatPoint(self, i:int) -> str:
+        '''format the point watch values in row i'''
+        f = self.floats[i]
+        tln, qln, flag, bits = [int(v) for v in self.ints[i]]
+        l = []
+        n = 9 if self.trackPoints else 3
+        for j in range(1, n+1):
+            l.append(f'{f[j]:6.2f}')
+            if j%3==0:
+                l[-1] = l[-1]+'|'
+        if self.trackPoints:
+            l = l+[str(tln), f'{qln}|']
+        l.append(f'{flag:4.0f}')
+        if self.trackPoints:
+            l = l+[f'{f[10]:4.1f}', f'{bits&1:4b}', f'{(bits>>1)&1:3b}', f'{(bits>>2)&1:5b}|']
+            for j in range(11, 16):
+                l.append(f'{f[j]:5.2f}')
+        return '\t'.join(l)+'|'
+
+    def formatRow(self, i:int) -> str:
+        '''format row i of the ring buffers as a line of text'''
+        row = '\t'
+        for flag0 in range(self.channels.shape[1]):
+            c = self.channels[i, flag0]
+            if c[0]==1 or c[0]==2:
+                row = row + ' | ' + self.formatChannel(flag0, c)
+        if self.hasPoint[i]:
+            row = row + ' | ' + self.formatPoint(i)
+        return f'{row}| {self.statuses[i]}'
+
+    def startPrinter(self) -> None:
+        '''start the thread that prints the rows'''
+        if self.printer is None:
+            self.printer = diagPrinter(self)
+            self.printer.start()
+
+    def close(self) -> None:
+        '''print the remaining rows and stop the printer'''
+        if not self.printer is None:
+            self.printer.stop()
+            self.printer = None
+
+    def export(self, fn:str) -> None:
+        '''write the rows that are still in the ring buffers to a csv file'''
+        start = max(0, self.head-self.size+1)   # the slot at the head was cleared for the next row
+        with open(fn, mode='w', newline='', encoding='utf-8') as c:
+            writer = csv.writer(c, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            flags = [flag0 for flag0 in range(self.channels.shape[1]) if (self.channels[:,flag0,0]>0).any()]
+            chead = [f'{flag0+1}_{s}' for flag0 in flags for s in channelColumns]
+            writer.writerow(['step']+pointColumns+pointIntColumns+chead+['status'])
+            for j in range(start, self.head):
+                i = j % self.size
+                if self.hasPoint[i]:
+                    p = list(self.floats[i])+list(self.ints[i])
+                else:
+                    p = ['']*(len(pointColumns)+len(pointIntColumns))
+                c = [int(v) for flag0 in flags for v in self.channels[i, flag0]]
+                writer.writerow([j]+p+c+[self.statuses[i]])
+
+
+class diagPrinter(threading.Thread):
+    '''formats and prints the diagnostic rows in the background. With diag>2, every changed row is printed. With diag=2, only rows with a status are printed. The header is printed every 50 lines'''
+
+    def __init__(self, ds:diagStr, period:float=0.1):
+        super(diagPrinter, self).__init__(daemon=True)
+        self.ds = ds
+        self.period = period
+        self.tail = ds.head    # next row to print
+        self.dropped = 0       # rows that were overwritten before they were printed
+        self.printi = 0
+        self.lastPrinted = ''
+        self.stopEvent = threading.Event()
+        self.headerPrinted = False
+
+    def run(self) -> None:
+        while not self.stopEvent.wait(self.period):
+            self.printRows()
+        self.printRows()
+
+    def stop(self) -> None:
+        '''print the rest of the rows and stop'''
+        self.stopEvent.set()
+        self.join(timeout=2)
+        if self.dropped>0:
+            logging.info(f'Diagnostics: {self.dropped} rows were not printed')
+
+    def printRows(self) -> None:
+        '''print the rows that the tracking loop finished since the last call'''
+        ds = self.ds
+        head = ds.head
+        if head-self.tail>=ds.size:
+            # the slot at the head is being rewritten, so only the last size-1 rows are complete
+            self.dropped+=head-self.tail-ds.size+1
+            self.tail = head-ds.size+1
+        if not self.headerPrinted and ds.diag>1:
+            print(ds.header)
+            self.headerPrinted = True
+        lines = []
+        for j in range(self.tail, head):
+            i = j % ds.size
+            line = ds.formatRow(i)
+            if line==self.lastPrinted:
+                # no change, don't print
+                continue
+            self.lastPrinted = line
+            if ds.diag>2 or (ds.diag>1 and len(ds.statuses[i])>0):
+                lines.append(line)
+                self.printi+=1
+            if ds.diag>1 and self.printi>50:
+                lines.append(ds.header)
+                self.printi = 0
+        self.tail = head
+        if len(lines)>0:
+            print('\n'.join(lines))
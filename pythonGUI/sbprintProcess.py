@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+'''Shopbot GUI functions for running the print loop in its own process, so it does not share the GIL with the cameras, plots, and file writing in the GUI process'''
+
+# external packages
+from PyQt5.QtCore import pyqtSignal, pyqtSlot, QMutex, QObject
+import os, sys
+import time
+import queue
+import functools
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import List, Dict, Tuple, Union, Any, TextIO
+import logging
+import numpy as np
+
+# local packages
+from config import cfg
+from flags import *
+from sbprint import *
+from sbSimulator import *
+
+#----------------------------------------------------------------------
+
+stateDtype = np.dtype([('seq', '<u8'), ('t', '<f8'), ('x', '<f8'), ('y', '<f8'), ('z', '<f8')
+                       , ('xe', '<f8'), ('ye', '<f8'), ('ze', '<f8'), ('flag', '<i8'), ('lastRead', '<i8'), ('ticks', '<i8')])   # state that the tracking process publishes at each step
+
+class sharedState:
+    '''tracking state in shared memory. The tracking process is the only writer. The sequence number is odd while a write is in progress, so the reader can retry instead of taking a lock. A local lock only keeps readers in this process from using the memory while it is closed'''
+
+    def __init__(self, name:str=''):
+        '''if name is empty, create a new block of shared memory. otherwise, attach to an existing block'''
+        self.owner = len(name)==0
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=stateDtype.itemsize)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.closeLock = threading.Lock()
+        self.a = np.ndarray((1,), dtype=stateDtype, buffer=self.shm.buf)
+        if self.owner:
+            self.a[0] = np.zeros(1, dtype=stateDtype)[0]
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write(self, t:float, loc:xyzPoint, est:xyzPoint, flag:int, lastRead:int, ticks:int) -> None:
+        '''publish the state of the tracking loop'''
+        r = self.a[0]
+        seq = int(r['seq'])
+        r['seq'] = seq+1     # odd: write in progress
+        r['t'] = t
+        r['x'] = loc.x
+        r['y'] = loc.y
+        r['z'] = loc.z
+        r['xe'] = est.x
+        r['ye'] = est.y
+        r['ze'] = est.z
+        r['flag'] = flag
+        r['lastRead'] = lastRead
+        r['ticks'] = ticks
+        r['seq'] = seq+2     # even: write done
+
+    def read(self, tries:int=100) -> Union[np.void, None]:
+        '''get a consistent copy of the state, or None if it is not written yet or the memory is closed'''
+        with self.closeLock:
+            if self.a is None:
+                return None
+            for i in range(tries):
+                s1 = int(self.a[0]['seq'])
+                if s1%2==1:
+                    continue
+                r = self.a.copy()[0]
+                if int(self.a[0]['seq'])==s1:
+                    if s1==0:
+                        return None
+                    return r
+        return None
+
+    def close(self) -> None:
+        '''detach from the shared memory, and free it if this is the process that created it'''
+        with self.closeLock:
+            if self.a is None:
+                return
+            self.a = None     # drop the view of the buffer, so the memory can be closed
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+
+#----------------------------------------------------------------------
+
+class remoteLoop(printLoop):
+    '''print loop that runs in the tracking process. It publishes the position, estimate, and flag to shared memory at each step, and sends channel actions and print events to the GUI process through a queue'''
+
+    def __init__(self, dt:float, keys:QMutex, sbpfile:str, pSettings:dict, sbRunFlag1:int, modes:dict, stateName:str, commands:multiprocessing.Queue, stop:multiprocessing.Event):
+        self.commands = commands
+        self.stop = stop
+        self.state = sharedState(stateName)
+        self.closed = False
+        super(remoteLoop,self).__init__(dt, keys, sbpfile, pSettings, None, sbRunFlag1, modes=modes)
+        for s in ['finished', 'aborted', 'target', 'targetLine', 'speed', 'status', 'trusted']:
+            getattr(self.signals, s).connect(functools.partial(self.send, 'loop', -1, s))
+
+    def assignFlags(self) -> None:
+        '''create the channels, and send their actions to the GUI process'''
+        super(remoteLoop,self).assignFlags()
+        for flag0,cw in self.channelWatches.items():
+            for s in ['goToPressure', 'zeroChannel', 'snap', 'updateSpeed', 'printStatus']:
+                getattr(cw.signals, s).connect(functools.partial(self.send, 'channel', flag0, s))
+
+    def send(self, kind:str, flag0:int, name:str, *args) -> None:
+        '''put a signal on the queue to the GUI process'''
+        self.commands.put((kind, flag0, name, args))
+
+    def step(self, snap:keySnapshot) -> str:
+        '''evaluate one step, publish the state, and check if the GUI process asked us to stop'''
+        result = super(remoteLoop,self).step(snap)
+        self.state.write(snap.time, snap.loc, self.pw.d.estimate, snap.flag, snap.lastRead, self.scheduler.ticks)
+        if len(result)==0 and self.stop.is_set():
+            result = 'aborted'
+        return result
+
+    def close(self) -> None:
+        '''close the channels, and send the timing statistics to the GUI process'''
+        if self.closed:
+            return
+        self.closed = True
+        super(remoteLoop,self).close()
+        self.commands.put(('stats', -1, 'scheduler', (self.scheduler.stats(),)))
+        self.state.close()
+
+
+def trackingMain(args:dict, stateName:str, commands:multiprocessing.Queue, stop:multiprocessing.Event) -> None:
+    '''run the print loop. this is the main function of the tracking process'''
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(processName)s %(message)s')
+    loop = None
+    try:
+        if args['simulate']:
+            # follow the simulated run that the GUI process started
+            backend = sb3Simulator(speed=args['sim']['speed'], lookahead=args['sim']['lookahead'])
+            backend.attach(args['sim'])
+        else:
+            backend = registryBackend(launch=False)
+        ard = arduino(connect=args['arduino'])
+        if ard.connected:
+            ard.pins = dict([[int(f1), p] for f1,p in args['pins'].items()])
+        keys = SBKeys(args['diag'], ard, backend)
+        keys.runningSBP = True
+        loop = remoteLoop(args['dt'], keys, args['sbpfile'], args['pSettings'], args['sbRunFlag1'], args['modes'], stateName, commands, stop)
+        loop.run()
+    except Exception as e:
+        logging.error(f'Tracking process failed: {e}')
+        commands.put(('loop', -1, 'aborted', ()))
+    finally:
+        if not loop is None:
+            try:
+                loop.close()
+            except Exception as e:
+                logging.error(f'Could not close the print loop: {e}')
+        if 'ard' in locals():
+            ard.release()
+
+#----------------------------------------------------------------------
+
+class printProcess(QObject):
+    '''runs the print loop in its own process, with the same signals as printLoop. run() starts the process, then passes channel actions and print events from the queue to the GUI as they arrive, and reads the shared position and flag at the display rate'''
+
+    def __init__(self, dt:float, keys:QMutex, sbpfile:str, pSettings:dict, sbWin, sbRunFlag1:int):
+        super(printProcess,self).__init__()
+        self.dt = dt
+        self.keys = keys
+        self.sbpfile = sbpfile
+        self.pSettings = pSettings
+        self.sbRunFlag1 = sbRunFlag1
+        self.signals = printLoopSignals()
+        self.gate = changeGate()
+        self.stats = {}
+
+        # connect the devices in this process to stand-ins for the channel watches in the tracking process
+        self.channelSignals = {}
+        self.modes = {}
+        for flag0 in range(cfg.shopbot.flag1min-1, cfg.shopbot.flag1max):
+            if flag0==sbRunFlag1-1:
+                continue
+            signals = channelWatchSignals()
+            if connectFluigentSignals(sbWin, flag0, signals):
+                self.modes[flag0] = 1
+            if connectCameraSignals(sbWin, flag0, signals):
+                self.modes[flag0] = 2
+            if flag0 in self.modes:
+                self.channelSignals[flag0] = signals
+
+        ctx = multiprocessing.get_context('spawn')
+        self.commands = ctx.Queue()
+        self.stopEvent = ctx.Event()
+        self.state = sharedState()
+        self.process = None
+        self.ctx = ctx
+
+    def processArgs(self) -> dict:
+        '''get the settings to send to the tracking process'''
+        return {'dt':self.dt, 'sbpfile':os.path.abspath(self.sbpfile), 'pSettings':self.pSettings, 'sbRunFlag1':self.sbRunFlag1
+                , 'modes':self.modes, 'diag':self.keys.diag, 'pins':dict(self.keys.arduino.pins)
+                , 'arduino':self.keys.arduino.connected
+                , 'simulate':isinstance(self.keys.backend, sb3Simulator)
+                , 'sim':self.keys.backend.share() if isinstance(self.keys.backend, sb3Simulator) else {}}
+
+    def stop(self) -> None:
+        '''ask the tracking process to stop'''
+        self.stopEvent.set()
+
+    def handle(self, kind:str, flag0:int, name:str, args:tuple) -> str:
+        '''pass a message from the tracking process to the GUI. return the name of the signal if the print ended'''
+        if kind=='channel':
+            if flag0 in self.channelSignals:
+                getattr(self.channelSignals[flag0], name).emit(*args)
+        elif kind=='loop':
+            getattr(self.signals, name).emit(*args)
+            if name in ['finished', 'aborted']:
+                return name
+        elif kind=='stats':
+            self.stats = args[0]
+            logging.info(f'Tracking process timing: {self.stats}')
+        return ''
+
+    def publish(self) -> None:
+        '''send the shared position, estimate, flag, and last line read to the GUI if they changed'''
+        r = self.state.read()
+        if r is None:
+            return
+        if r['flag']>=0:
+            self.keys.emitFlag(int(r['flag']))
+        loc = xyzPoint(float(r['x']), float(r['y']), float(r['z']))
+        if loc.defined:
+            self.keys.emitPos(loc)
+        if r['lastRead']>=0:
+            self.keys.emitLastRead(int(r['lastRead']))
+        est = (float(r['xe']), float(r['ye']), float(r['ze']))
+        if not np.isnan(est[0]) and self.gate.changed('estimate', (round(est[0], 3), round(est[1], 3), round(est[2], 3))):
+            self.signals.estimate.emit(*est)
+
+    @pyqtSlot()
+    def run(self) -> None:
+        '''start the tracking process and relay its messages until the print ends'''
+        args = self.processArgs()
+        pins = dict(self.keys.arduino.pins)
+        if args['arduino']:
+            self.keys.arduino.release()    # let the tracking process open the board
+        try:
+            self.process = self.ctx.Process(target=trackingMain, args=(args, self.state.name, self.commands, self.stopEvent), name='tracking', daemon=True)
+            self.process.start()
+            self.relay()
+            self.process.join(timeout=5)
+        finally:
+            self.state.close()
+            if args['arduino']:
+                self.keys.arduino.connect()    # take the board back
+                self.keys.arduino.pins = pins
+
+    def relay(self) -> None:
+        '''pass messages from the tracking process to the GUI until the print ends'''
+        rate = cfg.shopbot.displayRate.value
+        period = 1/rate if rate>0 else self.dt/1000
+        nextPublish = time.perf_counter()
+        ended = ''
+        while len(ended)==0:
+            try:
+                msg = self.commands.get(timeout=max(0, nextPublish-time.perf_counter()))
+            except queue.Empty:
+                pass
+            else:
+                ended = self.handle(*msg)
+            now = time.perf_counter()
+            if now>=nextPublish:
+                self.publish()
+                nextPublish = now+period
+            if len(ended)==0 and not self.process.is_alive() and self.commands.empty():
+                logging.error('Tracking process ended without finishing the print')
+                self.signals.aborted.emit()
+                ended = 'aborted'
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+'''Shopbot GUI functions for the rows that describe a print in the metadata and time series tables. Shared by the GUI and the command line runner'''
+
+# external packages
+import os, sys
+from typing import List, Dict, Tuple, Union, Any, TextIO
+import logging
+
+# local packages
+from sbpCache import *
+
+#----------------------------------------------------------------------
+
+runSimpleNames = {0:'Track points, flow speeds, and flags',
+                  2:'Track points, but only watch arduino for trustworthy flags (no early turn off/on)',
+                  1:'Only track flags'}   # descriptions of the pressure strategies
+
+
+def printSettingsTable(sbpName:str, runFlag1:int, pSettings:dict, units:str, checkFreq:dict) -> List[List]:
+    '''get the metadata rows that describe the sbp file and the print settings. pSettings is the dictionary of settings for the print loop'''
+    out = loadSBPHeader(sbpName).table()
+    out.append(['run_flag1', '', runFlag1])
+    out.append(['critTimeOn', pSettings['critTimeOn']['units'], pSettings['critTimeOn']['value']])
+    out.append(['critTimeOff', pSettings['critTimeOff']['units'], pSettings['critTimeOff']['value']])
+    out.append(['zeroDist', units, pSettings['zeroDist']])
+    out.append(['checkFreq', checkFreq['units'], checkFreq['value']])
+    out.append(['burstScale', '', pSettings['burstScale']])
+    out.append(['burstLength', pSettings['burstLength']['units'], pSettings['burstLength']['value']])
+    runSimple = pSettings['runSimple']
+    out.append(['tracking', runSimple, runSimpleNames.get(runSimple, '')])
+    return out
+
+
+def sbTimeHeader(savePos:bool, saveFlag:bool, runSimple:int) -> List:
+    '''get a list of header values for the shopbot columns of the time table'''
+    out = []
+    if savePos:
+        out = ['x_disp(mm)', 'y_disp(mm)', 'z_disp(mm)']
+        if not runSimple==1:
+            out = out+ ['x_est(mm)', 'y_est(mm)', 'z_est(mm)', 'x_target(mm)', 'y_target(mm)', 'z_target(mm)', 'speed(mm/s)']
+    if saveFlag:
+        out = out + ['flag', 'lastRead']
+        if not runSimple==1:
+            out.append('targetLine')
+    out.append('trusted')
+    out.append('status')
+    return out
+
+
+def sbTimeRow(values:dict, savePos:bool, saveFlag:bool, runSimple:int) -> List:
+    '''get a list of values for the shopbot columns of the time table. values is a dictionary of the latest readings, and readings that are missing are left blank'''
+    def get(keys:List[str]) -> List:
+        return [values.get(s, '') for s in keys]
+    out = []
+    if savePos:
+        out = get(['x', 'y', 'z'])
+        if not runSimple==1:
+            out = out + get(['xe', 'ye', 'ze', 'xt', 'yt', 'zt', 'speed'])
+    if saveFlag:
+        out = out + get(['sbFlag', 'lastRead'])
+        if not runSimple==1:
+            out = out + get(['tline'])
+    return out + get(['trusted', 'printStatus'])
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+'''Shopbot GUI functions for recording the raw keys that the print loop reads at each step'''
+
+# external packages
+import os, sys
+import json
+import struct
+import datetime
+from typing import List, Dict, Tuple, Union, Any, TextIO
+import logging
+import numpy as np
+
+# local packages
+from sbKeyBackend import *
+
+#----------------------------------------------------------------------
+
+telemetryMagic = b'SBTLM1\n'   # start of every telemetry file, with the format version
+telemetryDtype = np.dtype([('t', '<f8'), ('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('flag', '<i4'), ('rawFlag', '<i4'), ('pins', '<u2'), ('status', '<u2'), ('lastRead', '<i4')])   # one record per step of the print loop
+
+def telemetryFolder(folder:str='') -> str:
+    '''get the folder to save telemetry files in'''
+    if len(folder)==0:
+        folder = os.path.join(os.path.expanduser('~'), '.sbgui', 'telemetry')
+    return folder
+
+
+class telemetryRecorder:
+    '''writes each snapshot of the keys to a binary file. The file starts with the magic string, the length of the header as a 4 byte integer, and a json header with the settings of the print. After that, each step is a fixed-size record with the fields of telemetryDtype'''
+
+    def __init__(self, fn:str, meta:dict, bufferSize:int=4096):
+        self.fn = fn
+        self.buffer = np.zeros(bufferSize, dtype=telemetryDtype)
+        self.n = 0          # number of records in the buffer
+        self.written = 0    # number of records written to file
+        os.makedirs(os.path.dirname(os.path.abspath(fn)), exist_ok=True)
+        self.f = open(fn, mode='wb')
+        header = json.dumps(meta, default=str).encode()
+        self.f.write(telemetryMagic)
+        self.f.write(struct.pack('<I', len(header)))
+        self.f.write(header)
+
+    def write(self, snap:keySnapshot) -> None:
+        '''add a snapshot to the buffer'''
+        r = self.buffer[self.n]
+        r['t'] = snap.time
+        r['x'] = snap.loc.x
+        r['y'] = snap.loc.y
+        r['z'] = snap.loc.z
+        r['flag'] = snap.flag
+        r['rawFlag'] = snap.rawFlag
+        r['pins'] = snap.pins
+        r['status'] = snap.status
+        r['lastRead'] = snap.lastRead
+        self.n+=1
+        if self.n==len(self.buffer):
+            self.flush()
+
+    def flush(self) -> None:
+        '''write the buffer to file'''
+        if self.n==0 or self.f is None:
+            return
+        self.buffer[:self.n].tofile(self.f)
+        self.f.flush()
+        self.written+=self.n
+        self.n = 0
+
+    def close(self) -> None:
+        '''write the rest of the buffer and close the file'''
+        if self.f is None:
+            return
+        self.flush()
+        self.f.close()
+        self.f = None
+        logging.info(f'Recorded {self.written} steps to {self.fn}')
+
+
+def readTelemetry(fn:str) -> Tuple[dict, np.ndarray]:
+    '''read the header and records from a telemetry file'''
+    with open(fn, mode='rb') as f:
+        magic = f.read(len(telemetryMagic))
+        if not magic==telemetryMagic:
+            raise ValueError(f'{fn} is not a telemetry file')
+        hlen = struct.unpack('<I', f.read(4))[0]
+        meta = json.loads(f.read(hlen).decode())
+        records = np.fromfile(f, dtype=telemetryDtype)
+    return meta, records
+
+def recordSnapshot(r:np.void) -> keySnapshot:
+    '''convert a record back into a snapshot of the keys'''
+    return keySnapshot(float(r['t']), xyzPoint(r['x'], r['y'], r['z']), int(r['flag']), int(r['status']), int(r['lastRead']), True, 0, int(r['rawFlag']), int(r['pins']))
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+'''Shopbot GUI functions for timing the steps of loops that watch the shopbot, and for limiting the signals they send to the GUI'''
+
+# external packages
+import os, sys
+import time
+import math
+import csv
+from typing import List, Dict, Tuple, Union, Any, TextIO, Callable
+import logging
+
+#----------------------------------------------------------------------
+
+class tickScheduler:
+    '''runs a loop on fixed deadlines from a monotonic clock, so the time spent in each step does not add to the period.
+    If a step runs past the next deadline, the missed deadlines are skipped instead of run late, and the overrun is counted.
+    dt is the period in ms. clock gives the time in s and sleep waits for a time in s, so a simulated clock can be used'''
+
+    def __init__(self, dt:float, clock:Callable=time.perf_counter, sleep:Callable=time.sleep):
+        self.dt = dt                 # normal period in ms
+        self.period = dt/1000        # current period in s
+        self.clock = clock
+        self.sleep = sleep
+        self.start()
+
+    def start(self) -> None:
+        '''reset the deadlines and the statistics'''
+        now = self.clock()
+        self.t0 = now
+        self.deadline = now+self.period   # time of the next tick
+        self.lastTick = now
+        self.rescheduled = False   # the period changed since the last tick, so the next deadline is not a regular one
+        self.ticks = 0        # number of ticks
+        self.overruns = 0     # number of ticks where the step took longer than the period
+        self.skipped = 0      # number of deadlines that were skipped because of overruns
+        self.fastTicks = 0    # number of ticks at the fast period
+        self.meanPeriod = 0   # running mean of the time between ticks, in s
+        self.m2 = 0           # running sum of squared differences from the mean period, in s^2
+        self.maxLate = 0      # longest time past a deadline, in s
+
+    def setPeriod(self, dt:float) -> None:
+        '''change the period to dt ms, starting from the last tick. if that deadline has already passed, the next tick is now'''
+        period = dt/1000
+        if period==self.period:
+            return
+        self.period = period
+        self.deadline = max(self.lastTick+period, self.clock())
+        self.rescheduled = True
+
+    def wait(self) -> bool:
+        '''wait for the next deadline. return False if the last step overran the deadline'''
+        now = self.clock()
+        onTime = now<self.deadline
+        if onTime:
+            self.sleep(self.deadline-now)
+            now = self.clock()
+        late = now-self.deadline
+        if self.rescheduled:
+            # the deadline was moved during this step, so being past it is not an overrun
+            self.rescheduled = False
+            if not onTime:
+                self.deadline = now
+                onTime = True
+        else:
+            self.maxLate = max(self.maxLate, late)
+        if not onTime:
+            # the step overran. skip the deadlines we missed instead of trying to catch up
+            self.overruns+=1
+            missed = math.floor(late/self.period)
+            self.deadline = self.deadline+missed*self.period
+            self.skipped+=missed
+        self.recordTick(now)
+        self.deadline = self.deadline+self.period
+        return onTime
+
+    def recordTick(self, now:float) -> None:
+        '''add the time since the last tick to the statistics'''
+        p = now-self.lastTick
+        self.lastTick = now
+        self.ticks+=1
+        if self.period<self.dt/1000:
+            self.fastTicks+=1
+        delta = p-self.meanPeriod
+        self.meanPeriod = self.meanPeriod+delta/self.ticks
+        self.m2 = self.m2+delta*(p-self.meanPeriod)
+
+    @property
+    def jitter(self) -> float:
+        '''standard deviation of the time between ticks, in s'''
+        if self.ticks<2:
+            return 0
+        return math.sqrt(self.m2/(self.ticks-1))
+
+    def stats(self) -> dict:
+        '''get the timing statistics, with times in ms'''
+        return {'ticks':self.ticks, 'period':self.dt, 'meanPeriod':self.meanPeriod*1000, 'jitter':self.jitter*1000
+                , 'maxLate':self.maxLate*1000, 'overruns':self.overruns, 'skipped':self.skipped, 'fastTicks':self.fastTicks}
+
+    def statsString(self) -> str:
+        '''get a one line summary of the timing statistics'''
+        d = self.stats()
+        return f'{d["ticks"]} ticks at {d["period"]:.1f} ms: mean period {d["meanPeriod"]:.2f} ms, jitter {d["jitter"]:.2f} ms, max late {d["maxLate"]:.2f} ms, {d["overruns"]} overruns, {d["skipped"]} skipped, {d["fastTicks"]} fast ticks'
+
+
+class changeGate:
+    '''decides whether a signal should be sent, so loops only send values to the GUI when they change. Counts the signals that were delivered and suppressed for each name'''
+
+    def __init__(self):
+        self.last = {}         # last delivered value for each name
+        self.delivered = {}    # number of delivered signals for each name
+        self.suppressed = {}   # number of suppressed signals for each name
+
+    def changed(self, name:str, value:Any) -> bool:
+        '''return True if the value is different from the last delivered value, and record it as delivered'''
+        if name in self.last and self.last[name]==value:
+            self.suppressed[name]+=1
+            return False
+        self.last[name] = value
+        self.delivered[name] = self.delivered.get(name, 0)+1
+        self.suppressed.setdefault(name, 0)
+        return True
+
+    def count(self, name:str, delivered:bool) -> None:
+        '''count a signal that was delivered or suppressed for a reason other than its value'''
+        self.delivered[name] = self.delivered.get(name, 0)+int(delivered)
+        self.suppressed[name] = self.suppressed.get(name, 0)+int(not delivered)
+
+    def reset(self) -> None:
+        '''forget the last values, so the next value of each name is delivered'''
+        self.last = {}
+
+    def stats(self) -> dict:
+        '''get the number of delivered and suppressed signals for each name'''
+        return dict([[name, {'delivered':self.delivered[name], 'suppressed':self.suppressed[name]}] for name in self.delivered])
+
+    def statsString(self) -> str:
+        '''get a one line summary of the delivered and suppressed signals'''
+        return ', '.join([f'{name} {d["delivered"]} sent/{d["suppressed"]} suppressed' for name,d in self.stats().items()])
+
+
+class stageTimer:
+    '''times the stages of each step of a loop into preallocated histograms. If on is False, start and stop return right away, so the timer costs almost nothing when it is not used.
+    Bins are spaced logarithmically from 100 ns to 100 ms, with underflow and overflow bins at the ends'''
+
+    binsPerDecade = 10
+    minExp = -7     # log10 of the lower edge of the first bin, in s
+    maxExp = -1     # log10 of the upper edge of the last bin, in s
+
+    def __init__(self, on:bool=False):
+        self.on = on
+        self.nbins = (self.maxExp-self.minExp)*self.binsPerDecade+2
+        self.stages = {}    # histogram, count, total, and max time for each stage
+
+    def addStage(self, name:str) -> None:
+        '''allocate the histogram for a stage'''
+        if not name in self.stages:
+            self.stages[name] = {'hist':[0]*self.nbins, 'count':0, 'total':0, 'max':0}
+
+    def start(self) -> float:
+        '''get the start time of a stage'''
+        if not self.on:
+            return 0
+        return time.perf_counter()
+
+    def stop(self, name:str, t0:float) -> None:
+        '''add the time since t0 to the histogram for the stage'''
+        if not self.on:
+            return
+        dt = time.perf_counter()-t0
+        if not name in self.stages:
+            self.addStage(name)
+        s = self.stages[name]
+        if dt>0:
+            b = int((math.log10(dt)-self.minExp)*self.binsPerDecade)+1
+            b = min(max(b, 0), self.nbins-1)
+        else:
+            b = 0
+        s['hist'][b]+=1
+        s['count']+=1
+        s['total']+=dt
+        if dt>s['max']:
+            s['max'] = dt
+
+    def binEdge(self, b:int) -> float:
+        '''get the upper edge of bin b in s'''
+        return 10**(self.minExp+b/self.binsPerDecade)
+
+    def percentile(self, name:str, q:float) -> float:
+        '''estimate the qth percentile of the stage time in s from the histogram, as the upper edge of the bin it falls in'''
+        s = self.stages[name]
+        if s['count']==0:
+            return 0
+        target = q/100*s['count']
+        c = 0
+        for b,n in enumerate(s['hist']):
+            c+=n
+            if c>=target:
+                return min(self.binEdge(b), s['max'])
+        return s['max']
+
+    def summary(self) -> List[dict]:
+        '''get the count and times in us for each stage'''
+        rows = []
+        for name,s in self.stages.items():
+            if s['count']==0:
+                continue
+            rows.append({'stage':name, 'count':s['count'], 'mean':s['total']/s['count']*1e6
+                         , 'p50':self.percentile(name, 50)*1e6, 'p99':self.percentile(name, 99)*1e6
+                         , 'max':s['max']*1e6, 'total':s['total']*1e3})
+        return rows
+
+    def summaryString(self) -> str:
+        '''get a table of the stage times'''
+        lines = [f'{"stage":<16s} {"count":>8s} {"mean(us)":>9s} {"p50(us)":>9s} {"p99(us)":>9s} {"max(us)":>9s} {"total(ms)":>10s}']
+        for r in self.summary():
+            lines.append(f'{r["stage"]:<16s} {r["count"]:8d} {r["mean"]:9.1f} {r["p50"]:9.1f} {r["p99"]:9.1f} {r["max"]:9.1f} {r["total"]:10.1f}')
+        return '\n'.join(lines)
+
+    def writeSummary(self, fn:str) -> None:
+        '''write the stage times and histograms to a csv file'''
+        with open(fn, mode='w', newline='', encoding='utf-8') as c:
+            writer = csv.writer(c, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            rows = self.summary()
+            writer.writerow(['stage', 'count', 'mean(us)', 'p50(us)', 'p99(us)', 'max(us)', 'total(ms)'])
+            for r in rows:
+                writer.writerow([r['stage'], r['count'], r['mean'], r['p50'], r['p99'], r['max'], r['total']])
+            writer.writerow([])
+            writer.writerow(['bin upper edge(us)']+[r['stage'] for r in rows])
+            for b in range(self.nbins):
+                edge = 'inf' if b==self.nbins-1 else f'{self.binEdge(b)*1e6:.4g}'
+                writer.writerow([edge]+[self.stages[r['stage']]['hist'][b] for r in rows])
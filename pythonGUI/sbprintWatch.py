@@ -5,13 +5,13 @@
 from PyQt5.QtCore import pyqtSignal, pyqtSlot, QMutex, QObject, QRunnable, QThread, QTimer
 from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget 
 import os, sys
-from typing import List, Dict, Tuple, Union, Any, TextIO
+from typing import List, Dict, Tuple, Union, Any, TextIO, Callable
 import logging
 import csv
 import re
-import win32gui, win32api, win32con
 import time
 import datetime
+import math
 
 # local packages
 from config import cfg
@@ -22,90 +22,68 @@ sys.path.append(currentdir)
 sys.path.append(parentdir)
 sys.path.append(os.path.join(parentdir, 'SBP_files'))  # add python folder
 from sbpRead import *
+from sbpCache import *
 
 
 #---------------------------------------------
 
-def toXYZ(p1:Union[pd.Series, List[float]], listOut:bool=False) -> Tuple[float]:
+def toPoint(p1:Union[xyzPoint, 'pd.Series', dict, List[float]]) -> xyzPoint:
+    '''convert the list, dictionary, or pandas series to a point'''
+    if type(p1) is xyzPoint:
+        return p1
+    if type(p1) is list or type(p1) is tuple:
+        if not len(p1)==3:
+            raise ValueError('Unknown type given to toPoint')
+        return xyzPoint(*p1)
+    if hasattr(p1, 'keys'):
+        # dictionary or pandas series. NaN is the only value that does not equal itself
+        d = dict([[s, p1[s]] for s in ['x', 'y', 'z', 'line', 'speed'] if s in p1 and not p1[s] is None and p1[s]==p1[s]])
+        return xyzPoint(**d)
+    raise ValueError('Unknown type given to toPoint')
+
+def toXYZ(p1:Union[xyzPoint, 'pd.Series', dict, List[float]]) -> List[float]:
     '''convert the point or pandas series to x,y,z'''
-    if type(p1) is list and len(p1)==3:
-        x = p1[0]
-        y = p1[1]
-        z = p1[2]
-    elif type(p1) is pd.Series or type(p1) is dict:
-        if 'x' in p1:
-            x = p1['x']
-        else:
-            x = np.nan
-        if 'y' in p1:
-            y = p1['y']
-        else:
-            y = np.nan
-        if 'z' in p1:
-            z = p1['z']
-        else:
-            z = np.nan
-    else:
-        raise ValueError('Unknown type given to toXYZ')
-    if listOut:
-        return x,y,z
-    else:
-        return [x,y,z]
+    return toPoint(p1).xyz()
 
-def dxdydz(p1:Union[pd.Series, List[float]], p2:Union[pd.Series, List[float]]) -> Tuple[float]:
+def dxdydz(p1:xyzPoint, p2:xyzPoint) -> Tuple[float]:
     '''convert the two points to their differences'''
-    p1x, p1y, p1z = toXYZ(p1)
-    p2x, p2y, p2z = toXYZ(p2)
+    return p1.delta(p2)
 
-    if pd.isna(p2x) or pd.isna(p1x):
-        dx = 0
-    else:
-        dx = float(p2x)-float(p1x)
-    if pd.isna(p2y) or pd.isna(p1y):
-        dy = 0
-    else:
-        dy =  float(p2y)-float(p1y)
-    if pd.isna(p2z) or pd.isna(p1z):
-        dz = 0
-    else:
-        dz = float(p2z)-float(p1z)
-    return dx,dy,dz
-
-def ppDist(p1:Union[pd.Series, List[float]], p2:Union[pd.Series, List[float]]) -> float:
+def ppDist(p1:xyzPoint, p2:xyzPoint) -> float:
     '''distance between two points'''
-    dx,dy,dz = dxdydz(p1, p2)
-    return np.sqrt(dx**2+dy**2+dz**2)
+    dx,dy,dz = p1.delta(p2)
+    return math.sqrt(dx*dx+dy*dy+dz*dz)
     
-def ppVec(p1:pd.Series, p2:pd.Series) -> Tuple[float]:
+def ppVec(p1:xyzPoint, p2:xyzPoint) -> Tuple[float]:
     '''get the normalized direction'''
-    dx,dy,dz = dxdydz(p1, p2)
-    dist =  np.sqrt(dx**2+dy**2+dz**2)
+    dx,dy,dz = p1.delta(p2)
+    dist = math.sqrt(dx*dx+dy*dy+dz*dz)
     if dist==0:
-        return [0,0,0]
+        return (0,0,0)
     else:
-        return [dx/dist, dy/dist, dz/dist]
+        return (dx/dist, dy/dist, dz/dist)
     
 def calcAngle(vec1, vec2):
     '''calculate the angle between two vectors'''
-    dot = np.dot(vec1, vec2)
+    dot = vec1[0]*vec2[0]+vec1[1]*vec2[1]+vec1[2]*vec2[2]
     if dot<=0:
         return 0
     else:
-        return np.arccos(dot)   # angle between traveled vec and target vec
+        return math.acos(min(dot, 1))   # angle between traveled vec and target vec
 
 
     
-def naPoint(row:pd.Series) -> bool:
+def naPoint(row:xyzPoint) -> bool:
     '''determine if the point is not filled'''
-    return pd.isna(row['x']) or pd.isna(row['y']) or pd.isna(row['z'])
+    return not toPoint(row).defined
     
-def dummyPoint() -> dict:
+def dummyPoint() -> xyzPoint:
     '''a point that we certainly won't be near'''
-    return {'x':-1000, 'y':-1000, 'z':-1000}
+    return xyzPoint(-1000, -1000, -1000)
 
-def emptyPoint() -> dict:
+def emptyPoint() -> xyzPoint:
     '''display nothing'''
-    return {'x':'', 'y':'', 'z':''}
+    return xyzPoint()
 
     
 class distances:
@@ -115,22 +93,22 @@ class distances:
 
         
         if trackPoints:
-            self.estimate = toXYZ(dummyPoint()) # where we think we are
+            self.estimate = dummyPoint() # where we think we are
             self.target = dummyPoint()   # point we're trying to hit
             self.last = dummyPoint()     # point we're coming from
             self.next = dummyPoint()     # the next point we will try to hit
         else:
-            self.estimate = ['','','']
+            self.estimate = emptyPoint()
             self.target = emptyPoint()   # point we're trying to hit
             self.last = emptyPoint()     # point we're coming from
             self.next = emptyPoint()     # the next point we will try to hit
             
-        self.read = toXYZ(dummyPoint())     # where the shopbot software thinks we are
-        self.lastread = toXYZ(dummyPoint()) # the last point where the shopbot software thought we were
+        self.read = dummyPoint()     # where the shopbot software thinks we are
+        self.lastread = dummyPoint() # the last point where the shopbot software thought we were
         
-        self.vec = [0,0,0]
-        self.targetVec = [0,0,0]
-        self.nextVec = [0,0,0]
+        self.vec = (0,0,0)
+        self.targetVec = (0,0,0)
+        self.nextVec = (0,0,0)
         
         self.trd = 0  # distance between the read loc and the target point
         self.lrd = 0  # distance between the read loc and the last point
@@ -138,52 +116,51 @@ class distances:
         self.ted = 0  # distance between the estimated loc and the target point
         self.led = 0  # distance between estimated loc and last point
         self.angle = 0 # angle between read movement and target direction
+        self.profile = None   # start speed, move speed, end speed, and acceleration of the move to the target
 
         self.trackPoints = trackPoints
 
        
-    def updateTarget(self, prevPoint:dict, newPoint:dict, nextPoint:dict) -> None:
-        '''update the target point'''
+    def updateTarget(self, prevPoint:xyzPoint, newPoint:xyzPoint, nextPoint:xyzPoint, profile:tuple=None) -> None:
+        '''update the target point. profile is the speed profile of the move from the motion model'''
         if not self.trackPoints:
             return
-        if pd.isna(prevPoint['x']):
-            print(prevPoint, newPoint, newPoint)
+        if np.isnan(prevPoint.x):
+            logging.debug(f'Previous point is undefined for target {newPoint}')
         self.last = prevPoint
         self.target = newPoint
         self.next = nextPoint
+        self.profile = profile
         self.targetVec = ppVec(self.last, self.target)
         self.nextVec = ppVec(self.target, self.next)
-        if 'x' in self.last and 'x' in self.target:
-            self.tld = ppDist(self.last, self.target)  
-        else:
-            self.tld = 0
+        self.tld = ppDist(self.last, self.target)  
         
-    def updateRead(self, read:list) -> None:
+    def updateRead(self, read:xyzPoint) -> None:
         '''update the current positions'''
+        if not read.defined:
+            # the position could not be read. keep the last one
+            return
         self.lastread = self.read
         self.read = read
         if self.trackPoints:
             self.trd = ppDist(self.read, self.target)   
-            if 'x' in self.last:
-                self.lrd = ppDist(self.read, self.last)   
-            else:
-                self.lrd = 0
+            self.lrd = ppDist(self.read, self.last)   
             
-    def calcEst(self, timeTaken:bool, pointTime, speed:float) -> None:
-        '''estimate the current location based on time since hitting last point and translation speed'''
+    def calcEst(self, timeTaken:bool, pointTime:float, speed:float, now:float) -> None:
+        '''estimate the current location based on time since hitting last point and translation speed. pointTime and now are in s'''
         if not self.trackPoints:
             return
-        if not timeTaken or not ('speed' in self.target and 'x' in self.last) or speed==0:
+        if not timeTaken or not self.target.inFile or speed==0:
             self.estimate = self.last
         else:
-            dnow = datetime.datetime.now()
-            dt = (dnow - pointTime).total_seconds()   # time since we hit the last point
-            pt = toXYZ(self.last, listOut=True)       # last point
+            dt = now - pointTime   # time since we hit the last point
+            pt = self.last                            # last point
             vec = self.targetVec                      # direction of travel
-            distTraveled = speed*dt              # distance traveled since we hit the last point
-            self.estimate = [pt[i]+distTraveled*vec[i] for i in range(3)]  # estimated position
-            # if pd.isna(self.estimate[0]):
-            #     print(self.estimate, pt, distTraveled, vec)
+            if self.profile is None:
+                distTraveled = speed*dt              # distance traveled since we hit the last point
+            else:
+                distTraveled = trapezoidDistance(dt, self.tld, *self.profile)   # distance traveled since we hit the last point, including acceleration
+            self.estimate = xyzPoint(pt.x+distTraveled*vec[0], pt.y+distTraveled*vec[1], pt.z+distTraveled*vec[2])  # estimated position
         self.ted = ppDist(self.estimate, self.target) 
         self.led = ppDist(self.estimate, self.last) 
         self.calcAngle()
@@ -201,10 +178,7 @@ class distances:
             return False
         if not hasattr(self, s):
             raise ValueError('Unexpected value passed to zeroMove. should be next or last')
-        for c in ['x', 'y', 'z']:
-            if not getattr(self, s)[c]==self.target[c]:
-                return False
-        return True
+        return getattr(self, s).equals(self.target)
         
         
 class pointWatchSignals(QObject):
@@ -218,8 +192,10 @@ class pointWatchSignals(QObject):
 class pointWatch(QObject):
     '''holds functions for iterating through points in an sbp file'''
     
-    def __init__(self, pSettings:dict, dt:float, diagStr, parent, runSimple:int, camFlags:list):
+    def __init__(self, pSettings:dict, dt:float, diagStr, parent, runSimple:int, camFlags:list, clock:Callable=time.perf_counter):
+        '''clock gives the time in s'''
         super().__init__()
+        self.clock = clock
         self.trackPoints = (not runSimple==1)
         self.camFlags = camFlags
         self.d = distances(self.trackPoints)
@@ -234,6 +210,8 @@ class pointWatch(QObject):
         self.tableDone = False
         self.waitingForLastRead = False
         self.diagStr = diagStr
+        self.motion = None   # predicted timing of each move
+        self.edgeTimes = {}  # times of the flag edges the arduino saw during this step, keyed by (flag0, on)
         self.resetPointTime()
         self.onoffCount = {'on':{}, 'off':{}}   # count how many times the flag has turned on and off
         self.printLoop = parent
@@ -258,136 +236,110 @@ class pointWatch(QObject):
         return self.diagStr.addHeader('\t'.join(l)+'|')
     
     
-    def diagPosRow(self, flag:int, newPoint:bool) -> str:
-        l = []
-        if not self.trackPoints:
-            llll = ['read']
-        else:
-            llll =  ['read', 'estimate', 'target']
-        for s1 in llll:
-            if newPoint and not s1=='target':
-                l = l+[f'{i:6s}' for i in [' ', ' ', ' ']]
-            else:
-                x,y,z = toXYZ(getattr(self.d, s1))
-                l = l+[f'{i:6.2f}' for i in [x,y,z]]
-            l[-1] = l[-1]+'|'
-        if self.trackPoints:
-            l = l+[str(int(self.d.target['line'])), f'{self.queuedLine}|']
-        l.append(f'{flag:4.0f}')
-             
-        if self.trackPoints:
-            if newPoint:
-                s0 = ''
-                l = l + [f'{s0:4s}', f'{s0:4s}',f'{s0:3s}', f'{s0:5s}|']
-            else:
-                l = l+[f'{self.speed:4.1f}', f'{self.timeTaken:4b}',f'{self.hitRead:3b}', f'{self.trusted:5b}|']
-
-            for s in ['trd', 'lrd', 'tld', 'ted', 'led']:
-                l.append(f'{getattr(self.d, s):5.2f}')
-        self.diagStr.addRow('\t'.join(l)+'|')
+    def diagPosRow(self, flag:int, newPoint:bool) -> None:
+        '''record the positions and distances for this time step. the diagnostics thread formats them later'''
+        self.diagStr.recordPoint(self, flag)
     
         
     #-------------------  
     # initializing
     
-    def readCSV(self, sbpfile:str):
-        '''get list of points from the sbp file'''
+    def readSBP(self, sbpfile:str):
+        '''get the table of points from the sbp file'''
         if not sbpfile.endswith('.sbp'):
-            raise ValueError('Input to SBPtimings must be an SBP file')
-        sbpfile = sbpfile
-        csvfile = sbpfile.replace('.sbp', '.csv')
-        if not os.path.exists(csvfile) or os.path.getmtime(csvfile)<os.path.getmtime(sbpfile):
-            # if there is no csv file or the sbp file was edited since the csv file was created, create a csv
-            sp = SBPPoints(sbpfile)
-            sp.export()
-            sp = pd.read_csv(csvfile, index_col=0)
-        else:
-            sp = pd.read_csv(csvfile, index_col=0)
-            if not 'line' in sp:
-                # overwrite the file
-                sp = SBPPoints(sbpfile)
-                sp.export()
-                sp = pd.read_csv(csvfile, index_col=0)
-        self.initializePoints(sp)
-    
-    def initializePoints(self, sp:pd.DataFrame):
+            raise ValueError('Input to pointWatch must be an SBP file')
+        sp = loadSBP(sbpfile)
+        self.motion = sp.motion
+        logging.info(f'Predicted print time for {os.path.basename(sbpfile)}: {formatDuration(self.motion.duration)}')
+        self.initializePoints(sp.points.copy())   # copy because fillTable edits the coordinates
+    
+    def initializePoints(self, sp:pointTable):
         '''initialize the point table and the indices'''
         self.points = sp
-        self.pointsi = -1
-        negpoints = self.points[self.points.z<=0]
+        self.pointsi = -1   # index of the row we just read
+        self.lasti = -1     # index of the point we're coming from
+        self.targeti = -1   # index of the point we're trying to hit
+        self.nexti = -1     # index of the next point we will try to hit
+        z = self.points.z
+        negpoints = z[z<=0]
         if len(negpoints)>0:
-            self.zmax = negpoints.z.max() + 2
+            self.zmax = negpoints.max() + 2
+        elif np.isnan(z).all():
+            self.zmax = np.nan
         else:
-            self.zmax = self.points.z.max()
+            self.zmax = np.nanmax(z)
         self.fillTable()    # fill empty entries with current position
         
         
 
     def fillTable(self) -> None:
         '''go through the top of the table and fill empty entries with the current position'''
-        self.starti = 0
-        for i,row in self.points.iterrows():
-            if naPoint(self.points.loc[i]):
-                for j,var in {0:'x', 1:'y', 2:'z'}.items():
-                    if pd.isna(self.points.loc[i, var]):
-                        self.points.loc[i, var] = self.d.read[j]   # fill empty value
-                        self.starti = i+2
-            else:
-                return
+        xyz = self.points.xyz
+        na = np.isnan(xyz)
+        full = ~na.any(axis=1)
+        if full.any():
+            k = int(np.argmax(full))   # first row with all coordinates
+        else:
+            k = len(xyz)
+        if k==0:
+            self.starti = 0
+            return
+        for j,c in enumerate(self.d.read):
+            xyz[:k,j][na[:k,j]] = c   # fill empty values
+        self.points.updateValid()
+        self.starti = k+1
             
     #-------------------
     # tracking points
     
-    def getPrevPoint(self) -> pd.Series:
-        '''get the last point with coordinates'''
-        ii = self.pointsi-1
-        while ii>=0 and pd.isna(self.points.iloc[ii]['x']):
-            ii = ii-1
-        if ii>=0:
-            prevPoint = self.points.iloc[ii]
-        else:
-            prevPoint = dummyPoint()
-        return prevPoint
-    
-    def getNextPoint(self) -> pd.Series:
-        '''get the next point with coordinates'''
-        # new target point
-        ii = self.pointsi+1
-        while ii<len(self.points) and pd.isna(self.points.iloc[ii]['x']):
-            ii = ii+1
-        if ii<len(self.points):
-            nextPoint = self.points.iloc[ii]
+    def pointAt(self, i:int) -> xyzPoint:
+        '''get the point at index i, or a dummy point if there is none'''
+        if i>=0 and i<len(self.points):
+            return self.points.point(i)
         else:
-            nextPoint = dummyPoint()
-        return nextPoint
+            return dummyPoint()
+    
+    def getPrevPoint(self) -> int:
+        '''get the index of the last point with coordinates'''
+        return int(self.points.prevValid[self.pointsi])
     
-    def readPoint(self, letQueuedKill:bool=True) -> pd.Series:
-        '''read the next point from the points list'''
+    def getNextPoint(self) -> int:
+        '''get the index of the next point with coordinates'''
+        return int(self.points.nextValid[self.pointsi])
+    
+    def readPoint(self, letQueuedKill:bool=True) -> int:
+        '''read the next point from the points table. return the index of the row, or -1 if the read was rejected'''
         if not self.trackPoints:
-            return
+            return -1
         if self.tableDone:
             # we've already hit the end
-            return {}
+            return -1
         if letQueuedKill:
-            if self.pointsi>0 and self.queuedLine>0 and self.points.iloc[self.pointsi]['line']>self.queuedLine+1:
+            if self.pointsi>0 and self.queuedLine>0 and self.points.line[self.pointsi]>self.queuedLine+1:
                 # don't read the point if we're ahead of the file
                 self.waitingForLastRead = True
-                return {}
+                return -1
         self.timeTaken = False
         self.hitRead = False
         self.waitingForLastRead = False
         self.trusted = False
         self.pointsi+=1
         if self.pointsi>=0 and self.pointsi<len(self.points):
-            targetPoint = self.points.iloc[self.pointsi] 
-            if pd.isna(targetPoint['speed']):
+            if self.points.flowStep(self.pointsi):
                 # just changing flow speed
-                return targetPoint            
-            self.d.updateTarget(self.getPrevPoint(), targetPoint, self.getNextPoint())
-            self.speed = float(self.d.target['speed'])
+                return self.pointsi
+            self.lasti = self.getPrevPoint()
+            self.targeti = self.pointsi
+            self.nexti = self.getNextPoint()
+            if self.motion is None:
+                profile = None
+            else:
+                profile = self.motion.profile(self.targeti)
+            self.d.updateTarget(self.pointAt(self.lasti), self.pointAt(self.targeti), self.pointAt(self.nexti), profile)
+            self.speed = self.d.target.speed
         else:
             self.tableDone = True
-        return self.d.target
+        return self.targeti
     
     def incrementOnOff(self, flag0:int, s:str, val:int=1) -> None:
         '''add to the on off count'''
@@ -400,13 +352,8 @@ class pointWatch(QObject):
     def flagReset(self, flag0:int, on:bool) -> int:
         '''reset the time and find the right point because the real flag turned on. return 1 if error'''
         # find the points when the pressure turns on
-        if on:
-            b = 0
-            a = 1
-        else:
-            b = 1
-            a = 0
-        df = self.points[(self.points[f'p{flag0}_before']==b)&(self.points[f'p{flag0}_after']==a)]
+        rows = self.points.transitions(flag0, on)
+        lines = self.points.transitionLines(flag0, on)
         if on:
             s = 'on'
         else:
@@ -414,40 +361,47 @@ class pointWatch(QObject):
             
         self.incrementOnOff(flag0, s)
         idx = self.onoffCount[s][flag0]
-        if idx>=len(df):
-            print(f'Too many flag resets:{flag0+1}:{s}, {idx}/{len(df)}')
+        if idx>=len(rows):
+            print(f'Too many flag resets:{flag0+1}:{s}, {idx}/{len(rows)}')
             return 1
         # print(self.onoffCount)
-        i = df.iloc[idx].name  # get the index of the point we just hit
-        if self.points.iloc[i]['line']>self.queuedLine+15:
+        maxk = int(np.searchsorted(lines, self.queuedLine+15, side='right'))   # transitions that are not way ahead of the queued line
+        if idx>=maxk:
             # we are way ahead of the queued line. we might have hit an accidental flag flip. undo
             self.incrementOnOff(flag0, s, val=-1)
             return 1
+        i = int(rows[idx])  # get the index of the point we just hit
         
-        if idx<len(df)-1:
-            ln = df.iloc[idx+1].name
-            if 5*abs(self.pointsi-ln)<abs(self.pointsi-i) and abs(self.pointsi-i)>100:
-                # we are much closer to the next point than the previous one. we must have missed a flip.
-                self.incrementOnOff(flag0, 'off')
-                self.incrementOnOff(flag0, 'on')
-                self.getSadd('FLIP', {'Missed 2 flips'})
-                i = ln
+        # find the transition closest to where we are
+        k = int(np.searchsorted(rows, self.pointsi))
+        ln = i
+        for kk in [k-1, k]:
+            if kk>idx and kk<maxk and abs(self.pointsi-rows[kk])<abs(self.pointsi-ln):
+                ln = int(rows[kk])
+                kn = kk
+        if not ln==i and 5*abs(self.pointsi-ln)<abs(self.pointsi-i) and abs(self.pointsi-i)>100:
+            # we are much closer to a later transition than this one. we must have missed flips.
+            missed = kn-idx
+            self.incrementOnOff(flag0, 'off', val=missed)
+            self.incrementOnOff(flag0, 'on', val=missed)
+            self.getSadd('FLIP', {f'Missed {2*missed} flips':True})
+            i = ln
         
         self.pointsi = i
         self.printLoop.readPoint(letQueuedKill=False)        # go to the next point
-        self.resetPointTime()   # mark the start of the movement as now
+        self.resetPointTime(self.edgeTimes.get((flag0, on), -1))   # mark the start of the movement at the flag edge, or now
         self.timeTaken = True
         self.trusted = True
         if on:
             if self.onoffCount['on'][flag0]>self.onoffCount['off'][flag0]+1:
                 # we must have missed an off
                 self.incrementOnOff(flag0, 'off')
-                self.getSadd('FLIP', {'Missed off flip'})
+                self.getSadd('FLIP', {'Missed off flip':True})
         else:
             if self.onoffCount['off'][flag0]>self.onoffCount['on'][flag0]:
                 # we must have missed an on
                 self.incrementOnOff(flag0, 'on')
-                self.getSadd('FLIP', {'Missed on flip'})
+                self.getSadd('FLIP', {'Missed on flip':True})
         return 0
         
             
@@ -462,7 +416,7 @@ class pointWatch(QObject):
             while not on and not self.tableDone:
                 self.readPoint()
                 for flag0 in flags:
-                    if self.d.target[f'p{flag0}_after']==1:
+                    if self.points.flagState(self.targeti, flag0)[1]==1:
                         on = True
         else:
             self.readPoint()
@@ -472,18 +426,33 @@ class pointWatch(QObject):
         #-------------------
     # loop actions
     
-    def resetPointTime(self):
-        '''reset the time of the start of the last move'''
-        self.pointTime = datetime.datetime.now()-datetime.timedelta(seconds=self.dt/1000)
+    def resetPointTime(self, t:float=-1):
+        '''reset the time of the start of the last move. t is the time of the flag edge that started the move, if the arduino saw it'''
+        if t>=0:
+            self.pointTime = t
+            return
+        self.pointTime = self.clock()-self.dt/1000
         # print('new point time', self.pointTime)
     
-    def updateReadLoc(self, readLoc:dict) -> None:
+    def updateEdges(self, edges:List[Tuple[float, int, bool]]) -> None:
+        '''store the times of the flag edges the arduino saw since the last step. edges are (time, 1-indexed flag, on)'''
+        self.edgeTimes = {}
+        for t,flag1,on in edges:
+            self.edgeTimes[(flag1-1, on)] = t
+            
+    def edgeLag(self, flag0:int, on:bool) -> float:
+        '''get the time in ms between the flag edge and now, or -1 if the arduino did not see the edge'''
+        if not (flag0, on) in self.edgeTimes:
+            return -1
+        return (self.clock()-self.edgeTimes[(flag0, on)])*1000
+    
+    def updateReadLoc(self, readLoc:xyzPoint) -> None:
         '''update the read point'''
         # update read point and calculate read distances
         self.d.updateRead(readLoc)
         self.checkTimeTaken()   # check if we've taken the start time
         # update estimate point and angle
-        self.d.calcEst(self.timeTaken, self.pointTime, self.speed)
+        self.d.calcEst(self.timeTaken, self.pointTime, self.speed, self.clock())
         self.signals.trusted.emit(self.trusted) # send the trusted status back to the printLoop
         self.checkHitRead()     # check if we've hit the read point
         
@@ -501,23 +470,29 @@ class pointWatch(QObject):
     
     def printStarted(self) -> bool:
         '''determine if we have entered the printing space'''
-        return self.d.read[2]<self.zmax
+        return self.d.read.z<self.zmax
     
     def retracting(self, diag:bool=False) -> bool:
         '''determine if we are retracting above the printing space'''
-        ret = float(self.d.read[2])>(self.zmax)
+        ret = self.d.read.z>(self.zmax)
         if self.diagStr.diag>1 and ret and diag:
-            print(f'\tz above max, {self.d.read[2]:0.2f}, {self.zmax:0.2f}, {self.pointsi}, {self.starti}')
+            print(f'\tz above max, {self.d.read.z:0.2f}, {self.zmax:0.2f}, {self.pointsi}, {self.starti}')
         return ret
     
+    def transitionSoon(self, horizon:float) -> bool:
+        '''the target point changes a flag, and we expect to reach it within horizon seconds'''
+        if not self.trackPoints or self.tableDone or self.targeti<0 or not self.speed>0:
+            return False
+        if not self.points.flagChange(self.targeti):
+            return False
+        return self.d.ted<self.speed*horizon
+    
     def noFlagChanges(self) -> bool:
         '''camera flags are not changing during this move'''
         for flag0 in self.camFlags:
-            b = f'p{flag0}_before'
-            a = f'p{flag0}_after'
-            if a in self.d.target and b in self.d.target:
-                if self.d.target[a]!=self.d.target[b]:
-                    return False
+            b,a = self.points.flagState(self.targeti, flag0)
+            if a!=b:
+                return False
         
         
 #         for c in self.d.target.keys():
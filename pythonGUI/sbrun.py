@@ -0,0 +1,608 @@
+#!/usr/bin/env python
+'''Shopbot GUI functions for running a list of sbp files from the command line, without building the GUI window. Uses the same queue, autoplay, fluigent, camera, and time series logic as the GUI, with settings from the config file.
+usage: python sbrun.py [options] file.sbp [fileList.txt BREAK file2.sbp ...]'''
+
+# external packages
+from PyQt5.QtCore import pyqtSignal, pyqtSlot, QCoreApplication, QObject, QThread, QThreadPool, QTimer
+import os, sys
+import argparse
+import time
+import datetime
+from typing import List, Dict, Tuple, Union, Any, TextIO
+import logging
+
+# local packages
+from config import cfg
+from flags import *
+from sbprint import *
+from sbprintProcess import *
+from sbSimulator import *
+from fluThreads import convertPressure, checkPressure, fluCommander, pressureRecorder, fluigentBackend, simulatorSettings
+from files import riffle, fileTime, subFolder, uniqueFile, saveMetaTable, timeTableWriter, recoverTimeTable
+from sbList import isFileList, readFileList, queueEntry, nextIndex, playNext
+
+
+#----------------------------------------------------------------------
+
+class headlessChannel(QObject):
+    '''a fluigent pressure channel with no widgets. The pressure during the print comes from the command line instead of a text box'''
+
+    def __init__(self, chanNum0:int, fluBox, runPressure:float=0):
+        super(headlessChannel, self).__init__()
+        self.chanNum0 = chanNum0   # 0-indexed
+        self.cname = f'channel{chanNum0}'
+        self.fluBox = fluBox
+        self.units = fluBox.units
+        self.flag1 = cfg.fluigent[self.cname].flag1
+        self.runPressure = runPressure
+        self.printStatus = ''
+
+    def goToPressure(self, runPressure:float, status:bool) -> None:
+        '''go to the given pressure'''
+        if self.fluBox.connected:
+            self.fluBox.commander.request(self.chanNum0, runPressure, self.units)
+        if status:
+            logging.info(f'Setting channel {self.chanNum0} to {runPressure} {self.units}')
+
+    @pyqtSlot(float)
+    def goToRunPressure(self, scale:float) -> None:
+        '''set the pressure for this channel to the run pressure'''
+        self.goToPressure(self.runPressure*scale, False)
+
+    @pyqtSlot()
+    @pyqtSlot(bool)
+    def zeroChannel(self, status:bool=True) -> None:
+        '''zero the channel pressure'''
+        self.goToPressure(0, status)
+
+    @pyqtSlot(str)
+    def updatePrintStatus(self, status:str) -> None:
+        '''store the status'''
+        self.printStatus = status
+
+    def reading(self) -> Union[int, float]:
+        '''read the current pressure in the display units'''
+        return convertPressure(checkPressure(self.fluBox.backend, self.chanNum0), 'mbar', self.units)
+
+    def writeToTable(self, writer) -> None:
+        '''write metatable values to a csv writer object'''
+        writer.writerow([f'ink_pressure_channel_{self.chanNum0}',self.units, self.runPressure])
+        writer.writerow([f'flag1_channel_{self.chanNum0}','', self.flag1])
+
+
+class headlessFluigent:
+    '''the fluigent pressure controller, without the plot or widgets. If the controller is not found, the channels from the config file are still created so the print can run, but pressures are not sent'''
+
+    def __init__(self, pressures:dict, connect:bool=True):
+        '''pressures is a dictionary of 0-indexed channel numbers and pressures to use during the print'''
+        self.units = cfg.fluigent.units
+        self.savePressure = cfg.fluigent.savePressure
+        self.recordDt = cfg.fluigent.recordDt if 'recordDt' in cfg.fluigent else 10
+        self.recorder = None
+        self.connected = False
+        self.pChans = 0
+        self.backend = fluigentBackend() if connect else None    # real or simulated controller
+        if not self.backend is None:
+            try:
+                self.backend.init()
+                self.pChans = self.backend.pressureChannelCount()
+            except Exception as e:
+                logging.warning(f'Failed to connect to Fluigent: {e}')
+        self.connected = self.pChans>0
+        if not self.connected:
+            logging.info('Fluigent not connected. Pressures will not be sent')
+            self.pChans = len([key for key in cfg.fluigent if key.startswith('channel')])
+        self.numChans = self.pChans
+        if self.connected:
+            # send pressures from a separate thread
+            self.commander = fluCommander(self.backend)
+            self.commander.start()
+        self.pchannels = [headlessChannel(i, self, pressures.get(i, 0)) for i in range(self.pChans)]
+
+    def resetAllChannels(self, exclude:int) -> None:
+        '''Set all of the channels to 0 except for exclude (0-indexed). Input -1 to turn everything off'''
+        for i in range(self.numChans):
+            if not i==exclude:
+                self.pchannels[i].zeroChannel(False)
+
+    def pressureTriggered(self, channels0Triggered:list) -> bool:
+        '''determine if any pressure channels are triggered during the print'''
+        for channel in self.pchannels:
+            if channel.flag1-1 in channels0Triggered:
+                return True
+        return False
+
+    def timeRow(self, channels0Triggered:list) -> List:
+        '''get a list of values to collect for the time table'''
+        out = []
+        if self.savePressure and self.connected:
+            for channel in self.pchannels:
+                if channel.flag1-1 in channels0Triggered:
+                    out.append(channel.reading())
+        return out
+
+    def timeHeader(self, channels0Triggered:list) -> List:
+        '''get a list of header values for the time table'''
+        out = []
+        if self.savePressure and self.connected:
+            for channel in self.pchannels:
+                if channel.flag1-1 in channels0Triggered:
+                    out.append(f'Channel_{channel.chanNum0}_pressure({self.units})')
+        return out
+
+    def startRecording(self, fn:str) -> None:
+        '''start logging every pressure reading with its controller timestamp to fn'''
+        if not (self.savePressure and self.connected and self.recordDt>0):
+            return
+        meta = {'flag1':[channel.flag1 for channel in self.pchannels]}
+        try:
+            self.recorder = pressureRecorder(self.backend, fn, meta, list(range(self.pChans)), self.recordDt)
+        except OSError as e:
+            logging.warning(f'Could not record pressures to {fn}: {e}')
+            return
+        self.recorder.start()
+
+    def stopRecording(self) -> None:
+        '''finish the pressure log'''
+        if self.recorder is None:
+            return
+        self.recorder.close()
+        self.recorder = None
+
+    def writeToTable(self, writer) -> None:
+        '''write metadata to the csv writer'''
+        for channel in self.pchannels:
+            channel.writeToTable(writer)
+
+    def close(self) -> None:
+        '''turn off the channels and disconnect'''
+        self.stopRecording()
+        if self.connected:
+            try:
+                self.resetAllChannels(-1)
+                self.commander.close()    # send the zeros before disconnecting
+                self.backend.close()
+            except Exception as e:
+                print(e)
+            else:
+                logging.info('Fluigent closed')
+
+
+#----------------------------------------------------------------------
+
+
+class headlessRunner(QObject):
+    '''runs a queue of sbp files without the GUI window. It stands in for the window and the shopbot box, so the print loop finds the fluigent channels, cameras, and file names in the same places'''
+
+    def __init__(self, files:List[str], folder:str, pressures:dict, autoPlay:bool, wait:float, fluigent:bool=True, cameras:bool=False):
+        super(headlessRunner, self).__init__()
+        self.files = self.expandFiles(files)
+        self.folder = folder
+        self.autoPlay = autoPlay
+        self.wait = wait           # time to wait between files in s
+        self.index = 0             # index of the current file
+        self.results = []          # list of [file, result]
+        self.done = False
+        self.save = False
+        self.fileName = ''
+        self.runningSBP = False
+        self.printStatus = ''
+        self.trusted = False
+        self.loadConfig(cfg)
+
+        self.arduino = arduino(connect=not cfg.shopbot.simulate.on)
+        if cfg.shopbot.simulate.on:
+            backend = sb3Simulator(speed=cfg.shopbot.simulate.speed)
+        else:
+            backend = None
+        self.keys = SBKeys(self.diag, self.arduino, backend)
+        self.keys.signals.status.connect(self.updateStatus)
+        self.keys.signals.flag.connect(self.updateFlag)
+        self.keys.signals.pos.connect(self.updateXYZ)
+        self.keys.signals.lastRead.connect(self.updateLastRead)
+        if fluigent:
+            self.fluBox = headlessFluigent(pressures)
+        if cameras:
+            self.connectCameras()
+
+    def loadConfig(self, cfg1) -> None:
+        '''load the print settings from the config file'''
+        self.runFlag1 = cfg1.shopbot.flag1
+        self.critTimeOn = dict(cfg1.shopbot.critTimeOn)
+        self.critTimeOff = dict(cfg1.shopbot.critTimeOff)
+        self.burstLength = dict(cfg1.shopbot.burstLength)
+        self.zeroDist = cfg1.shopbot.zeroDist
+        self.burstScale = cfg1.shopbot.burstScale
+        self.runSimple = cfg1.shopbot.runSimple
+        self.units = cfg1.shopbot.units
+        self.checkFreq = dict(cfg1.shopbot.dt)
+        self.dt = float(cfg1.shopbot.dt.value)
+        self.saveFreq = cfg1.shopbot.saveDt.value
+        self.savePos = cfg1.shopbot.includePositionInTable
+        self.saveFlag = cfg1.shopbot.includeFlagInTable
+        self.savePicMetadata = cfg1.shopbot.savePicMetadata
+        self.diag = cfg1.shopbot.diag
+
+    def connectCameras(self) -> None:
+        '''connect the cameras in the config file. cameras need opencv and a QApplication'''
+        try:
+            import cameras
+        except ModuleNotFoundError as e:
+            logging.warning(f'Cameras not available: {e}')
+            return
+        self.camBoxes = cameras.camBoxes(self, connect=False)
+        self.camBoxes.connect()
+
+    def expandFiles(self, files:List[str]) -> List[str]:
+        '''replace lists of files with the files they contain, like the file queue in the GUI'''
+        out = []
+        for fn in files:
+            if isFileList(fn):
+                out = out + readFileList(fn)
+            else:
+                out.append(fn)
+        return out
+
+    #-------------
+    # stand-ins for the GUI
+
+    @pyqtSlot(str,bool)
+    def updateStatus(self, st:str, log:bool) -> None:
+        '''log the status'''
+        if log:
+            logging.info(st)
+
+    @pyqtSlot(int)
+    def updateFlag(self, sbFlag:int) -> None:
+        self.sbFlag = sbFlag
+
+    @pyqtSlot(int)
+    def updateLastRead(self, line:int) -> None:
+        self.lastRead = line
+
+    @pyqtSlot(float,float,float)
+    def updateXYZ(self, x:float, y:float, z:float) -> None:
+        self.x, self.y, self.z = x, y, z
+
+    @pyqtSlot(float,float,float)
+    def updateXYZest(self, x:float, y:float, z:float) -> None:
+        self.xe, self.ye, self.ze = x, y, z
+
+    @pyqtSlot(float,float,float)
+    def updateXYZt(self, x:float, y:float, z:float) -> None:
+        self.xt, self.yt, self.zt = x, y, z
+
+    @pyqtSlot(float)
+    def updateSpeed(self, speed:float) -> None:
+        self.speed = speed
+
+    @pyqtSlot(int)
+    def updateXYZtline(self, line:int) -> None:
+        self.tline = line
+
+    @pyqtSlot(str)
+    def updatePrintStatus(self, s:str) -> None:
+        if len(self.printStatus)>0:
+            if len(s)>0:
+                self.printStatus = f'{self.printStatus}, {s}'
+        else:
+            self.printStatus = s
+
+    @pyqtSlot(bool)
+    def updateTrusted(self, t:bool) -> None:
+        self.trusted = t
+
+    def sbpName(self) -> str:
+        '''get the current sbp file'''
+        if self.index<len(self.files):
+            return self.files[self.index]
+        else:
+            return ''
+
+    def pSettings(self) -> dict:
+        '''get the settings for the print loop'''
+        return {'critTimeOn':self.critTimeOn, 'zeroDist':self.zeroDist, 'critTimeOff':self.critTimeOff, 'burstScale':self.burstScale, 'burstLength':self.burstLength, 'runSimple':self.runSimple}
+
+    #-------------
+    # file names
+
+    def newFile(self, deviceName:str, ext:str) -> str:
+        '''Generate a new file name for device and with extension, using the naming settings in the config file'''
+        sep = cfg.files.separator
+        folder = self.folder
+        if not os.path.exists(folder):
+            raise NameError(f'Invalid folder name {folder}. File not saved.')
+        sbBase = os.path.splitext(os.path.basename(self.sbpName()))[0]
+        if cfg.files.createSubfolders:
+            folder = subFolder(folder, sep, cfg.files.tag if cfg.files.includeSampleInFolder else ''
+                               , time.strftime(cfg.files.dateFormat), cfg.files.includeDateRadio
+                               , sbBase, cfg.files.includeSBRadio)
+        t = fileTime(cfg.files.timeFormat) if cfg.files.includeTimeInFile else ''
+        baseBare = riffle(sbBase if cfg.files.includeSBInFile else '', deviceName, cfg.files.tag if cfg.files.includeSampleInFile else '', t, separator=sep)
+        return uniqueFile(folder, baseBare, ext, sep, cfg.files.duplicateFormat)
+
+    #-------------
+    # metadata and time series
+
+    def saveMetaData(self) -> None:
+        '''save metadata including print speeds, pressures, and camera settings'''
+        try:
+            fullfn = self.newFile('meta', '.csv')
+        except NameError as e:
+            logging.error(f'Failed to save meta file: {e}')
+            return
+        saveMetaTable(fullfn, [self, getattr(self, 'fluBox', None), getattr(self, 'camBoxes', None)])
+        logging.info(f'Saved {fullfn}')
+
+    def writeToTable(self, writer) -> None:
+        '''write the sbp file and print settings to the metadata table'''
+        for row in printSettingsTable(self.sbpName(), self.runFlag1, self.pSettings(), self.units, self.checkFreq):
+            writer.writerow(row)
+
+    def timeRow(self) -> List:
+        '''get a list of position and flag values to collect for the time table'''
+        values = {s:getattr(self, s) for s in ['x', 'y', 'z', 'xe', 'ye', 'ze', 'xt', 'yt', 'zt', 'speed', 'sbFlag', 'lastRead', 'tline', 'trusted', 'printStatus'] if hasattr(self, s)}
+        self.printStatus = ''
+        return sbTimeRow(values, self.savePos, self.saveFlag, self.runSimple)
+
+    def timeHeader(self) -> List:
+        '''get a list of header values for the time table'''
+        return sbTimeHeader(self.savePos, self.saveFlag, self.runSimple)
+
+    def initSaveTable(self) -> None:
+        '''initialize a table that saves data during a print. The rows are streamed to the file while the print runs'''
+        try:
+            self.fileName = self.newFile('time', '.csv')
+        except NameError:
+            self.fileName = ''
+            return
+        if hasattr(self, 'fluBox'):
+            phead = self.fluBox.timeHeader(self.channels0Triggered)
+        else:
+            phead = []
+        try:
+            self.tableWriter = timeTableWriter(self.fileName, ['time(s)']+phead+self.timeHeader())
+        except OSError as e:
+            logging.error(f'Could not save time table to {self.fileName}: {e}')
+            return
+        self.tableWriter.start()
+        if hasattr(self, 'fluBox'):
+            self.fluBox.startRecording(self.newFile('pressure', '.fpr'))   # log every pressure reading
+        self.save = True
+        self.tStart = datetime.datetime.now()
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.readValues)
+        self.timer.start(self.saveFreq)
+
+    def readValues(self) -> None:
+        '''add values to the table'''
+        if self.save:
+            tnow = (datetime.datetime.now()-self.tStart).total_seconds()
+            if hasattr(self, 'fluBox'):
+                plist = self.fluBox.timeRow(self.channels0Triggered)
+            else:
+                plist = []
+            self.tableWriter.put([tnow]+plist+self.timeRow())
+
+    def writeSaveTable(self) -> None:
+        '''stop recording and finish writing the table'''
+        if not self.save:
+            return
+        self.timer.stop()
+        self.save = False
+        self.tableWriter.close()
+        logging.info(f'Saved {self.fileName}')
+        if hasattr(self, 'fluBox'):
+            self.fluBox.stopRecording()
+
+    #-------------
+    # run the queue
+
+    @pyqtSlot()
+    def runFile(self) -> None:
+        '''wait for the shopbot to be ready, then run the current file'''
+        self.runningSBP = True
+        self.trusted = False
+        self.printStatus = ''
+        self.keys.lock()
+        self.keys.runningSBP = True
+        self.keys.unlock()
+        waitRunnable = waitForReady(self.dt, self.keys)
+        waitRunnable.signals.finished.connect(self.runFileContinue)
+        QThreadPool.globalInstance().start(waitRunnable)
+
+    @pyqtSlot()
+    def runFileContinue(self) -> None:
+        '''send the file to the shopbot and wait for the flow to start'''
+        fn = self.sbpName()
+        entry = queueEntry(fn)
+        if not entry=='run':
+            if entry=='break':
+                logging.info('Break point hit.')
+                self.results.append([fn, 'break'])
+            else:
+                logging.error(f'SBP file does not exist: {fn}')
+                self.results.append([fn, 'skipped'])
+            self.index = nextIndex(self.index, len(self.files))
+            self.readyState()
+            return
+        self.channels0Triggered = list(loadSBP(fn).triggered)
+        if not self.runFlag1-1 in self.channels0Triggered:
+            logging.error(f'Missing flag in sbp file: {self.runFlag1}')
+            self.results.append([fn, 'skipped'])
+            self.index = nextIndex(self.index, len(self.files))
+            self.readyState()
+            return
+        self.channels0Triggered.remove(self.runFlag1-1)
+
+        logging.info(f'Running SBP file {fn}')
+        if cfg.shopbot.tick.process:
+            self.printWorker = printProcess(self.dt, self.keys, fn, self.pSettings(), self, self.runFlag1)
+        else:
+            self.printWorker = printLoop(self.dt, self.keys, fn, self.pSettings(), self, self.runFlag1)
+        self.printWorker.signals.aborted.connect(self.triggerKill)
+        self.printWorker.signals.finished.connect(self.triggerEndOfPrint)
+        self.printWorker.signals.estimate.connect(self.updateXYZest)
+        self.printWorker.signals.target.connect(self.updateXYZt)
+        self.printWorker.signals.speed.connect(self.updateSpeed)
+        self.printWorker.signals.targetLine.connect(self.updateXYZtline)
+        self.printWorker.signals.status.connect(self.updatePrintStatus)
+        self.printWorker.signals.trusted.connect(self.updateTrusted)
+
+        self.printStatus = 'Sending file'
+        self.keys.lock()
+        self.keys.sendFile(fn)
+        self.keys.unlock()
+
+        waitRunnable = waitForStart(self.dt, self.keys, self.runFlag1, self.channels0Triggered)
+        waitRunnable.signals.finished.connect(self.triggerWatch)
+        waitRunnable.signals.status.connect(self.updateStatus)
+        QThreadPool.globalInstance().start(waitRunnable)
+
+    @pyqtSlot()
+    def triggerWatch(self) -> None:
+        '''start recording and start the print loop'''
+        if not self.runningSBP:
+            return
+        if hasattr(self, 'camBoxes') and len(self.channels0Triggered)>0:
+            self.camBoxes.startRecording()
+        if self.savePicMetadata or (hasattr(self, 'fluBox') and self.fluBox.pressureTriggered(self.channels0Triggered)):
+            self.saveMetaData()
+            self.initSaveTable()
+        self.printStatus = 'Start recordings'
+
+        self.printThread = QThread()
+        self.printWorker.moveToThread(self.printThread)
+        self.printThread.started.connect(self.printWorker.run)
+        self.printWorker.signals.finished.connect(self.printThread.quit)
+        self.printWorker.signals.aborted.connect(self.printThread.quit)
+        self.printThread.start()
+
+    def stopRunning(self) -> None:
+        '''stop watching the flags, and close the devices after 1 second'''
+        self.keys.lock()
+        self.keys.runningSBP = False
+        self.keys.unlock()
+        if self.runningSBP:
+            QTimer.singleShot(1000, self.closeDevices)
+
+    @pyqtSlot()
+    def closeDevices(self) -> None:
+        '''stop all recording devices, then go on to the next file or stop'''
+        if hasattr(self, 'fluBox'):
+            self.fluBox.resetAllChannels(-1)
+        if hasattr(self, 'camBoxes'):
+            self.camBoxes.stopRecording()
+        self.writeSaveTable()
+        if hasattr(self, 'printThread'):
+            self.printThread.wait()
+        if playNext(self.autoPlay, self.index) and not self.done:
+            logging.info('Autoplay is on: Running next file.')
+            QTimer.singleShot(int(self.wait*1000), self.runFile)
+        else:
+            self.readyState()
+
+    def readyState(self) -> None:
+        '''stop the queue'''
+        self.runningSBP = False
+        self.keys.lock()
+        self.keys.runningSBP = False
+        self.keys.unlock()
+        self.done = True
+        QTimer.singleShot(0, self.close)
+
+    @pyqtSlot()
+    def triggerKill(self) -> None:
+        '''the print was stopped, so stop the queue'''
+        logging.info('Stop hit')
+        self.results.append([self.sbpName(), 'aborted'])
+        self.done = True
+        self.stopRunning()
+
+    @pyqtSlot()
+    def triggerEndOfPrint(self) -> None:
+        '''we finished the file, so stop and move onto the next one'''
+        logging.info('File completed')
+        self.printStatus = 'File completed'
+        self.results.append([self.sbpName(), 'finished'])
+        self.index = nextIndex(self.index, len(self.files))
+        self.stopRunning()
+
+    def exitCode(self) -> int:
+        '''1 if any file was aborted or skipped, otherwise 0'''
+        return int(any([r in ['aborted', 'skipped'] for fn,r in self.results]))
+
+    @pyqtSlot()
+    def close(self) -> None:
+        '''disconnect from everything and end the program'''
+        if hasattr(self, 'printWorker') and hasattr(self.printWorker, 'stop'):
+            self.printWorker.stop()
+        if hasattr(self, 'fluBox'):
+            self.fluBox.close()
+        if hasattr(self, 'camBoxes'):
+            self.camBoxes.close()
+        if hasattr(self, 'tableWriter'):
+            self.tableWriter.close()
+        self.arduino.release()
+        for fn,r in self.results:
+            logging.info(f'{r}: {fn}')
+        QCoreApplication.quit()
+
+
+#----------------------------------------------------------------------
+
+def parseArgs(argv:List[str]) -> argparse.Namespace:
+    '''read the command line arguments'''
+    parser = argparse.ArgumentParser(description='Run sbp files without the GUI window, using the settings in the config file')
+    parser.add_argument('files', nargs='+', help='sbp files, lists of files ending in List.txt, or BREAK to stop the queue. with --recover, time table csv files')
+    parser.add_argument('-o', '--folder', default=cfg.files.save, help='folder to save files in')
+    parser.add_argument('-p', '--pressure', action='append', default=[], metavar='CHANNEL=PRESSURE', help='pressure to use during the print for a 0-indexed channel, in the fluigent units in the config file')
+    parser.add_argument('--autoplay', action=argparse.BooleanOptionalAction, default=True, help='run the whole queue, instead of one file')
+    parser.add_argument('--wait', type=float, default=3, help='time to wait between files in s')
+    parser.add_argument('--simulate', action='store_true', help='run on the simulated shopbot')
+    parser.add_argument('--speed', type=float, default=cfg.shopbot.simulate.speed, help='speed of the simulated shopbot, relative to real time')
+    parser.add_argument('--process', action='store_true', help='track the print in its own process')
+    parser.add_argument('--no-fluigent', dest='fluigent', action='store_false', help='do not connect to the fluigent')
+    parser.add_argument('--simulate-fluigent', action='store_true', help='run on the simulated fluigent')
+    parser.add_argument('--cameras', action='store_true', help='connect to the cameras in the config file')
+    parser.add_argument('--diag', type=int, default=cfg.shopbot.diag, help='log level for the print loop, 0-3')
+    parser.add_argument('--recover', action='store_true', help='instead of printing, clean up time tables that were being written when the program stopped')
+    return parser.parse_args(argv)
+
+
+def main(argv:List[str]=None) -> int:
+    '''run the files and return the exit code'''
+    args = parseArgs(sys.argv[1:] if argv is None else argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    if args.recover:
+        for fn in args.files:
+            logging.info(f'Recovered {recoverTimeTable(fn)} rows in {fn}')
+        return 0
+    if args.simulate:
+        cfg.shopbot.simulate.on = True
+    cfg.shopbot.simulate.speed = args.speed
+    if args.simulate_fluigent:
+        cfg.fluigent.simulate = {**simulatorSettings(), 'on':True}
+    if args.process:
+        cfg.shopbot.tick.process = True
+    cfg.shopbot.diag = args.diag
+    pressures = {}
+    for s in args.pressure:
+        chan, p = s.split('=')
+        pressures[int(chan)] = float(p)
+
+    if args.cameras:
+        # camera boxes are widgets, so they need a QApplication, but they do not need a screen
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+        app = QApplication(sys.argv[:1])
+    else:
+        app = QCoreApplication(sys.argv[:1])
+    runner = headlessRunner(args.files, args.folder, pressures, args.autoplay, args.wait, fluigent=args.fluigent, cameras=args.cameras)
+    QTimer.singleShot(0, runner.runFile)
+    app.exec_()
+    return runner.exitCode()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
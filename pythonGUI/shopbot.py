@@ -6,14 +6,12 @@ from PyQt5.QtCore import QRunnable, QThread, QThreadPool, QTimer
 from PyQt5.QtGui import QDoubleValidator, QIntValidator
 from PyQt5.QtWidgets import QFormLayout, QHBoxLayout, QMainWindow, QVBoxLayout, QWidget
 import os, sys
-import winreg
 import subprocess
 from typing import List, Dict, Tuple, Union, Any, TextIO
 import logging
 import csv
 import re
 import time
-import win32gui, win32api, win32con
 
 # local packages
 from config import cfg
@@ -21,6 +19,8 @@ from general import *
 from sbprint import *
 from flags import *
 from sbList import *
+from sbSimulator import *
+from sbprintProcess import *
 
 
 
@@ -100,9 +100,7 @@ class sbSettingsBox(QWidget):
         fileForm = QFormLayout()
         objValidator = QDoubleValidator(0, 10, 2)
         
-        self.runSimpleDict = {0:'Track points, flow speeds, and flags', 
-                                          2:'Track points, but only watch arduino for trustworthy flags (no early turn off/on)',
-                                          1:'Only track flags'}
+        self.runSimpleDict = runSimpleNames
         self.runSimple = fRadioGroup(layout, 'Pressure strategy', 
                                           self.runSimpleDict, 
                                           {0:0, 1:1, 2:2},
@@ -332,8 +330,12 @@ class sbBox(connectBox):
             self.connect()
    
     def connect(self):
-        '''connect to the SB3 software'''
-        self.keys = SBKeys(self.diag, self.arduino)
+        '''connect to the SB3 software, or to a simulated shopbot if simulate is on in the config file'''
+        if cfg.shopbot.simulate.on:
+            backend = sb3Simulator(speed=cfg.shopbot.simulate.speed)
+        else:
+            backend = None
+        self.keys = SBKeys(self.diag, self.arduino, backend)
         self.keys.signals.status.connect(self.updateStatus)   # connect key status to GUI
         self.keys.signals.flag.connect(self.updateFlag)       # connect flag status to GUI
         self.keys.signals.pos.connect(self.updateXYZ)         # connect position status to GUI
@@ -349,58 +351,20 @@ class sbBox(connectBox):
             
     def timeRow(self, runSimple:int) -> List:
         '''get a list of values to collect for the time table'''
-        if self.savePos:
-            if hasattr(self, 'x') and hasattr(self, 'y') and hasattr(self, 'z'):
-                out = [self.x, self.y, self.z]
-            else:
-                out = ['','','']
-            if not runSimple==1:
-                if hasattr(self, 'xe') and hasattr(self, 'ye') and hasattr(self, 'ze'):
-                    out = out+[self.xe, self.ye, self.ze]
-                else:
-                    out = out + ['','','']
-                if hasattr(self, 'xt') and hasattr(self, 'yt') and hasattr(self, 'zt'):
-                    out = out+[self.xt, self.yt, self.zt]
-                else:
-                    out = out + ['','','']
-                if hasattr(self, 'speed'):
-                    out = out + [self.speed]
-                else:
-                    out = out+ ['']
-        else:
-            out = []
-        if self.saveFlag:
-            if hasattr(self, 'sbFlag') and hasattr(self, 'lastRead') and hasattr(self, 'tline'):
-                out = out + [self.sbFlag, self.lastRead]
-                if not runSimple==1:
-                    out.append(self.tline)
-            else:
-                self.keys.lock()
-                out.append(self.keys.currentFlag)
-                out.append(self.keys.lastRead)
-                if not runSimple==1:
-                    out.append('')
-                self.keys.unlock()
-        out.append(self.trusted)
-        out.append(self.printStatus)
+        values = {s:getattr(self, s) for s in ['x', 'y', 'z', 'xe', 'ye', 'ze', 'xt', 'yt', 'zt', 'speed', 'sbFlag', 'lastRead', 'tline', 'trusted', 'printStatus'] if hasattr(self, s)}
+        if self.saveFlag and not all([hasattr(self, s) for s in ['sbFlag', 'lastRead', 'tline']]):
+            # no flag updates yet, so read the flag directly
+            self.keys.lock()
+            values['sbFlag'] = self.keys.currentFlag
+            values['lastRead'] = self.keys.lastRead
+            self.keys.unlock()
+            values.pop('tline', None)
         self.printStatus = ''
-        return out
-    
+        return sbTimeRow(values, self.savePos, self.saveFlag, runSimple)
+
     def timeHeader(self, runSimple:int) -> List:
         '''get a list of header values for the time table'''
-        if self.savePos:
-            out = ['x_disp(mm)', 'y_disp(mm)', 'z_disp(mm)']
-            if not runSimple==1:
-                out = out+ ['x_est(mm)', 'y_est(mm)', 'z_est(mm)', 'x_target(mm)', 'y_target(mm)', 'z_target(mm)', 'speed(mm/s)']
-        else:
-            out = []
-        if self.saveFlag:
-            out = out + ['flag', 'lastRead']
-            if not runSimple==1:
-                out.append('targetLine')
-        out.append('trusted')
-        out.append('status')
-        return out
+        return sbTimeHeader(self.savePos, self.saveFlag, runSimple)
  
     #-------------
     # communicating with the shopbot
@@ -408,12 +372,12 @@ class sbBox(connectBox):
     def getLoc(self) -> None:
         '''get the location'''
         self.keys.lock()
-        x = self.keys.getLoc()
+        p = self.keys.getLoc()
         self.keys.unlock()
-        if len(x)>0:
-            self.x = x[0]
-            self.y = x[1]
-            self.z = x[2]
+        if p.defined:
+            self.x = p.x
+            self.y = p.y
+            self.z = p.z
         
     def updateLoc(self) -> None:
         '''update the location in the status bar'''
@@ -548,18 +512,8 @@ class sbBox(connectBox):
        
     def writeToTable(self, writer) -> None:
         '''write metadata values to the table'''
-        sh = SBPHeader(self.sbpName()) 
-        t1 = sh.table()
-        for row in t1:
+        for row in printSettingsTable(self.sbpName(), self.runFlag1, self.pSettings(), self.units, self.checkFreq):
             writer.writerow(row)
-        writer.writerow(['run_flag1', '', self.runFlag1])
-        writer.writerow(['critTimeOn', self.critTimeOn['units'], self.critTimeOn['value']])
-        writer.writerow(['critTimeOff', self.critTimeOff['units'], self.critTimeOff['value']])
-        writer.writerow(['zeroDist', self.units, self.zeroDist])
-        writer.writerow(['checkFreq', self.checkFreq['units'], self.checkFreq['value']])
-        writer.writerow(['burstScale', '', self.burstScale])
-        writer.writerow(['burstLength', self.burstLength['units'], self.burstLength['value']])
-        writer.writerow(['tracking', self.runSimple, self.settingsBox.runSimpleDict[self.runSimple]])
 
     def testTime(self) -> None:
         '''create metadata file'''
@@ -665,9 +619,13 @@ class sbBox(connectBox):
                 logging.error('Shopbot box does not have attribute sbList')
             return ''
 
+    def pSettings(self) -> dict:
+        '''get the settings for the print loop'''
+        return {'critTimeOn':self.critTimeOn, 'zeroDist':self.zeroDist, 'critTimeOff':self.critTimeOff, 'burstScale':self.burstScale, 'burstLength':self.burstLength, 'runSimple':self.runSimple}
+
     def getCritFlag(self) -> int:
         '''Identify which channels are triggered during the run. critFlag is a shopbot flag value that indicates that the run is done. We always set this to 0. If you want the video to shut off after the first flow is done, set this to 2^(cfg.shopbot.flag-1). We run this function at the beginning of the run to determine what flag will trigger the start of videos, etc.'''
-        self.channels0Triggered = channelsTriggered(self.sbpName())
+        self.channels0Triggered = list(loadSBP(self.sbpName()).triggered)
         if not self.runFlag1-1 in self.channels0Triggered:
             # abort run: no signal to run this file
             self.updateStatus(f'Missing flag in sbp file: {self.runFlag1}', True)
@@ -732,8 +690,9 @@ class sbBox(connectBox):
     def runFileContinue(self) -> None:
         '''runFile sends a file to the shopbot and tells the GUI to wait for next steps. second, send the file over'''
         # check if the file exists
-        if not os.path.exists(self.sbpName()):
-            if self.sbpName()=='BREAK':
+        entry = queueEntry(self.sbpName())
+        if not entry=='run':
+            if entry=='break':
                 self.updateStatus('Break point hit.', True)
             else:
                 self.updateStatus(f'SBP file does not exist: {self.sbpName()}', True)
@@ -764,8 +723,12 @@ class sbBox(connectBox):
 
             
         self.stopPrintThread()  # stop any existing threads
-        pSettings = {'critTimeOn':self.critTimeOn, 'zeroDist':self.zeroDist, 'critTimeOff':self.critTimeOff, 'burstScale':self.burstScale, 'burstLength':self.burstLength, 'runSimple':self.runSimple}
-        self.printWorker = printLoop(self.settingsBox.getDt(), self.keys, self.sbpName(), pSettings, self.sbWin, self.runFlag1)   # create a worker to track the print
+        pSettings = self.pSettings()
+        if cfg.shopbot.tick.process:
+            # track the print in its own process, and pass actions back to this one
+            self.printWorker = printProcess(self.settingsBox.getDt(), self.keys, self.sbpName(), pSettings, self.sbWin, self.runFlag1)
+        else:
+            self.printWorker = printLoop(self.settingsBox.getDt(), self.keys, self.sbpName(), pSettings, self.sbWin, self.runFlag1)   # create a worker to track the print
         self.printWorker.signals.aborted.connect(self.triggerKill)
         self.printWorker.signals.finished.connect(self.triggerEndOfPrint)
         self.printWorker.signals.estimate.connect(self.updateXYZest)
@@ -790,10 +753,8 @@ class sbBox(connectBox):
         self.updateStatus(f'Running SBP file {name}', True)
         self.printStatus = 'Sending file'
         self.keys.lock()
-        appl = self.keys.sb3File
+        self.keys.sendFile(name)
         self.keys.unlock()
-        arg =  f'{name}, ,4, ,0,0,0"'
-        subprocess.Popen([appl, arg])
  
             
             
@@ -868,7 +829,7 @@ class sbBox(connectBox):
         self.printStatus = 'File completed'
         self.stopRunning()
         self.sbList.activateNext() # activate the next sbp file in the list
-        if self.autoPlay and self.sbList.sbpNumber()>0: # if we're in autoplay and we're not at the beginning of the list, play the next file
+        if playNext(self.autoPlay, self.sbList.sbpNumber()): # if we're in autoplay and we're not at the beginning of the list, play the next file
             self.updateStatus('Autoplay is on: Running next file.', True)
             QTimer.singleShot(3000, self.runFile) # wait 3 seconds, then call runFile
         else:
@@ -879,6 +840,8 @@ class sbBox(connectBox):
     
     def stopPrintThread(self):
         '''stop the print thread'''
+        if hasattr(self, 'printWorker') and not sip.isdeleted(self.printWorker) and hasattr(self.printWorker, 'stop'):
+            self.printWorker.stop()    # stop the tracking process
         for s in ['printThread']:
             if hasattr(self, s):
                 o = getattr(self, s)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+'''for comparing the per-tick cost of the distances update with the point type against the old dictionaries and lists'''
+
+# external packages
+import os, sys
+import time
+import datetime
+import numpy as np
+import pandas as pd
+
+# local packages
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(currentdir)
+sys.path.append(parentdir)
+from sbprintWatch import *
+
+##################################################
+
+
+def legacyToXYZ(p1, listOut:bool=False):
+    '''the old conversion from a dictionary, list, or series'''
+    if type(p1) is list and len(p1)==3:
+        x,y,z = p1
+    elif type(p1) is pd.Series or type(p1) is dict:
+        x = p1['x'] if 'x' in p1 else np.nan
+        y = p1['y'] if 'y' in p1 else np.nan
+        z = p1['z'] if 'z' in p1 else np.nan
+    else:
+        raise ValueError('Unknown type given to toXYZ')
+    return [x,y,z]
+
+def legacyDxdydz(p1, p2):
+    p1x, p1y, p1z = legacyToXYZ(p1)
+    p2x, p2y, p2z = legacyToXYZ(p2)
+    dx = 0 if pd.isna(p2x) or pd.isna(p1x) else float(p2x)-float(p1x)
+    dy = 0 if pd.isna(p2y) or pd.isna(p1y) else float(p2y)-float(p1y)
+    dz = 0 if pd.isna(p2z) or pd.isna(p1z) else float(p2z)-float(p1z)
+    return dx,dy,dz
+
+def legacyDist(p1, p2):
+    dx,dy,dz = legacyDxdydz(p1, p2)
+    return np.sqrt(dx**2+dy**2+dz**2)
+
+def legacyVec(p1, p2):
+    dx,dy,dz = legacyDxdydz(p1, p2)
+    dist = np.sqrt(dx**2+dy**2+dz**2)
+    if dist==0:
+        return [0,0,0]
+    return [dx/dist, dy/dist, dz/dist]
+
+
+class legacyDistances:
+    '''the old distances update, kept here for comparison'''
+
+    def __init__(self):
+        self.read = [-1000,-1000,-1000]
+        self.lastread = self.read
+
+    def updateTarget(self, last:dict, target:dict, nxt:dict) -> None:
+        self.last = last
+        self.target = target
+        self.next = nxt
+        self.targetVec = legacyVec(last, target)
+        self.nextVec = legacyVec(target, nxt)
+        self.tld = legacyDist(last, target)
+
+    def tick(self, read:list, pointTime:datetime.datetime, speed:float) -> None:
+        '''updateRead then calcEst'''
+        self.lastread = self.read
+        self.read = read
+        self.trd = legacyDist(self.read, self.target)
+        self.lrd = legacyDist(self.read, self.last)
+        dt = (datetime.datetime.now()-pointTime).total_seconds()
+        pt = legacyToXYZ(self.last)
+        self.estimate = [pt[i]+speed*dt*self.targetVec[i] for i in range(3)]
+        self.ted = legacyDist(self.estimate, self.target)
+        self.led = legacyDist(self.estimate, self.last)
+        self.vec = legacyVec(self.lastread, self.read)
+        dot = np.dot(self.vec, self.targetVec)
+        self.angle = 0 if dot<=0 else np.arccos(dot)
+
+
+def newTick(d:distances, read:xyzPoint, pointTime:float, speed:float) -> None:
+    '''updateRead then calcEst'''
+    d.updateRead(read)
+    d.calcEst(True, pointTime, speed, time.perf_counter())
+
+
+def measure(n:int=20000) -> None:
+    '''time n ticks of each update, with the target changing every 50 ticks'''
+    rng = np.random.default_rng(0)
+    pts = rng.normal(size=(n//50+3, 3))*10
+    reads = rng.normal(size=(n, 3))*10
+    pointTime = datetime.datetime.now()
+
+    d0 = legacyDistances()
+    readList = [list(r) for r in reads.tolist()]
+    t0 = time.perf_counter()
+    for i in range(n):
+        if i%50==0:
+            k = i//50
+            d0.updateTarget(*[{'x':p[0], 'y':p[1], 'z':p[2], 'line':k, 'speed':5} for p in pts[k:k+3].tolist()])
+        d0.tick(readList[i], pointTime, 5)
+    dt0 = time.perf_counter()-t0
+
+    d1 = distances(True)
+    t1 = time.perf_counter()
+    readPoints = [xyzPoint(*r) for r in reads.tolist()]
+    t0 = time.perf_counter()
+    for i in range(n):
+        if i%50==0:
+            k = i//50
+            d1.updateTarget(*[xyzPoint(*p, line=k, speed=5) for p in pts[k:k+3].tolist()])
+        newTick(d1, readPoints[i], t1, 5)
+    dt1 = time.perf_counter()-t0
+
+    print(f'{"ticks":>8s}\t{"dicts (us/tick)":>15s}\t{"points (us/tick)":>16s}\t{"speedup":>7s}')
+    print(f'{n:8d}\t{dt0/n*1e6:15.2f}\t{dt1/n*1e6:16.2f}\t{dt0/dt1:7.1f}')
+
+
+if __name__ == "__main__":
+    if len(sys.argv)>1:
+        measure(int(sys.argv[1]))
+    else:
+        measure()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+'''for measuring the pressure path on the simulated fluigent: how fast the channels can be read, how long setpoints take to reach the controller at different SDK latencies, and how many setpoints the burst logic sends during a print.
+usage: python fluigent_benchmark.py [seconds]'''
+
+# external packages
+import os, sys
+import time
+import tempfile
+import numpy as np
+
+# local packages
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(currentdir)
+sys.path.append(parentdir)
+from sbrun import *
+from fluThreads import *
+
+##################################################
+
+pSettings = {'critTimeOn':{'value':0, 'units':'s'}, 'zeroDist':0.1, 'critTimeOff':{'value':0, 'units':'s'}
+             , 'burstScale':2, 'burstLength':{'value':2, 'units':'mm'}, 'runSimple':0}
+
+
+class noArduino:
+    '''arduino that is not connected'''
+    pins = {}
+    connected = False
+    pinStates = 0
+
+    def readSB(self, sbFlag:int) -> int:
+        return sbFlag
+
+
+class benchWindow:
+    '''stands in for the GUI window, so the print loop can find the fluigent channels'''
+
+    def __init__(self, fluBox:headlessFluigent):
+        self.fluBox = fluBox
+
+
+def burstFile(folder:str, lines:int=4, length:float=10, flag1:int=5) -> str:
+    '''write an sbp file with lines that each turn on the flow flag, so each line starts with a burst'''
+    fn = os.path.join(folder, 'burst.sbp')
+    with open(fn, 'w') as f:
+        f.write('&runFlag1 = 4\nVD , , 1\nVU, 157.480315, 157.480315, -157.480315\nSA\nMS, 10, 10\nJS, 20, 20\n')
+        f.write('VR,10.06, 10.06, , , 10.06, 10.06, , , 5.08, 5.08, 100, 3.81, 65, , , 5.08\n')
+        f.write('SO, &runFlag1, 1\nJ3, 0, 0, -10\n')
+        for i in range(lines):
+            f.write(f'M2, {i}, 0\nSO, {flag1}, 1\nM2, {i}, {length}\nSO, {flag1}, 0\nJ3, {i}, {length}, -5\nJ3, {i+1}, 0, -10\n')
+        f.write('SO, &runFlag1, 0\n')
+    return fn
+
+
+def sampling(seconds:float, latency:float) -> dict:
+    '''read all channels as fast as possible'''
+    fb = fluSimulator(latency=latency)
+    fb.init()
+    reads = 0
+    last = {}
+    new = 0
+    t0 = time.perf_counter()
+    while time.perf_counter()-t0<seconds:
+        for chan in range(fb.channels):
+            p, ts = readPressure(fb, chan)
+            reads+=1
+            if not last.get(chan, -1)==ts:
+                new+=1
+                last[chan] = ts
+    t = time.perf_counter()-t0
+    return {'reads/s':reads/t, 'measurements/s':new/t}
+
+
+def commands(seconds:float, latency:float, rate:float=100) -> dict:
+    '''request setpoints on every channel at the rate of the print loop, like turnDown during a burst'''
+    fb = fluSimulator(latency=latency)
+    fb.init()
+    commander = fluCommander(fb)
+    commander.start()
+    t0 = time.perf_counter()
+    blocked = []
+    i = 0
+    while time.perf_counter()-t0<seconds:
+        tr = time.perf_counter()
+        for chan in range(fb.channels):
+            commander.request(chan, 100+i%100, 'mbar')
+        blocked.append(time.perf_counter()-tr)
+        i+=1
+        time.sleep(max(0, 1/rate-(time.perf_counter()-tr)))
+    commander.close()
+    return {**commander.stats(), 'request':np.mean(blocked)*1000}
+
+
+def burst(latency:float, lines:int=4) -> dict:
+    '''run a print on the simulated shopbot and fluigent, with burst pressure at the start of each line'''
+    cfg.fluigent.simulate = {**simulatorSettings(), 'on':True, 'latency':latency}
+    fluBox = headlessFluigent({0:200})
+    with tempfile.TemporaryDirectory() as folder:
+        fn = burstFile(folder, lines=lines, flag1=fluBox.pchannels[0].flag1)
+        fluBox.startRecording(os.path.join(folder, 'pressure.fpr'))
+        sim = sb3Simulator(speed=1)
+        keys = SBKeys(0, noArduino(), sim)
+        keys.runningSBP = True
+        keys.sendFile(fn)
+        pl = printLoop(10, keys, fn, pSettings, benchWindow(fluBox), 4)
+        pl.run()
+        pl.close()
+        fluBox.stopRecording()
+        meta, records = readPressureLog(os.path.join(folder, 'pressure.fpr'))
+    stats = fluBox.commander.stats()
+    fluBox.close()
+    t, p = deviceTimes(records, 0)
+    return {**stats, 'readings':len(t), 'peak':p.max() if len(p)>0 else 0}
+
+
+def measure(seconds:float=2) -> None:
+    '''measure each part of the pressure path at a range of SDK latencies'''
+    latencies = [0, 1, 5, 20]
+    print('Sampling')
+    print(f'{"latency (ms)":>12s}\t{"reads/s":>8s}\t{"measurements/s":>14s}')
+    for latency in latencies:
+        d = sampling(seconds, latency)
+        print(f'{latency:12.0f}\t{d["reads/s"]:8.0f}\t{d["measurements/s"]:14.0f}')
+    print('\nSetpoints at 100 Hz')
+    print(f'{"latency (ms)":>12s}\t{"requested":>9s}\t{"sent":>6s}\t{"coalesced":>9s}\t{"request (ms)":>12s}\t{"median (ms)":>11s}\t{"95% (ms)":>8s}\t{"max (ms)":>8s}')
+    for latency in latencies:
+        d = commands(seconds, latency)
+        print(f'{latency:12.0f}\t{d["requested"]:9d}\t{d["sent"]:6d}\t{d["coalesced"]:9d}\t{d["request"]:12.3f}\t{d["median"]:11.2f}\t{d["p95"]:8.2f}\t{d["max"]:8.2f}')
+    print('\nBurst during a print')
+    print(f'{"latency (ms)":>12s}\t{"requested":>9s}\t{"sent":>6s}\t{"coalesced":>9s}\t{"median (ms)":>11s}\t{"readings":>8s}\t{"peak (mbar)":>11s}')
+    for latency in [1, 20]:
+        d = burst(latency)
+        if not 'median' in d:
+            print(f'{latency:12.0f}\tno setpoints sent')
+            continue
+        print(f'{latency:12.0f}\t{d["requested"]:9d}\t{d["sent"]:6d}\t{d["coalesced"]:9d}\t{d["median"]:11.2f}\t{d["readings"]:8d}\t{d["peak"]:11.0f}')
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv)>1 else 2
+    measure(seconds)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+'''for comparing the per-step cost of reading the shopbot keys one at a time against reading a snapshot, using the memory backend'''
+
+# external packages
+import os, sys
+import time
+import numpy as np
+
+# local packages
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(currentdir)
+sys.path.append(parentdir)
+from flags import *
+
+##################################################
+
+
+class noArduino:
+    '''stand-in for the arduino that agrees with the shopbot flags'''
+
+    def readSB(self, sbFlag:int) -> int:
+        return sbFlag
+
+
+class legacyKeys(SBKeys):
+    '''finds the key folder for every read by searching the lists of values, as SBKeys used to'''
+
+    def getKeyFolder(self, value:str):
+        for key,val in self.keyFolderDict().items():
+            if value in val:
+                return self.folderHandles[key]
+        raise ValueError(f'Unexpected key requested: {value}')
+
+
+def legacyStep(keys:SBKeys) -> None:
+    '''read the keys the way the print loop used to: check for stop, then read the flag, location, and last line'''
+    keys.lock()
+    keys.checkStop()
+    keys.unlock()
+    keys.lock()
+    keys.getSBFlag()
+    keys.getLoc()
+    keys.getLastRead()
+    keys.unlock()
+
+
+def snapshotStep(keys:SBKeys) -> None:
+    '''read the keys in one pass'''
+    keys.snapshot()
+
+
+def measure(n:int=20000) -> None:
+    '''time n steps of each way of reading the keys'''
+    backend = memoryBackend(Status='1', OutPutSwitches='8')
+    out = []
+    for c,step in [[legacyKeys, legacyStep], [SBKeys, snapshotStep]]:
+        keys = c(0, noArduino(), backend)
+        keys.runningSBP = True
+        t0 = time.perf_counter()
+        for i in range(n):
+            backend.set(Loc_1=str(i*0.01), LAstRead=str(i//10))
+            step(keys)
+        out.append(time.perf_counter()-t0)
+    dt0, dt1 = out
+    print(f'{"steps":>8s}\t{"per key (us/step)":>17s}\t{"snapshot (us/step)":>18s}\t{"speedup":>7s}')
+    print(f'{n:8d}\t{dt0/n*1e6:17.2f}\t{dt1/n*1e6:18.2f}\t{dt0/dt1:7.1f}')
+
+
+if __name__ == "__main__":
+    if len(sys.argv)>1:
+        measure(int(sys.argv[1]))
+    else:
+        measure()
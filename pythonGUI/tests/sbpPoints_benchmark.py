@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+'''for comparing the build time and peak memory of the columnar point table against the old list of dicts -> DataFrame -> csv path'''
+
+# external packages
+import os, sys
+import re
+import time
+import tracemalloc
+import tempfile
+import numpy as np
+import pandas as pd
+
+# local packages
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(currentdir)
+sys.path.append(parentdir)
+from sbpRead import *
+
+##################################################
+
+
+def makeLattice(fn:str, layers:int=10, rows:int=100, cols:int=100) -> None:
+    '''write a synthetic lattice print to fn, in the style of the files from sbpcreator'''
+    with open(fn, mode='w') as f:
+        f.write('&spacing = 0.500\n&zstep = 0.200\n&runFlag1 = 4.000\n&flowFlag1 = 5.000\n')
+        f.write('VD , , 1\nVU, 157.480315, 157.480315, -157.480315\nSA\nMS, 10, 10\nJS, 20, 20\n')
+        f.write('VR,10.06, 10.06, , , 10.06, 10.06, , , 5.08, 5.08, 100, 3.81, 65, , , 5.08\n')
+        f.write('SO, &runFlag1, 1\n')
+        for k in range(layers):
+            f.write(f'J3, 0, 0, -10+{k}*&zstep\n')
+            f.write(f'\'ink_speed_4={5+k%3}\n')
+            for i in range(rows):
+                f.write(f'M2, {i}*&spacing, 0\n')
+                f.write('SO, &flowFlag1, 1\n')
+                for j in range(1,cols):
+                    f.write(f'M2, {i}*&spacing, {j}*&spacing\n')
+                f.write('SO, &flowFlag1, 0\n')
+                f.write(f'J3, {i}*&spacing, 0, -5+{k}*&zstep\n')
+        f.write('SO, &runFlag1, 0\n')
+
+
+class legacyPoints:
+    '''the old list of dictionaries point builder, kept here for comparison'''
+
+    def __init__(self, file:str):
+        self.header = SBPHeader(file)
+        self.line = 0
+        self.ms = self.header.speed_move_xy
+        self.js = self.header.speed_jog_xy
+        self.file = file
+        self.channels = channelsTriggered(file)
+        self.cp = ['','','']
+        self.points = [{'x':'', 'y':'', 'z':'', 'line':self.header.hrows}]
+        self.pressures = dict([[i,0] for i in self.channels])
+        for channel in self.channels:
+            self.points[0][f'p{channel}_before'] = 0
+            self.points[0][f'p{channel}_after'] = 0
+        self.points[0]['speed'] = 0
+        with open(self.file, mode='r') as f:
+            for i in range(self.header.hrows):
+                self.line+=1
+                l = f.readline()
+            while len(l)>0:
+                self.readLine(l)
+                self.lastLine = l
+                self.line+=1
+                l = f.readline()
+
+    def floatSC(self, vi):
+        return floatSC(vi, self.header.vardefs)
+
+    def addPoint(self, command:str) -> None:
+        p1 = {'line':self.line, 'x':self.cp[0], 'y':self.cp[1], 'z':self.cp[2]}
+        for c in self.channels:
+            for s in ['before', 'after']:
+                p1[f'p{c}_{s}'] = self.pressures[c]
+        if command.startswith('M'):
+            p1['speed'] = self.ms
+        elif command.startswith('J'):
+            p1['speed'] = self.js
+        else:
+            p1['speed'] = 0
+        self.points.append(p1)
+
+    def readLineSO(self, spl:list) -> None:
+        if hasattr(self, 'lastLine') and self.lastLine.startswith('SO'):
+            self.addPoint('')
+        channel = int(self.floatSC(spl[1]))-1
+        self.pressures[channel] = spl[2]
+        i = -1
+        plast = self.points[i]
+        while (not f'p{channel}_after' in plast or plast[f'p{channel}_before']<0) and i>-len(self.points):
+            i = i-1
+            plast = self.points[i]
+        if f'p{channel}_after' in plast and plast[f'p{channel}_after'] in [0,1]:
+            self.points[i][f'p{channel}_after'] = self.pressures[channel]
+
+    def readLine(self, l:str) -> None:
+        spl = splitStrip(l)
+        if spl[0]=='SO':
+            self.readLineSO(spl)
+        elif spl[0][0] in ['M', 'J']:
+            if spl[0][1] in ['X', 'Y', 'Z']:
+                self.cp[{'X':0, 'Y':1, 'Z':2}[spl[0][1]]]=self.floatSC(spl[1])
+            elif spl[0][1] in ['2', '3']:
+                for i in range(int(spl[0][1])):
+                    self.cp[i] = self.floatSC(spl[i+1])
+            self.addPoint(spl[0])
+        elif spl[0].startswith('PAUSE'):
+            self.addPoint('PAUSE')
+        elif spl[0].startswith('\'ink_speed'):
+            spl = re.split('=', spl[0])
+            self.points.append({'line':self.line, f'p{spl[0][-1]}_before':-1000, f'p{spl[0][-1]}_after':float(spl[1])})
+
+
+def legacyBuild(sbpfile:str) -> pd.DataFrame:
+    '''build the list of dicts, export it to csv, and read it back in, as pointWatch used to'''
+    csvfile = sbpfile.replace('.sbp', '.csv')
+    pd.DataFrame(legacyPoints(sbpfile).points).to_csv(csvfile)
+    return pd.read_csv(csvfile, index_col=0)
+
+
+def tableBuild(sbpfile:str) -> pointTable:
+    '''build the columnar point table'''
+    return SBPPoints(sbpfile).points
+
+
+def measure(func, sbpfile:str) -> Tuple[float, float, Any]:
+    '''get the time in s and peak traced memory in MB to run func on the file'''
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = func(sbpfile)
+    dt = time.perf_counter()-t0
+    peak = tracemalloc.get_traced_memory()[1]/2**20
+    tracemalloc.stop()
+    return dt, peak, out
+
+
+if __name__ == "__main__":
+    sizes = [(2, 20, 50), (5, 50, 100), (10, 100, 100)]
+    if len(sys.argv)>1:
+        sizes = sizes[:int(sys.argv[1])]
+    with tempfile.TemporaryDirectory() as folder:
+        print(f'{"moves":>8s}\t{"dicts (s)":>10s}\t{"dicts (MB)":>10s}\t{"table (s)":>10s}\t{"table (MB)":>10s}\t{"table size (MB)":>15s}')
+        for layers, rows, cols in sizes:
+            fn = os.path.join(folder, f'lattice_{layers}_{rows}_{cols}.sbp')
+            makeLattice(fn, layers, rows, cols)
+            dt0, peak0, df = measure(legacyBuild, fn)
+            dt1, peak1, table = measure(tableBuild, fn)
+            if not len(df)==len(table):
+                raise ValueError(f'Tables do not match: {len(df)} rows vs {len(table)} rows')
+            print(f'{len(table):8d}\t{dt0:10.2f}\t{peak0:10.1f}\t{dt1:10.2f}\t{peak1:10.1f}\t{table.nbytes/2**20:15.2f}')
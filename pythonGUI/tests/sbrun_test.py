@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+'''for checking that the command line runner can run a queue of real sample files on the simulated shopbot and fluigent, all the way from waitForReady and waitForStart to the saved files.
+Runs sbrun in its own process with the simulated clock at speed 0, and fails if the queue hangs, a file does not finish, or a time table or pressure log is missing or empty.
+usage: python sbrun_test.py [timeout in s]'''
+
+# external packages
+import os, sys
+import subprocess
+import tempfile
+import glob
+
+# local packages
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(currentdir)
+sys.path.append(parentdir)
+sampleFolder = os.path.join(os.path.dirname(parentdir), 'SBP_files', 'singleDisturb')
+from fluThreads import readPressureLog
+
+##################################################
+
+sampleFiles = ['disturbHoriz3_1_0.500.sbp', 'disturbHoriz3_2_0.500.sbp']
+
+
+def runQueue(files:list, folder:str, timeout:float) -> subprocess.CompletedProcess:
+    '''run the files through sbrun on the simulated devices as fast as the computer can step through them'''
+    cmd = [sys.executable, os.path.join(parentdir, 'sbrun.py'), '--simulate', '--speed', '0', '--simulate-fluigent'
+           , '-p', '0=200', '-o', folder, '--wait', '0', '--diag', '0']+files
+    return subprocess.run(cmd, capture_output=True, text=True, timeout=timeout, cwd=parentdir)
+
+
+def checkOutputs(folder:str, sbpfile:str) -> None:
+    '''check that the print wrote a time table with rows and a pressure log with readings'''
+    base = os.path.splitext(os.path.basename(sbpfile))[0]
+    tables = [fn for fn in glob.glob(os.path.join(folder, '**', f'{base}*_time_*.csv'), recursive=True) if not fn.endswith('_diag.csv')]
+    logs = glob.glob(os.path.join(folder, '**', f'{base}*_pressure_*.fpr'), recursive=True)
+    assert len(tables)==1, f'{base}: expected 1 time table, found {len(tables)}'
+    assert len(logs)==1, f'{base}: expected 1 pressure log, found {len(logs)}'
+    with open(tables[0], mode='r', encoding='utf-8') as f:
+        rows = len(f.readlines())-1
+    assert rows>0, f'{base}: time table has no rows'
+    meta, records = readPressureLog(logs[0])
+    assert len(records)>0, f'{base}: pressure log has no readings'
+    print(f'{base}: {rows} time table rows, {len(records)} pressure readings')
+
+
+def testQueue(timeout:float) -> None:
+    '''run two files in autoplay, then a list with a break point, which should stop the queue before the last file'''
+    files = [os.path.join(sampleFolder, fn) for fn in sampleFiles]
+    with tempfile.TemporaryDirectory() as folder:
+        out = runQueue(files, folder, timeout)
+        assert out.returncode==0, f'sbrun exited with {out.returncode}\n{out.stderr[-2000:]}'
+        for fn in files:
+            assert f'finished: {fn}' in out.stderr, f'{fn} did not finish\n{out.stderr[-2000:]}'
+            checkOutputs(folder, fn)
+    with tempfile.TemporaryDirectory() as folder:
+        listfile = os.path.join(folder, 'queueList.txt')
+        with open(listfile, mode='w') as f:
+            f.write('\n'.join([files[0], 'BREAK', files[1]]))
+        out = runQueue([listfile], folder, timeout)
+        assert out.returncode==0, f'sbrun exited with {out.returncode}\n{out.stderr[-2000:]}'
+        assert f'finished: {files[0]}' in out.stderr, f'{files[0]} did not finish\n{out.stderr[-2000:]}'
+        assert 'break: BREAK' in out.stderr, 'queue did not stop at the break point'
+        assert not f'finished: {files[1]}' in out.stderr, 'queue ran past the break point'
+    print('sbrun queue finished')
+
+
+if __name__ == "__main__":
+    timeout = float(sys.argv[1]) if len(sys.argv)>1 else 120
+    testQueue(timeout)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+'''for replaying recorded prints with different tracking settings and comparing when the channels turn on and off against the recorded settings.
+usage: python telemetry_sweep.py folder_or_file [folder_or_file ...]'''
+
+# external packages
+import os, sys
+import copy
+import glob
+import itertools
+import multiprocessing
+import numpy as np
+
+# local packages
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(currentdir)
+sys.path.append(parentdir)
+from sbReplay import *
+
+##################################################
+
+# settings to vary. each variant changes one setting from the recorded settings
+variants = {'zeroDist':[0.05, 0.2, 0.5]
+            , 'critTimeOn':[0, 0.1, 0.3]
+            , 'critTimeOff':[0, 0.1, 0.3]
+            , 'burstScale':[1, 2]
+            , 'runSimple':[0, 1, 2]}
+
+
+def setValue(pSettings:dict, key:str, val:float) -> dict:
+    '''get a copy of the print settings with one value changed'''
+    p = copy.deepcopy(pSettings)
+    if key in p and type(p[key]) is dict:
+        p[key]['value'] = val
+    else:
+        p[key] = val
+    return p
+
+
+def compareEvents(base:list, events:list) -> dict:
+    '''match the nth on and nth off of each flag between the baseline and the variant. return the shifts in time in s'''
+    shifts = {True:[], False:[]}
+    missing = 0
+    for flag0 in set([e[1] for e in base]+[e[1] for e in events]):
+        for on in [True, False]:
+            b = [e[0] for e in base if e[1]==flag0 and e[2]==on]
+            v = [e[0] for e in events if e[1]==flag0 and e[2]==on]
+            n = min(len(b), len(v))
+            shifts[on] = shifts[on] + [v[i]-b[i] for i in range(n)]
+            missing = missing + abs(len(b)-len(v))
+    return {'on':shifts[True], 'off':shifts[False], 'missing':missing}
+
+
+def runVariant(args:tuple) -> Tuple[str, str, Any, dict]:
+    '''replay one file with one variant of the settings'''
+    fn, key, val = args
+    meta, _ = readTelemetry(fn)
+    if key=='':
+        p = meta['pSettings']
+    else:
+        p = setValue(meta['pSettings'], key, val)
+    try:
+        out = replayTelemetry(fn, pSettings=p)
+    except Exception as e:
+        out = {'result':f'error: {e}', 'events':[]}
+    return fn, key, val, out
+
+
+def sweep(files:List[str], processes:int=0) -> None:
+    '''replay every file with every variant and print a table of the mean and max change in on and off times'''
+    jobs = [(fn, '', None) for fn in files]
+    for fn in files:
+        for key,vals in variants.items():
+            for val in vals:
+                jobs.append((fn, key, val))
+    if processes<=0:
+        processes = max(1, multiprocessing.cpu_count()-1)
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(runVariant, jobs)
+
+    base = dict([[fn, out] for fn,key,val,out in results if key==''])
+    rows = {}
+    for fn,key,val,out in results:
+        if key=='':
+            continue
+        c = compareEvents(base[fn]['events'], out['events'])
+        r = rows.setdefault((key, val), {'on':[], 'off':[], 'missing':0, 'aborted':0})
+        r['on'] = r['on']+c['on']
+        r['off'] = r['off']+c['off']
+        r['missing'] = r['missing']+c['missing']
+        if not out['result']==base[fn]['result']:
+            r['aborted']+=1
+
+    print(f'{len(files)} files, baseline {sum([len(b["events"]) for b in base.values()])} on/off events')
+    print(f'{"setting":>12s}\t{"value":>6s}\t{"on mean (ms)":>12s}\t{"on max (ms)":>11s}\t{"off mean (ms)":>13s}\t{"off max (ms)":>12s}\t{"missing":>7s}\t{"ended diff":>10s}')
+    for (key,val),r in rows.items():
+        s = f'{key:>12s}\t{val:6.2f}'
+        for on in ['on', 'off']:
+            d = np.array(r[on])*1000
+            w = 12 if on=='on' else 13
+            if len(d)>0:
+                s = s + f'\t{d.mean():{w}.1f}\t{np.abs(d).max():{w-1}.1f}'
+            else:
+                s = s + f'\t{"":>{w}s}\t{"":>{w-1}s}'
+        s = s + f'\t{r["missing"]:7d}\t{r["aborted"]:10d}'
+        print(s)
+
+
+def findFiles(args:List[str]) -> List[str]:
+    '''get the telemetry files from a list of files and folders'''
+    files = []
+    for a in args:
+        if os.path.isdir(a):
+            files = files + sorted(glob.glob(os.path.join(a, '*.sbtlm')))
+        else:
+            files.append(a)
+    return files
+
+
+if __name__ == "__main__":
+    if len(sys.argv)>1:
+        sweep(findFiles(sys.argv[1:]))
+    else:
+        sweep(findFiles([telemetryFolder(cfg.shopbot.telemetry.folder)]))
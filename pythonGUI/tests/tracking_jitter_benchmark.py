@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+'''for comparing the tick jitter of the print loop in a thread of the GUI process against the print loop in its own process, with and without camera previews loading the GUI process.
+The shopbot is simulated in real time, and each preview converts frames at 30 fps the way camObj.updatePrevWindow does.
+usage: python tracking_jitter_benchmark.py [seconds] [sbp file]'''
+
+# external packages
+import os, sys
+import time
+import threading
+import numpy as np
+from PyQt5.QtGui import QImage
+
+# local packages
+currentdir = os.path.dirname(os.path.realpath(__file__))
+parentdir = os.path.dirname(currentdir)
+sys.path.append(currentdir)
+sys.path.append(parentdir)
+defaultFile = os.path.join(os.path.dirname(parentdir), 'SBP_files', 'singleDisturb', 'disturbHoriz3_1_0.500.sbp')
+from sbprintProcess import *
+
+##################################################
+
+pSettings = {'critTimeOn':{'value':0, 'units':'s'}, 'zeroDist':0.1, 'critTimeOff':{'value':0, 'units':'s'}
+             , 'burstScale':1, 'burstLength':{'value':0, 'units':'mm'}, 'runSimple':0}
+
+
+class noArduino:
+    '''arduino that is not connected'''
+    pins = {}
+    connected = False
+    pinStates = 0
+
+    def readSB(self, sbFlag:int) -> int:
+        return sbFlag
+
+
+class preview(threading.Thread):
+    '''converts a 1280x1024 frame to a display image at 30 fps, like a camera preview'''
+
+    def __init__(self, stop:threading.Event, fps:float=30):
+        super(preview, self).__init__(daemon=True)
+        self.stop = stop
+        self.fps = fps
+        self.frame = np.random.default_rng(0).integers(0, 255, size=(1024, 1280, 3), dtype=np.uint8)
+
+    def run(self) -> None:
+        while not self.stop.is_set():
+            t0 = time.perf_counter()
+            frame2 = np.ascontiguousarray(self.frame[:,:,::-1])    # BGR to RGB
+            image = QImage(frame2, frame2.shape[1], frame2.shape[0], QImage.Format_RGB888)
+            image = image.scaled(640, 512)
+            rows = [int(r.mean()) for r in frame2[::8, ::8, 0]]     # python work on the frame, like overlays and status text
+            time.sleep(max(0, 1/self.fps-(time.perf_counter()-t0)))
+
+
+def runThread(fn:str, seconds:float, dt:float) -> dict:
+    '''run the print loop in a thread of this process, and stop the simulated machine after seconds'''
+    sim = sb3Simulator(speed=1)
+    keys = SBKeys(0, noArduino(), sim)
+    keys.runningSBP = True
+    keys.sendFile(fn)
+    pl = printLoop(dt, keys, fn, pSettings, None, 4)
+    timer = threading.Timer(seconds, sim.stop)
+    timer.start()
+    pl.run()
+    timer.cancel()
+    return pl.scheduler.stats()
+
+
+def runProcess(fn:str, seconds:float, dt:float) -> dict:
+    '''run the print loop in its own process, and ask it to stop after seconds. The tracking process follows the simulated run started here'''
+    sim = sb3Simulator(speed=1)
+    keys = SBKeys(0, noArduino(), sim)
+    keys.runningSBP = True
+    keys.sendFile(fn)
+    pp = printProcess(dt, keys, fn, pSettings, None, 4)
+    watcher = threading.Thread(target=stopAfterStart, args=(pp, seconds), daemon=True)
+    watcher.start()
+    pp.run()
+    return pp.stats
+
+
+def stopAfterStart(pp:printProcess, seconds:float) -> None:
+    '''stop the tracking process seconds after it publishes its first step, so the time to start the process is not counted. Give up if the process ends first'''
+    while True:
+        r = pp.state.read()
+        if r is not None and r['ticks']>0:
+            break
+        if pp.process is not None and not pp.process.is_alive():
+            return
+        time.sleep(0.01)
+    time.sleep(seconds)
+    pp.stop()
+
+
+def measure(seconds:float=10, fn:str=defaultFile, dt:float=10, previews:int=3) -> None:
+    '''measure the tick period statistics for each combination of loop location and previews'''
+    print(f'{"loop":>8s}\t{"previews":>8s}\t{"ticks":>6s}\t{"mean (ms)":>9s}\t{"jitter (ms)":>11s}\t{"max late (ms)":>13s}\t{"overruns":>8s}')
+    for mode,func in [['thread', runThread], ['process', runProcess]]:
+        for n in [0, previews]:
+            stop = threading.Event()
+            threads = [preview(stop) for i in range(n)]
+            for th in threads:
+                th.start()
+            d = func(fn, seconds, dt)
+            stop.set()
+            for th in threads:
+                th.join()
+            if len(d)==0:
+                print(f'{mode:>8s}\t{n:8d}\tno statistics')
+                continue
+            print(f'{mode:>8s}\t{n:8d}\t{d["ticks"]:6d}\t{d["meanPeriod"]:9.2f}\t{d["jitter"]:11.2f}\t{d["maxLate"]:13.2f}\t{d["overruns"]:8d}')
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv)>1 else 10
+    fn = sys.argv[2] if len(sys.argv)>2 else defaultFile
+    measure(seconds, fn)